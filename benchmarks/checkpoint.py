@@ -0,0 +1,79 @@
+'''
+File: checkpoint.py
+
+Measures the overhead of checkpointing the persistent homology
+reduction: the same complex is reduced without checkpoints, and with
+checkpoints written at a range of intervals.
+
+    python benchmarks/checkpoint.py --points 120 --epsilon .5
+'''
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import persispy.persistent_homology as pph
+import persispy.weighted_simplicial_complex as wsc
+from persispy.point_cloud import PointCloud
+
+
+def sphere_complex(num_points, epsilon, seed=0):
+    '''
+    The Vietoris-Rips complex of random points on the 2-sphere.
+    '''
+    points = np.random.RandomState(seed).normal(size=(num_points, 3))
+    points /= np.linalg.norm(points, axis=1)[:, None]
+    graph = PointCloud(points).neighborhood_graph(epsilon, 'exact')
+    cliques = wsc.sorted_clique_list(graph)._cliques
+    return wsc.wSimplicialComplex.from_clique_list(graph, cliques)
+
+
+def time_reduction(wscomplex, dimension, repeat, **kwargs):
+    '''
+    Returns the best of repeat timings, and the object of the last run.
+    '''
+    best = np.inf
+    for _ in range(repeat):
+        start = time.time()
+        ph = pph.PersistentHomology(wscomplex, dimension, **kwargs)
+        best = min(best, time.time() - start)
+    return best, ph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--points', type=int, default=120)
+    parser.add_argument('--epsilon', type=float, default=.5)
+    parser.add_argument('--dimension', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--intervals', type=float, nargs='+',
+                        default=[60, 1, .1, 0])
+    args = parser.parse_args()
+
+    wscomplex = sphere_complex(args.points, args.epsilon)
+    baseline, ph = time_reduction(wscomplex, args.dimension, args.repeat)
+    print('%d simplices, no checkpoints: %.3fs'
+          % (len(ph.simplex_containers), baseline))
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'reduction.ckpt')
+        for interval in args.intervals:
+            seconds, _ = time_reduction(wscomplex, args.dimension,
+                                        args.repeat, checkpoint=path,
+                                        checkpoint_interval=interval)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            print('interval %gs: %.3fs (%+.1f%%), checkpoint of %d bytes'
+                  % (interval, seconds, 100 * (seconds / baseline - 1),
+                     size))
+            if os.path.exists(path):
+                os.remove(path)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
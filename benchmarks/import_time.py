@@ -0,0 +1,67 @@
+'''
+File: import_time.py
+
+Times importing persispy and its numerical submodules in fresh
+interpreters, and checks that this does not import the plotting or phcpy
+dependencies. Exits with status 1 if a heavy module was imported or the
+median time is over --max-seconds.
+
+    python benchmarks/import_time.py --repeat 10 --max-seconds 1
+'''
+
+import argparse
+import subprocess
+import sys
+
+MODULES = ['persispy',
+           'persispy.points',
+           'persispy.persistent_homology',
+           'persispy.distances',
+           'persispy.vectorization']
+
+# Modules that only persispy.plot and persispy.phc may import.
+HEAVY = ['matplotlib', 'tkinter', 'Tkinter', 'phcpy']
+
+SCRIPT = '''
+import sys, time
+start = time.time()
+import %s
+seconds = time.time() - start
+print(seconds)
+print(' '.join(name for name in %r if name in sys.modules))
+'''
+
+
+def time_import(module):
+    '''
+    Returns the seconds taken to import module in a new interpreter, and
+    the heavy modules it pulled in.
+    '''
+    output = subprocess.check_output(
+        [sys.executable, '-c', SCRIPT % (module, HEAVY)])
+    lines = output.decode().split('\n')
+    return float(lines[0]), lines[1].split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        runs = [time_import(module) for _ in range(args.repeat)]
+        seconds = sorted(run[0] for run in runs)[len(runs) // 2]
+        heavy = sorted(set(name for run in runs for name in run[1]))
+        print('%-32s %.3fs%s' % (module, seconds,
+                                 ', imports ' + ' '.join(heavy)
+                                 if heavy else ''))
+        if heavy or (args.max_seconds is not None and
+                     seconds > args.max_seconds):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
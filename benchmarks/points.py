@@ -0,0 +1,41 @@
+'''
+File: points.py
+
+Times the chunked parallel generation of a large point cloud for a range
+of worker counts, and checks that every run gives the same points.
+
+    python benchmarks/points.py --points 100000000 --workers 1 2 4 8
+'''
+
+import argparse
+import time
+
+import numpy as np
+
+from persispy.points import SAMPLERS, parallel_cloud
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--points', type=int, default=10 ** 7)
+    parser.add_argument('--shape', default='sphere', choices=sorted(SAMPLERS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=2 ** 20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    reference = None
+    for workers in args.workers:
+        start = time.time()
+        cloud = parallel_cloud(args.shape, args.points, seed=args.seed,
+                               workers=workers, chunk_size=args.chunk_size)
+        seconds = time.time() - start
+        points = cloud.get_array()
+        if reference is None:
+            reference = points
+        print('%d workers: %.2fs, identical: %s'
+              % (workers, seconds, np.array_equal(points, reference)))
+
+
+if __name__ == '__main__':
+    main()
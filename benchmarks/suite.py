@@ -0,0 +1,341 @@
+'''
+File: suite.py
+
+The benchmark suite of the persispy pipeline: point generation, the
+neighborhood_graph methods, connected components, clique enumeration,
+wSimplicialComplex.from_clique_list and PersistentHomology, over a grid
+of point counts, dimensions and epsilons. It also runs the parallel
+point generation of points.py and the checkpointed reduction of
+checkpoint.py. The small scale is a quick regression check; medium and
+large add more points and the slow 'subdivision 3' method.
+
+    python benchmarks/suite.py run --scale small --output results.json
+    python benchmarks/suite.py compare baseline.json results.json
+
+run writes the best of --repeat timings of every stage, with the sizes
+of its output and the metadata of the machine, to a JSON file. A stage
+is skipped for the larger point counts of a (dimension, epsilon) once
+it took more than --budget seconds, or once its input has more than
+--max-edges edges; the complex is only built if no maximal clique has
+more than --max-clique-size vertices, since every face of every clique
+is listed. compare matches the stages of two such files, prints the
+ratio of their timings, and exits with status 1 if one got slower by
+more than --threshold.
+'''
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import persispy
+import persispy.persistent_homology as pph
+import persispy.points as pp
+import persispy.weighted_simplicial_complex as wsc
+
+# The shapes sampled in every dimension.
+SHAPES = {2: 'circle', 3: 'sphere', 4: 'flat_torus'}
+
+# The methods of neighborhood_graph. 'subdivision 3' runs the quadratic
+# 'exact' search over the whole cloud at each of its eight leaves, so it
+# is left out of the quick small scale.
+METHODS = ['exact', 'subdivision', 'subdivision 3']
+
+# small is a quick regression check; its budget is the default --budget.
+SCALES = {'small': {'points': [300, 1000],
+                    'dimensions': [2, 3],
+                    'epsilons': [.01, .03],
+                    'methods': METHODS[:2],
+                    'budget': 2},
+          'medium': {'points': [1000, 10000, 100000],
+                     'dimensions': [2, 3, 4],
+                     'epsilons': [.01, .05, .1],
+                     'methods': METHODS,
+                     'budget': 30},
+          'large': {'points': [1000, 10000, 100000, 1000000],
+                    'dimensions': [2, 3, 4],
+                    'epsilons': [.01, .05, .1],
+                    'methods': METHODS,
+                    'budget': 30}}
+
+# The seconds between checkpoints of the checkpointed reduction; see
+# checkpoint.py for the overhead over a range of intervals.
+CHECKPOINT_INTERVAL = 1
+
+
+def machine():
+    '''
+    Returns a dict describing the machine, the software and the commit.
+    '''
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'node': platform.node(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'persispy': persispy.__version__,
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def best_of(repeat, budget, function, *args, **kwargs):
+    '''
+    Returns the least time of repeat calls, and the last result. Stops
+    repeating once a call took more than budget seconds.
+    '''
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+        if best > budget:
+            break
+    return best, result
+
+
+class Runner(object):
+    '''
+    Runs the stages and collects their records.
+    '''
+
+    def __init__(self, repeat, budget, max_edges, max_clique_size, workers):
+        self.repeat = repeat
+        self.budget = budget
+        self.max_edges = max_edges
+        self.max_clique_size = max_clique_size
+        self.workers = workers
+        self.records = []
+        # The (stage, dimension, epsilon) that went over the budget.
+        self._over = set()
+
+    def stage(self, name, key, function, *args, **kwargs):
+        '''
+        Times function on the sizes given by key = (points, dimension,
+        epsilon) unless a smaller size went over the budget. Returns its
+        result, or None if skipped.
+        '''
+        points, dimension, epsilon = key
+        record = {'stage': name, 'points': points,
+                  'dimension': dimension, 'epsilon': epsilon}
+        if (name, dimension, epsilon) in self._over:
+            record['skipped'] = 'over budget at fewer points'
+            self.records.append(record)
+            return None
+        seconds, result = best_of(self.repeat, self.budget, function,
+                                  *args, **kwargs)
+        record['seconds'] = seconds
+        record.update(self.counts(result))
+        self.records.append(record)
+        if seconds > self.budget:
+            self._over.add((name, dimension, epsilon))
+        print('%-32s n=%-8d d=%d eps=%-5g %9.4fs'
+              % (name, points, dimension, epsilon or 0, seconds))
+        return result
+
+    def skip(self, name, key, reason):
+        points, dimension, epsilon = key
+        self.records.append({'stage': name, 'points': points,
+                             'dimension': dimension, 'epsilon': epsilon,
+                             'skipped': reason})
+
+    @staticmethod
+    def counts(result):
+        '''
+        The sizes of the output of a stage.
+        '''
+        if isinstance(result, wsc.wGraph):
+            return {'edges': result.num_edges()}
+        if isinstance(result, wsc.sorted_clique_list):
+            return {'cliques': len(result._cliques)}
+        if isinstance(result, wsc.wSimplicialComplex):
+            return {'simplices': len(result.simplices())}
+        if isinstance(result, pph.PersistentHomology):
+            return {'pairs': len(result.persistence_pairs)}
+        if isinstance(result, list):
+            return {'components': len(result)}
+        return {}
+
+
+def run_pipeline(runner, scale):
+    '''
+    Runs every stage over the grid of the scale.
+    '''
+    grid = SCALES[scale]
+    for dimension in grid['dimensions']:
+        shape = SHAPES[dimension]
+        for points in grid['points']:
+            key = (points, dimension, None)
+            cloud = runner.stage('points', key, pp.parallel_cloud, shape,
+                                 points, seed=0)
+            if runner.workers > 1:
+                runner.stage('parallel_cloud %d workers' % runner.workers,
+                             key, pp.parallel_cloud, shape, points, seed=0,
+                             workers=runner.workers)
+            for epsilon in grid['epsilons']:
+                if cloud is None:
+                    for name in complex_stages(grid['methods']):
+                        runner.skip(name, (points, dimension, epsilon),
+                                    'no points')
+                    continue
+                run_complex(runner, cloud, grid['methods'],
+                            (points, dimension, epsilon))
+
+
+def complex_stages(methods):
+    '''
+    The names of the stages of run_complex.
+    '''
+    return ['neighborhood_graph ' + method for method in methods] + \
+        ['connected_components', 'sorted_clique_list', 'from_clique_list',
+         'PersistentHomology', 'PersistentHomology checkpointed']
+
+
+def run_complex(runner, cloud, methods, key):
+    '''
+    Runs the stages from the neighborhood graph on.
+    '''
+    epsilon = key[2]
+    graph = None
+    for method in methods:
+        result = runner.stage('neighborhood_graph ' + method, key,
+                              cloud.neighborhood_graph, epsilon, method)
+        if result is not None:
+            graph = result
+    if graph is None:
+        for name in complex_stages([])[1:]:
+            runner.skip(name, key, 'no graph')
+        return
+    runner.stage('connected_components', key, graph.connected_components)
+    later = complex_stages([])[1:]
+    if graph.num_edges() > runner.max_edges:
+        for name in later:
+            runner.skip(name, key, 'more than %d edges' % runner.max_edges)
+        return
+    cliques = runner.stage('sorted_clique_list', key,
+                           wsc.sorted_clique_list, graph)
+    if cliques is None:
+        return
+    largest = max([len(c) for c in cliques._cliques] or [0])
+    if largest > runner.max_clique_size:
+        for name in later[1:]:
+            runner.skip(name, key, 'a clique of %d vertices' % largest)
+        return
+    wscomplex = runner.stage('from_clique_list', key,
+                             wsc.wSimplicialComplex.from_clique_list, graph,
+                             cliques._cliques)
+    if wscomplex is None:
+        return
+    runner.stage('PersistentHomology', key, pph.PersistentHomology,
+                 wscomplex, 2)
+    directory = tempfile.mkdtemp()
+    try:
+        runner.stage('PersistentHomology checkpointed', key,
+                     pph.PersistentHomology, wscomplex, 2,
+                     checkpoint=os.path.join(directory, 'reduction.ckpt'),
+                     checkpoint_interval=CHECKPOINT_INTERVAL)
+    finally:
+        shutil.rmtree(directory)
+
+
+def run(args):
+    if args.budget is None:
+        args.budget = SCALES[args.scale]['budget']
+    runner = Runner(args.repeat, args.budget, args.max_edges,
+                    args.max_clique_size, args.workers)
+    run_pipeline(runner, args.scale)
+    with open(args.output, 'w') as stream:
+        json.dump({'metadata': machine(),
+                   'settings': {'scale': args.scale,
+                                'repeat': args.repeat,
+                                'budget': args.budget,
+                                'max_edges': args.max_edges,
+                                'max_clique_size': args.max_clique_size,
+                                'workers': args.workers},
+                   'results': runner.records}, stream, indent=1)
+    print('wrote ' + args.output)
+    return 0
+
+
+def compare(args):
+    '''
+    Prints the timings of the stages of two result files, and returns 1 if
+    one got slower by more than the threshold.
+    '''
+    results = []
+    for path in (args.baseline, args.results):
+        with open(path) as stream:
+            results.append(json.load(stream))
+    for field in ('node', 'platform', 'cpu_count', 'python', 'numpy'):
+        old = results[0]['metadata'].get(field)
+        new = results[1]['metadata'].get(field)
+        if old != new:
+            print('warning: %s differs: %s, %s' % (field, old, new))
+
+    def timings(data):
+        return dict(((r['stage'], r['points'], r['dimension'],
+                      r['epsilon']), r['seconds'])
+                    for r in data['results'] if 'seconds' in r)
+
+    old, new = timings(results[0]), timings(results[1])
+    regressions = 0
+    for key in sorted(set(old) & set(new), key=repr):
+        ratio = new[key] / old[key] if old[key] else np.inf
+        slower = ratio > 1 + args.threshold and \
+            new[key] - old[key] > args.min_seconds
+        regressions += slower
+        print('%-32s n=%-8d d=%d eps=%-5g %9.4fs %9.4fs %6.2fx%s'
+              % (key[0], key[1], key[2], key[3] or 0, old[key], new[key],
+                 ratio, '  REGRESSION' if slower else ''))
+    for key in sorted(set(old) ^ set(new), key=repr):
+        print('%-32s n=%-8d d=%d eps=%-5g only in %s'
+              % (key[0], key[1], key[2], key[3] or 0,
+                 'baseline' if key in old else 'results'))
+    print('%d regressions' % regressions)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    commands = parser.add_subparsers(dest='command')
+
+    runs = commands.add_parser('run', help='run the suite')
+    runs.add_argument('--scale', default='small', choices=sorted(SCALES))
+    runs.add_argument('--repeat', type=int, default=3)
+    runs.add_argument('--budget', type=float, default=None,
+                      help='seconds; 2 for small, 30 otherwise')
+    runs.add_argument('--max-edges', type=int, default=10 ** 6)
+    runs.add_argument('--max-clique-size', type=int, default=8)
+    runs.add_argument('--workers', type=int, default=1)
+    runs.add_argument('--output', default='benchmark.json')
+    runs.set_defaults(function=run)
+
+    compares = commands.add_parser('compare', help='compare two results')
+    compares.add_argument('baseline')
+    compares.add_argument('results')
+    compares.add_argument('--threshold', type=float, default=.1)
+    compares.add_argument('--min-seconds', type=float, default=.01)
+    compares.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.function(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,26 +1,78 @@
 # -*- coding: utf-8 -*-
+'''
+File: __init__.py
+
+The submodules of persispy, and the main classes and functions listed in
+_EXPORTS, are attributes of the package, but a submodule is only imported
+when one of them is first used. So importing persispy, or one numerical
+submodule, does not import matplotlib, Tk or phcpy; those are imported by
+persispy.plot and persispy.phc.
+
+>>> import persispy
+>>> persispy.PointCloud
+<class 'persispy.point_cloud.PointCloud'>
+'''
+
+import importlib
 
 __author__ = 'Benjamin Antieau'
 __email__ = 'benjamin.antieau@gmail.com'
 __version__ = '0.0.1'
 
-__all__ = []
+SUBMODULES = ('chunk_reduction',
+              'distances',
+              'hashing',
+              'implicit',
+              'persistence_diagram',
+              'persistent_homology',
+              'phc',
+              'plot',
+              'point_cloud',
+              'points',
+              'rng',
+              'stats',
+              'vectorization',
+              'weighted_simplicial_complex')
 
-import pkgutil
-import inspect
-try:
-    from matplotlib import use
-    use('TKAgg')
-except ImportError:
-    print("Matplotlib is not currently installed. Plot functions are unavailable.")
+# Names of the package, and the submodules defining them.
+_EXPORTS = {'HashPoint': 'hashing',
+            'HashEdge': 'hashing',
+            'Intersect': 'phc',
+            'PersistenceDiagram': 'persistence_diagram',
+            'PersistentHomology': 'persistent_homology',
+            'PointCloud': 'point_cloud',
+            'Polynomial': 'implicit',
+            'bottleneck': 'distances',
+            'pairwise_distances': 'distances',
+            'plot2d': 'plot',
+            'plot3d': 'plot',
+            'random_state': 'rng',
+            'wGraph': 'weighted_simplicial_complex',
+            'wRandomGraph': 'weighted_simplicial_complex',
+            'wSimplex': 'weighted_simplicial_complex',
+            'wSimplicialComplex': 'weighted_simplicial_complex',
+            'wasserstein': 'distances'}
 
+# Everything but the names that need matplotlib or phcpy.
+__all__ = sorted(name for name, module in _EXPORTS.items()
+                 if module not in ('phc', 'plot'))
 
-for loader, name, is_pkg in pkgutil.walk_packages('__path__'):
-    module = loader.find_module(name).load_module(name)
-
-    for name, value in inspect.getmembers(module):
-        if name.startswith('__'):
-            continue
 
+def __getattr__(name):
+    '''
+    Imports a submodule, or the submodule defining an exported name, on
+    first use.
+    '''
+    if name in SUBMODULES:
+        return importlib.import_module(__name__ + '.' + name)
+    if name in _EXPORTS:
+        module = importlib.import_module(__name__ + '.' + _EXPORTS[name])
+        value = getattr(module, name)
         globals()[name] = value
-        __all__.append(name)
+        return value
+    raise AttributeError('module ' + repr(__name__) + ' has no attribute ' +
+                         repr(name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES) | set(_EXPORTS))
@@ -0,0 +1,189 @@
+'''
+File: chunk_reduction.py
+
+Parallel reduction of the Z/2 boundary matrix in chunks, after Bauer,
+Kerber and Reininghaus, "Clear and compress: computing persistent
+homology in chunks".
+
+The columns of the filtration are split into contiguous chunks, each
+reduced by a worker process using only the columns of its own chunk. A
+column whose pivot stays inside its chunk is reduced exactly as the
+serial algorithm would reduce it: every column that could own that pivot
+lies in the same chunk, since a column comes after all of its faces. So
+the local phase finds genuine persistence pairs and genuine zero
+columns. The remaining columns, whose pivot crossed below the start of
+their chunk, are finished serially in a merging phase against all the
+pivots found so far. The pairs are the same as those of the serial
+reduction.
+
+The boundary matrix is passed in compressed sparse column form: the
+rows of column j are indices[indptr[j]:indptr[j + 1]]. With more than
+one worker these two arrays are placed in shared memory, so that they
+are not copied into every task.
+'''
+
+import multiprocessing
+
+import numpy as np
+
+from persispy.stats import current
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python2 and python3 before 3.8
+    shared_memory = None
+
+# The boundary matrix as seen by the current process.
+_MATRIX = {}
+
+
+def _attach(indptr, indices):
+    '''
+    Pool initializer. Arguments are either arrays, or (name, length)
+    pairs of shared memory blocks holding int64 arrays.
+    '''
+    for key, value in (('indptr', indptr), ('indices', indices)):
+        if isinstance(value, tuple):
+            block = shared_memory.SharedMemory(name=value[0])
+            _MATRIX[key + '_block'] = block
+            value = np.ndarray(value[1], dtype=np.int64, buffer=block.buf)
+        _MATRIX[key] = value
+
+
+def _reduce_chunk(bounds):
+    '''
+    Reduces the columns start..end-1 using only each other. Returns
+    (pivots, paired, unfinished, additions), where pivots maps the row of
+    every local pair to its column, paired maps those columns to their
+    reduced rows, and unfinished maps the columns whose pivot left the
+    chunk to their partially reduced rows. Columns that reduced to zero
+    are in none of them. additions is the number of column additions.
+    '''
+    start, end = bounds
+    indptr, indices = _MATRIX['indptr'], _MATRIX['indices']
+    pivots = dict()
+    columns = dict()
+    unfinished = dict()
+    additions = 0
+    for j in range(start, end):
+        column = set(indices[indptr[j]:indptr[j + 1]].tolist())
+        while column:
+            low = max(column)
+            if low < start or low not in pivots:
+                break
+            column ^= columns[pivots[low]]
+            additions += 1
+        if not column:
+            continue
+        low = max(column)
+        if low >= start:
+            pivots[low] = j
+            columns[j] = column
+        else:
+            unfinished[j] = column
+    paired = {j: sorted(column) for j, column in columns.items()}
+    unfinished = {j: sorted(column) for j, column in unfinished.items()}
+    return pivots, paired, unfinished, additions
+
+
+def chunk_bounds(indptr, num_chunks):
+    '''
+    Splits the columns into at most num_chunks contiguous ranges with
+    about the same number of nonzero entries.
+
+    >>> chunk_bounds(np.array([0, 0, 0, 2, 4, 6, 9]), 2)
+    [(0, 5), (5, 6)]
+    '''
+    num_columns = len(indptr) - 1
+    targets = np.linspace(0, indptr[-1], num_chunks + 1)[1:-1]
+    cuts = np.searchsorted(indptr, targets, side='right')
+    cuts = np.unique(np.concatenate(([0], cuts, [num_columns])))
+    return [(int(a), int(b)) for a, b in zip(cuts[:-1], cuts[1:]) if a < b]
+
+
+def _shared_copy(array, blocks):
+    '''
+    Copies an int64 array into a new shared memory block.
+    '''
+    block = shared_memory.SharedMemory(create=True,
+                                       size=max(array.nbytes, 1))
+    blocks.append(block)
+    np.ndarray(len(array), dtype=np.int64, buffer=block.buf)[:] = array
+    return block.name, len(array)
+
+
+def reduce_in_chunks(indptr, indices, workers=None, num_chunks=None):
+    '''
+    Reduces the Z/2 boundary matrix given in compressed sparse column
+    form. Returns (pivots, columns): pivots maps the birth row of every
+    persistence pair to its death column, and columns maps every death
+    column to the sorted list of rows of its reduced column. All other
+    columns reduce to zero.
+
+    :param int workers: the number of processes for the local phase.
+        None or 1 reduces the chunks one after the other in this process.
+    :param int num_chunks: defaults to four chunks per worker.
+
+    >>> indptr = np.array([0, 0, 0, 0, 2, 4, 6, 9])
+    >>> indices = np.array([0, 1, 1, 2, 0, 2, 3, 4, 5])
+    >>> sorted(reduce_in_chunks(indptr, indices, num_chunks=3)[0].items())
+    [(1, 3), (2, 4), (5, 6)]
+    '''
+    indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+    indices = np.ascontiguousarray(indices, dtype=np.int64)
+    if num_chunks is None:
+        num_chunks = 4 * (workers or 1)
+    bounds = chunk_bounds(indptr, num_chunks)
+
+    if workers is None or workers <= 1 or shared_memory is None:
+        _attach(indptr, indices)
+        results = list(map(_reduce_chunk, bounds))
+        _MATRIX.clear()
+    else:
+        blocks = []
+        try:
+            shared = (_shared_copy(indptr, blocks),
+                      _shared_copy(indices, blocks))
+            pool = multiprocessing.Pool(workers, _attach, shared)
+            try:
+                results = pool.map(_reduce_chunk, bounds, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    # Merging phase. A pivot below the start of a column's chunk can only
+    # be owned by a column of an earlier chunk, or by an earlier
+    # unfinished column, so the unfinished columns are finished in order.
+    pivots = dict()
+    columns = dict()
+    unfinished = dict()
+    additions = 0
+    for chunk_pivots, paired, chunk_unfinished, chunk_additions in results:
+        pivots.update(chunk_pivots)
+        columns.update(paired)
+        unfinished.update(chunk_unfinished)
+        additions += chunk_additions
+    for j in sorted(unfinished):
+        column = set(unfinished[j])
+        while column:
+            low = max(column)
+            if low not in pivots:
+                break
+            column ^= set(columns[pivots[low]])
+            additions += 1
+        if column:
+            pivots[max(column)] = j
+            columns[j] = sorted(column)
+    stats = current()
+    if stats is not None:
+        stats.count('column_additions', additions)
+    return pivots, columns
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
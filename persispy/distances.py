@@ -0,0 +1,401 @@
+'''
+File: distances.py
+
+Distances between persistence diagrams.
+
+Diagrams may be given as PersistenceDiagram objects or as (n, 2) arrays
+of (birth, death) pairs. Points are matched either to each other or to
+the diagonal, with the L-infinity ground metric. Infinite bars are
+matched separately by birth; if two diagrams have a different number of
+infinite bars their distance is infinite.
+
+The Wasserstein matching is solved on the usual (n + m) x (n + m) cost
+matrix:
+the rows are the n points of the first diagram followed by m diagonal
+slots, the columns are the m points of the second diagram followed by n
+diagonal slots. A point costs its distance to the diagonal against any
+diagonal slot, and two diagonal slots cost nothing.
+'''
+
+from collections import deque
+from functools import partial
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from persispy.persistence_diagram import as_intervals
+
+
+def _split(intervals):
+    '''
+    Splits bars into the finite ones and the sorted births of the
+    infinite ones.
+    '''
+    infinite = np.isinf(intervals[:, 1])
+    return intervals[~infinite], np.sort(intervals[infinite, 0])
+
+
+def _cost_matrix(x, y):
+    '''
+    The L-infinity matching costs between two finite diagrams, with
+    diagonal slots. See the module docstring.
+    '''
+    n, m = len(x), len(y)
+    cost = np.zeros((n + m, n + m))
+    cost[:n, :m] = np.abs(x[:, None, :] - y[None, :, :]).max(axis=2)
+    cost[:n, m:] = ((x[:, 1] - x[:, 0]) / 2)[:, None]
+    cost[n:, :m] = ((y[:, 1] - y[:, 0]) / 2)[None, :]
+    return cost
+
+
+def _hopcroft_karp(adjacency, num_right):
+    '''
+    Returns the size of a maximum matching in the bipartite graph whose
+    left vertex i is adjacent to the right vertices in the list
+    adjacency[i].
+    '''
+    num_left = len(adjacency)
+    match_left = [-1] * num_left
+    match_right = [-1] * num_right
+    matching = 0
+    while True:
+        # Breadth first search from the free left vertices, layering the
+        # graph by alternating path length.
+        free = [u for u in range(num_left) if match_left[u] == -1]
+        layer = [-1] * num_left
+        for u in free:
+            layer[u] = 0
+        queue = deque(free)
+        found = False
+        while queue:
+            u = queue.popleft()
+            for v in adjacency[u]:
+                w = match_right[v]
+                if w == -1:
+                    found = True
+                elif layer[w] == -1:
+                    layer[w] = layer[u] + 1
+                    queue.append(w)
+        if not found:
+            return matching
+        # Depth first search for augmenting paths along the layers, with an
+        # explicit stack to stay clear of the recursion limit.
+        position = [0] * num_left
+        for root in free:
+            stack = [root]
+            while stack:
+                u = stack[-1]
+                neighbors = adjacency[u]
+                if position[u] == len(neighbors):
+                    layer[u] = -1
+                    stack.pop()
+                    continue
+                v = neighbors[position[u]]
+                position[u] += 1
+                w = match_right[v]
+                if w == -1:
+                    # Augment along the stack.
+                    for u in reversed(stack):
+                        match_left[u], v = v, match_left[u]
+                        match_right[match_left[u]] = u
+                    matching += 1
+                    break
+                if layer[w] == layer[u] + 1:
+                    stack.append(w)
+
+
+def _auction(cost, tolerance=1e-9):
+    '''
+    Solves the assignment problem min sum cost[i, assignment[i]] with the
+    forward auction algorithm and epsilon scaling.
+
+    At the end of every scaling phase the prices give a lower bound on
+    the optimum. We stop as soon as the assignment is within a relative
+    tolerance of that bound, or when epsilon is too small to matter.
+    Rows that still satisfy epsilon complementary slackness keep their
+    objects from one phase to the next.
+    '''
+    n = len(cost)
+    benefit = -cost
+    scale = cost.max() if n else 0
+    assignment = np.arange(n)
+    if n < 2 or scale == 0:
+        return assignment
+    rows = np.arange(n)
+    prices = np.zeros(n)
+    owner = np.full(n, -1, dtype=np.int64)
+    assignment[:] = -1
+    final_epsilon = tolerance * scale / n
+    epsilon = scale / 4
+    while True:
+        unassigned = deque(np.flatnonzero(assignment == -1).tolist())
+        while unassigned:
+            i = unassigned.popleft()
+            values = benefit[i] - prices
+            best, second = np.argpartition(-values, 1)[:2]
+            if values[second] > values[best]:
+                best, second = second, best
+            prices[best] += values[best] - values[second] + epsilon
+            if owner[best] != -1:
+                assignment[owner[best]] = -1
+                unassigned.append(owner[best])
+            owner[best] = i
+            assignment[i] = best
+
+        primal = cost[rows, assignment].sum()
+        dual = (cost + prices).min(axis=1).sum() - prices.sum()
+        if epsilon <= final_epsilon or primal - dual <= tolerance * primal:
+            return assignment
+        epsilon = max(epsilon / 5, final_epsilon)
+        values = benefit - prices
+        slack = values[rows, assignment] < values.max(axis=1) - epsilon
+        owner[assignment[slack]] = -1
+        assignment[slack] = -1
+
+
+def _birth_windows(points, others, order, t):
+    '''
+    Returns the bounds (lows, highs) of the ranges of order holding the
+    rows of others within t in birth of every row of points. The births
+    of others must be sorted by order.
+    '''
+    births = others[order, 0]
+    # Widened by a few ulps, so that the exact tests of the callers decide.
+    margin = t + 4 * np.finfo(float).eps * (np.abs(points[:, 0]) + t)
+    return (np.searchsorted(births, points[:, 0] - margin, 'left'),
+            np.searchsorted(births, points[:, 0] + margin, 'right'))
+
+
+def _neighbors(points, others, order, t):
+    '''
+    Returns, for every row of points, the list of the indices of the rows
+    of others within L-infinity distance t. The rows within t in birth
+    are found by a range query, see _birth_windows, and then filtered by
+    death, so no other pair is ever looked at.
+    '''
+    lows, highs = _birth_windows(points, others, order, t)
+    adjacency = []
+    for point, low, high in zip(points, lows, highs):
+        window = order[low:high]
+        distances = np.abs(others[window] - point).max(axis=1)
+        adjacency.append(window[distances <= t].tolist())
+    return adjacency
+
+
+def _candidates(x, y, order, low, high, limit):
+    '''
+    Returns the sorted distinct L-infinity distances in (low, high]
+    between the points of x and y, with the range queries of _neighbors,
+    and whether that is all of them: the search stops as soon as it has
+    found more than limit.
+    '''
+    lows, highs = _birth_windows(x, y, order, high)
+    found = []
+    count = 0
+    for point, first, last in zip(x, lows, highs):
+        distances = np.abs(y[order[first:last]] - point).max(axis=1)
+        distances = distances[(distances > low) & (distances <= high)]
+        found.append(distances)
+        count += len(distances)
+        if count > limit:
+            # Many pairs may share a distance.
+            found = [np.unique(np.concatenate(found))]
+            count = len(found[0])
+            if count > limit:
+                return found[0], False
+    return (np.unique(np.concatenate(found)) if found else np.empty(0),
+            True)
+
+
+def _covering_matching(x, y, orders, t, must_left, must_right):
+    '''
+    Decides whether the bipartite graph joining the points of x and y
+    within L-infinity distance t has a matching covering the points
+    must_left of x and must_right of y. By the Mendelsohn-Dulmage theorem
+    it suffices to cover each side separately, so only the edges at the
+    points that must be covered are built.
+    '''
+    adjacency = _neighbors(x[must_left], y, orders[1], t)
+    if _hopcroft_karp(adjacency, len(y)) < len(adjacency):
+        return False
+    adjacency = _neighbors(y[must_right], x, orders[0], t)
+    return _hopcroft_karp(adjacency, len(x)) == len(adjacency)
+
+
+def _first_true(values, test):
+    '''
+    Returns the index of the first of the sorted values passing the
+    monotone test, by binary search. The last value must pass.
+    '''
+    low, high = 0, len(values) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if test(values[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def bottleneck(diagram1, diagram2, dimension=None):
+    '''
+    Returns the bottleneck distance between two diagrams.
+
+    For a threshold t, the points farther than t from the diagonal must
+    be matched to points of the other diagram within t, which is decided
+    with Hopcroft-Karp on that geometric graph; its edges are found by
+    range queries on the sorted births. The distance is the smallest
+    feasible candidate: a distance of a point to the diagonal or between
+    two points. The distances to the diagonal are searched first. The
+    n * m distances between points are never all built: the interval
+    left is split at found candidates until it holds at most n + m of
+    them, which are then searched, so the memory stays linear in the
+    size of the diagrams and of the graphs tested.
+
+    >>> bottleneck([[0, 1], [0, 3]], [[0, 3.5]])
+    0.5
+    '''
+    x, x_essential = _split(as_intervals(diagram1, dimension))
+    y, y_essential = _split(as_intervals(diagram2, dimension))
+    if len(x_essential) != len(y_essential):
+        return np.inf
+    distance = 0.0
+    if len(x_essential):
+        distance = np.abs(x_essential - y_essential).max()
+    if not len(x) and not len(y):
+        return float(distance)
+
+    x_diagonal = (x[:, 1] - x[:, 0]) / 2
+    y_diagonal = (y[:, 1] - y[:, 0]) / 2
+    orders = (np.argsort(x[:, 0], kind='mergesort'),
+              np.argsort(y[:, 0], kind='mergesort'))
+
+    def feasible(t):
+        return _covering_matching(x, y, orders, t,
+                                  np.flatnonzero(x_diagonal > t),
+                                  np.flatnonzero(y_diagonal > t))
+
+    # Everything can be matched to the diagonal at the largest distance
+    # to it, so the result is at most that.
+    diagonal = np.unique(np.concatenate(([0], x_diagonal, y_diagonal)))
+    index = _first_true(diagonal, feasible)
+    high = diagonal[index]
+    if index == 0:
+        return float(max(distance, high))
+    # The result is a candidate in (low, high]: the graph, and so
+    # feasibility, only changes at the candidates.
+    low, best = diagonal[index - 1], high
+    limit = len(x) + len(y)
+    while True:
+        candidates, complete = _candidates(x, y, orders[1], low, high,
+                                           limit)
+        if complete:
+            break
+        # Split at the median of the candidates found so far.
+        middle = candidates[len(candidates) // 2]
+        if feasible(middle):
+            high = middle
+        else:
+            low = middle
+    candidates = np.append(candidates[candidates < best], best)
+    result = candidates[_first_true(candidates, feasible)]
+    return float(max(distance, result))
+
+
+def wasserstein(diagram1, diagram2, p=2, dimension=None, tolerance=1e-9):
+    '''
+    Returns the p-Wasserstein distance between two diagrams.
+
+    The optimal matching is found with the auction algorithm; the p-th
+    power of the result is within a relative tolerance of the optimum.
+
+    >>> round(wasserstein([[0, 1], [0, 3]], [[0, 3.5]], p=1), 6)
+    1.0
+    '''
+    x, x_essential = _split(as_intervals(diagram1, dimension))
+    y, y_essential = _split(as_intervals(diagram2, dimension))
+    if len(x_essential) != len(y_essential):
+        return np.inf
+    total = (np.abs(x_essential - y_essential) ** p).sum()
+    if len(x) or len(y):
+        cost = _cost_matrix(x, y) ** p
+        assignment = _auction(cost, tolerance)
+        total += cost[np.arange(len(cost)), assignment].sum()
+    return float(total ** (1.0 / p))
+
+
+METRICS = {'bottleneck': bottleneck,
+           'wasserstein': wasserstein}
+
+
+# Per process state of the pairwise_distances workers. The diagrams are
+# shipped once per worker by the pool initializer instead of with every
+# task.
+_WORKER = {}
+
+
+def _init_worker(metric, intervals):
+    _WORKER['metric'] = metric
+    _WORKER['intervals'] = intervals
+
+
+def _pair_distance(pair):
+    '''
+    Worker task for pairwise_distances.
+    '''
+    i, j = pair
+    intervals = _WORKER['intervals']
+    return i, j, _WORKER['metric'](intervals[i], intervals[j])
+
+
+def pairwise_distances(diagrams,
+                       metric='bottleneck',
+                       dimension=None,
+                       workers=None,
+                       chunksize=64,
+                       **kwargs):
+    '''
+    Returns the symmetric matrix of distances between all pairs of
+    diagrams. With workers > 1 the pairs are split among a pool of
+    worker processes.
+
+    :param list diagrams: PersistenceDiagrams or (n, 2) arrays.
+    :param str metric: [bottleneck|wasserstein]
+    :param int dimension: restrict PersistenceDiagrams to one dimension.
+    :param int workers: the number of processes. None or 1 runs serially.
+    :param kwargs: passed to the metric, e.g. p for wasserstein.
+
+    >>> pairwise_distances([[[0, 1]], [[0, 2]], [[0, 4]]])
+    array([[0., 1., 2.],
+           [1., 0., 2.],
+           [2., 2., 0.]])
+    '''
+    if metric not in METRICS:
+        raise TypeError('The argument "metric" should be either ' +
+                        '"bottleneck" or "wasserstein".')
+    intervals = [as_intervals(d, dimension) for d in diagrams]
+    state = (partial(METRICS[metric], **kwargs), intervals)
+    pairs = itertools.combinations(range(len(intervals)), 2)
+
+    distances = np.zeros((len(intervals), len(intervals)))
+    if workers is None or workers <= 1:
+        _init_worker(*state)
+        results = map(_pair_distance, pairs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, state)
+        results = pool.imap_unordered(_pair_distance, pairs, chunksize)
+    try:
+        for i, j, distance in results:
+            distances[i, j] = distances[j, i] = distance
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return distances
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
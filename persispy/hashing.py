@@ -9,7 +9,6 @@ AUTHORS:
     - Daniel Etrata (2016-01)
 '''
 
-import hashlib as hashlib
 import numpy as np
 
 
@@ -17,33 +16,64 @@ class HashPoint(object):
     '''
     A wrapped numpy array to allow hashing.
 
-    Vars: _coords (a numpy array).
+    Vars: _cloud (a numpy array: the coordinates, or a 2-dimensional
+        array of which they are the row _row).
+    _row (None, or the row of _cloud holding the coordinates.)
+    _coords (the coordinates: _cloud, or the view of its row _row,
+        made on first use.)
+    _hash (the hash of the raw bytes of the coordinates, computed on
+        first use unless given. See hash_rows.)
+
+    The constructor copies the coordinates, since the hash is cached. A
+    point made with HashPoint.from_row instead keeps a reference to the
+    shared array of a PointCloud and its row, without copying, and makes
+    the row view once, when it is first needed.
 
     >>> HashPoint([1,2,3])
     point 0: [1, 2, 3]
     '''
 
-    def __init__(self, coords, index=0):
-        self._coords = np.array(coords)
+    __slots__ = ('_cloud', '_row', '_coords', '_index', '_hash')
+
+    def __init__(self, coords, index=0, hash_value=None):
+        self._cloud = np.array(coords)
+        self._row = None
+        self._coords = self._cloud
         self._index = index
+        self._hash = hash_value
+
+    @classmethod
+    def from_row(cls, cloud, row, index=None, hash_value=None):
+        '''
+        Returns the point with coordinates cloud[row], by default with
+        index row.
+
+        >>> cloud = np.array([[0, 1], [2, 3]])
+        >>> HashPoint.from_row(cloud, 1)
+        point 1: [2, 3]
+        '''
+        point = cls.__new__(cls)
+        point._cloud = cloud
+        point._row = row
+        point._coords = None
+        point._index = row if index is None else index
+        point._hash = hash_value
+        return point
 
     def __len__(self):
-        return len(self._coords)
+        return len(self.coordinate())
 
     def __getitem__(self, key):
-        return self._coords[key]
+        return self.coordinate()[key]
 
     def __hash__(self):
-        try:
-            out = self._hash
-            return out
-        except AttributeError:
-            self._hash = int(hashlib.sha1(self._coords.view()).hexdigest(), 16)
-            return self._hash
+        if self._hash is None:
+            self._hash = hash(self.coordinate().tobytes())
+        return self._hash
 
     def __repr__(self):
         return "point " + str(self._index) + ": " + \
-            str(self._coords.__repr__())[6:-1]
+            str(self.coordinate().__repr__())[6:-1]
 
     def point(self):
         '''
@@ -53,7 +83,7 @@ class HashPoint(object):
         >>> x.point()
         (0, array([1, 2, 3]))
         '''
-        return self._index, self._coords
+        return self._index, self.coordinate()
 
     def index(self):
         """
@@ -73,11 +103,13 @@ class HashPoint(object):
         >>> x.coordinate()
         array([1, 2, 3])
         '''
+        if self._coords is None:
+            self._coords = self._cloud[self._row]
         return self._coords
 
     # The <,>,<=,>= comparators below use only the index to compare points. The
     # == and != comparators behave as follows. Two hash points will return x==y
-    # as True if and only if they have the same index and the same _coords.
+    # as True if and only if they have the same index and equal coordinates.
     # Otherwise, they are not equal (i.e., __ne__ returns True), even if they
     # have the same index. This has
     # a possibly strange consequence. One can have x<y False, x<=y True, but
@@ -95,17 +127,14 @@ class HashPoint(object):
         return other <= self
 
     def __eq__(self, other):
-        coordinate_cmp = True
-        # Note that for numpy.arrays x=numpy.array([1,2,3]) and
-        # y=numpy.array([1,4,5]), x==y will return another numpy array, namely
-        # array([ True,  False,  False], dtype=bool).
-        for _coordinate in self._coords == other.coordinate():
-            if _coordinate:
-                continue
-            else:
-                coordinate_cmp = False
-                break
-        return self._index == other.index() and coordinate_cmp
+        if self._index != other.index():
+            return False
+        # Two rows of the same shared array need no comparison.
+        if self._row is not None and \
+                self._row == getattr(other, '_row', None) and \
+                self._cloud is other._cloud:
+            return True
+        return np.array_equal(self.coordinate(), other.coordinate())
 
     def __ne__(self, other):
         return not self == other
@@ -128,9 +157,12 @@ class HashEdge(object):
     edge 99: [[0 0 0] [1 1 1]]
     '''
 
+    __slots__ = ('_index', '_edge', '_hash')
+
     def __init__(self, edge, index=0, DEBUG=False):
 
         self._index = index
+        self._hash = None
         if DEBUG:
             print(edge)
 
@@ -154,12 +186,9 @@ class HashEdge(object):
         return self._edge[key]
 
     def __hash__(self):
-        try:
-            out = self._hash
-            return out
-        except AttributeError:
-            self._hash = int(hashlib.sha1(self._edge.view()).hexdigest(), 16)
-            return self._hash
+        if self._hash is None:
+            self._hash = hash(self._edge.tobytes())
+        return self._hash
 
     def __repr__(self):
         '''
@@ -217,7 +246,7 @@ class HashEdge(object):
                 HashEdge(np.array(([0,0,0],[2,2,2])))
         False
         """
-        return (self._edge.flatten() == other._edge.flatten()).all()
+        return bool((self._edge.flatten() == other._edge.flatten()).all())
 
     def __eq__(self, other):
         return self.__cmp__(other)
@@ -236,6 +265,48 @@ class HashEdge(object):
 
         return HashEdge(np.array(newedge), self._index)
 
+
+def coordinate_array(points):
+    '''
+    Returns the (n, d) array of the coordinates of a list of HashPoints.
+    If they are all rows of one shared array, as the points of a
+    PointCloud are, the rows are gathered with a single fancy index.
+
+    >>> cloud = np.arange(6).reshape(3, 2)
+    >>> coordinate_array([HashPoint.from_row(cloud, 2), \
+                          HashPoint.from_row(cloud, 0)])
+    array([[4, 5],
+           [0, 1]])
+    '''
+    if not len(points):
+        return np.zeros((0, 0))
+    cloud = getattr(points[0], '_cloud', None)
+    if cloud is not None and cloud.ndim == 2 and \
+            all(getattr(p, '_cloud', None) is cloud and p._row is not None
+                for p in points):
+        return cloud[np.array([p._row for p in points], dtype=np.int64)]
+    return np.array([p.coordinate() for p in points])
+
+
+def hash_rows(array):
+    '''
+    Returns the list of the hashes of the rows of a 2-dimensional array,
+    equal to the hashes of HashPoints built from those rows. The array is
+    converted to bytes once, and the rows are hashed as slices of it.
+
+    >>> points = np.array([[0., 1.], [2., 3.]])
+    >>> hash_rows(points) == [hash(HashPoint(row)) for row in points]
+    True
+    '''
+    array = np.ascontiguousarray(array)
+    if array.ndim != 2:
+        raise ValueError('Expected a 2-dimensional array.')
+    data = array.tobytes()
+    width = array.shape[1] * array.itemsize
+    return [hash(data[start:start + width])
+            for start in range(0, len(data), width)]
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
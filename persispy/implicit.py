@@ -0,0 +1,282 @@
+'''
+File: implicit.py
+
+Sampling points on implicit hypersurfaces f(x) = 0 with NumPy alone.
+
+The equation string is compiled once into a Polynomial: a table of
+exponents and coefficients, together with those of its partial
+derivatives. A batch of points is evaluated by looking the powers of its
+coordinates up in one table, so the polynomial and its gradient are
+computed for the whole batch in a few array operations.
+
+Points are sampled by drawing random starting points in the box
+[-bounds, bounds]^d and moving them onto the zero set with batched Newton
+steps x <- x - f(x) grad f(x) / |grad f(x)|^2. Points that do not
+converge, or leave the box, are dropped. Unlike persispy.phc this needs
+no homotopy continuation, and so no phcpy. The points are not uniformly
+distributed on the hypersurface.
+'''
+
+import ast
+
+import numpy as np
+
+from persispy.point_cloud import PointCloud
+from persispy.rng import random_state
+
+
+class Polynomial(object):
+    '''
+    A real polynomial compiled from a string such as
+    "16*x^2 + 16*y^2 - (x^2 + y^2 + z^2 + 3)^2". Both ^ and ** denote
+    powers; division is allowed by constants only. The variables are
+    ordered alphabetically, as in persispy.phc.
+
+    >>> f = Polynomial("x^2 + y^2 - 1")
+    >>> f.variables()
+    ['x', 'y']
+    >>> f(np.array([[1., 0.], [1., 1.]]))
+    array([0., 1.])
+    >>> f.gradient(np.array([[1., 2.]]))
+    array([[2., 4.]])
+    '''
+
+    def __init__(self, equation):
+        self.equation = equation
+        tree = ast.parse(equation.replace('^', '**'), mode='eval').body
+        self._variables = sorted(set(node.id for node in ast.walk(tree)
+                                     if isinstance(node, ast.Name)))
+        terms = _expand(tree, self._variables)
+        terms = dict((e, c) for e, c in terms.items() if c != 0)
+        dimension = len(self._variables)
+        self._exponents = np.array(sorted(terms), dtype=np.int64).reshape(
+            -1, dimension)
+        self._coefficients = np.array([terms[e] for e in sorted(terms)],
+                                      dtype=np.float64)
+        self._degree = int(self._exponents.sum(axis=1).max()) \
+            if len(terms) else 0
+        # The partial derivative in variable k has the same terms with
+        # exponent k lowered by one and coefficients multiplied by it.
+        self._derivative_exponents = np.maximum(
+            self._exponents[None, :, :] - np.eye(dimension,
+                                                 dtype=np.int64)[:, None, :],
+            0)
+        self._derivative_coefficients = \
+            self._coefficients[None, :] * self._exponents.T
+
+    def __repr__(self):
+        return 'Polynomial ' + self.equation + ' in ' + \
+            ', '.join(self._variables)
+
+    def variables(self):
+        '''
+        Returns the list of variables, in the order of the coordinates.
+        '''
+        return list(self._variables)
+
+    def degree(self):
+        '''
+        Returns the total degree.
+        '''
+        return self._degree
+
+    def _powers(self, points):
+        '''
+        Returns the (d, degree + 1, n) table of the powers of the
+        coordinates of the (n, d) points.
+        '''
+        points = np.asarray(points, dtype=np.float64)
+        powers = np.ones((points.shape[1], self._degree + 1, len(points)))
+        for e in range(1, self._degree + 1):
+            powers[:, e] = powers[:, e - 1] * points.T
+        return powers
+
+    def _monomials(self, powers, exponents):
+        '''
+        Returns the (terms, n) values of the monomials with the given
+        (terms, d) exponents.
+        '''
+        monomials = np.ones((len(exponents), powers.shape[2]))
+        for k in range(powers.shape[0]):
+            monomials *= powers[k, exponents[:, k]]
+        return monomials
+
+    def __call__(self, points):
+        '''
+        Returns the values at the rows of an (n, d) array.
+        '''
+        powers = self._powers(points)
+        return self._coefficients.dot(self._monomials(powers,
+                                                      self._exponents))
+
+    def gradient(self, points):
+        '''
+        Returns the (n, d) array of the gradients at the rows of an (n, d)
+        array.
+        '''
+        return self.value_and_gradient(points)[1]
+
+    def value_and_gradient(self, points):
+        '''
+        Returns the values and the gradients, sharing one power table.
+        '''
+        powers = self._powers(points)
+        values = self._coefficients.dot(self._monomials(powers,
+                                                        self._exponents))
+        gradient = np.empty((len(values), len(self._variables)))
+        for k in range(len(self._variables)):
+            gradient[:, k] = self._derivative_coefficients[k].dot(
+                self._monomials(powers, self._derivative_exponents[k]))
+        return values, gradient
+
+
+def _expand(node, variables):
+    '''
+    Expands an expression tree into a dict from exponent tuples to
+    coefficients.
+    '''
+    dimension = len(variables)
+    zero = (0,) * dimension
+    if isinstance(node, ast.Expression):
+        return _expand(node.body, variables)
+    if isinstance(node, ast.Constant if hasattr(ast, 'Constant') else ast.Num):
+        value = getattr(node, 'value', getattr(node, 'n', None))
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError('Unsupported constant ' + repr(value) + '.')
+        return {zero: float(value)}
+    if isinstance(node, ast.Name):
+        exponent = [0] * dimension
+        exponent[variables.index(node.id)] = 1
+        return {tuple(exponent): 1.0}
+    if isinstance(node, ast.UnaryOp) and \
+            isinstance(node.op, (ast.UAdd, ast.USub)):
+        terms = _expand(node.operand, variables)
+        if isinstance(node.op, ast.USub):
+            terms = dict((e, -c) for e, c in terms.items())
+        return terms
+    if isinstance(node, ast.BinOp):
+        left = _expand(node.left, variables)
+        if isinstance(node.op, ast.Pow):
+            power = _expand(node.right, variables)
+            exponent = power.get(zero, 0.0)
+            if set(power) - set([zero]) or exponent < 0 or \
+                    exponent != int(exponent):
+                raise ValueError('Exponents must be non-negative integers.')
+            result = {zero: 1.0}
+            for _ in range(int(exponent)):
+                result = _multiply(result, left)
+            return result
+        right = _expand(node.right, variables)
+        if isinstance(node.op, ast.Add):
+            return _add(left, right, 1.0)
+        if isinstance(node.op, ast.Sub):
+            return _add(left, right, -1.0)
+        if isinstance(node.op, ast.Mult):
+            return _multiply(left, right)
+        if isinstance(node.op, ast.Div):
+            if set(right) - set([zero]) or not right.get(zero):
+                raise ValueError('Division is only allowed by nonzero ' +
+                                 'constants.')
+            return dict((e, c / right[zero]) for e, c in left.items())
+    raise ValueError('Unsupported expression: ' + ast.dump(node))
+
+
+def _add(left, right, sign):
+    result = dict(left)
+    for e, c in right.items():
+        result[e] = result.get(e, 0.0) + sign * c
+    return result
+
+
+def _multiply(left, right):
+    result = {}
+    for e, c in left.items():
+        for f, d in right.items():
+            g = tuple(a + b for a, b in zip(e, f))
+            result[g] = result.get(g, 0.0) + c * d
+    return result
+
+
+def newton_project(polynomial, points, max_steps=30, tolerance=1e-10):
+    '''
+    Moves the rows of an (n, d) array towards the zero set with Newton
+    steps along the gradient. Returns the moved points and a mask of those
+    within tolerance of the zero set, measured by |f| / |grad f|.
+    '''
+    points = np.array(points, dtype=np.float64)
+    active = np.arange(len(points))
+    converged = np.zeros(len(points), dtype=bool)
+    with np.errstate(all='ignore'):
+        for _ in range(max_steps):
+            if not len(active):
+                break
+            values, gradient = polynomial.value_and_gradient(points[active])
+            norms = (gradient * gradient).sum(axis=1)
+            distance = np.abs(values) / np.sqrt(norms)
+            done = distance <= tolerance
+            converged[active[done]] = True
+            stuck = ~np.isfinite(distance) | (norms == 0)
+            moving = ~done & ~stuck
+            rows = active[moving]
+            points[rows] -= (values[moving] / norms[moving])[:, None] * \
+                gradient[moving]
+            active = rows
+    return points, converged
+
+
+def sample_hypersurface(equation,
+                        num_points,
+                        bounds=10,
+                        rng=None,
+                        batch_size=None,
+                        max_steps=30,
+                        tolerance=1e-10,
+                        max_batches=100):
+    '''
+    Returns a PointCloud of num_points points on the hypersurface given
+    by an equation string or a Polynomial.
+
+    :param float bounds: starting points are drawn uniformly from the box
+        [-bounds, bounds]^d, and points that end outside it are rejected.
+    :param rng: a numpy Generator, RandomState, SeedSequence or int seed.
+        None uses the global numpy.random state. See persispy.rng.
+    :param int batch_size: starting points per batch, by default adapted
+        to the acceptance rate of the previous batch.
+    :param int max_batches: raise a RuntimeError if this many batches do
+        not give enough points.
+
+    >>> cloud = sample_hypersurface("x^2 + y^2 + z^2 - 1", 1000, rng=0)
+    >>> cloud
+    Point cloud with 1000 points in real affine space of dimension 3
+    >>> bool(np.allclose(np.linalg.norm(cloud.get_array(), axis=1), 1))
+    True
+    '''
+    if not isinstance(equation, Polynomial):
+        equation = Polynomial(equation)
+    rng = random_state(rng)
+    dimension = len(equation.variables())
+    points = np.empty((num_points, dimension))
+    count = 0
+    acceptance = 1.0
+    for _ in range(max_batches):
+        if count >= num_points:
+            break
+        remaining = num_points - count
+        size = batch_size or int(1.2 * remaining / acceptance) + 16
+        starts = rng.uniform(-bounds, bounds, size=(size, dimension))
+        moved, converged = newton_project(equation, starts, max_steps,
+                                          tolerance)
+        converged &= (np.abs(moved) <= bounds).all(axis=1)
+        accepted = moved[converged][:remaining]
+        points[count:count + len(accepted)] = accepted
+        count += len(accepted)
+        acceptance = max(converged.mean(), .01)
+    if count < num_points:
+        raise RuntimeError('Too few starting points converged to the ' +
+                           'hypersurface within the bounds.')
+    return PointCloud(points, space='affine')
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
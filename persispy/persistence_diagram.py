@@ -0,0 +1,238 @@
+'''
+File: persistence_diagram.py
+
+The PersistenceDiagram result type for persistent homology computations.
+
+A diagram stores one bar per row of a structured numpy array with the
+fields (dim, birth, death, birth_simplex, death_simplex). Bars are kept
+sorted by dimension so that the bars of a single dimension form a
+contiguous view of the array. Infinite bars have death equal to np.inf
+and death_simplex equal to -1. The simplex fields are positions in the
+filtration, i.e. the .index of the corresponding SimplexContainer.
+'''
+
+import numpy as np
+
+BAR_DTYPE = np.dtype([('dim', np.int64),
+                      ('birth', np.float64),
+                      ('death', np.float64),
+                      ('birth_simplex', np.int64),
+                      ('death_simplex', np.int64)])
+
+
+class PersistenceDiagram(object):
+    '''
+    A persistence diagram backed by a structured numpy array.
+
+    :param bars: an array with dtype BAR_DTYPE (or anything convertible
+        to it). The bars are copied and sorted by dimension.
+
+    >>> dgm = PersistenceDiagram.from_arrays([0, 0, 1], [0, 0, .2], \
+                                             [.5, np.inf, .7])
+    >>> dgm
+    Persistence diagram with 3 bars (1 infinite) in dimensions 0 to 1
+    >>> dgm.intervals(0)
+    array([[0. , 0.5],
+           [0. , inf]])
+    >>> dgm.betti(.6)
+    array([1, 1])
+    '''
+
+    def __init__(self, bars):
+        bars = np.array(bars, dtype=BAR_DTYPE).reshape(-1)
+        order = np.lexsort((bars['death'], bars['birth'], bars['dim']))
+        self._bars = bars[order]
+        if len(self._bars):
+            top = int(self._bars['dim'][-1])
+        else:
+            top = -1
+        # self._offsets[k]:self._offsets[k + 1] are the bars of dimension k.
+        self._offsets = np.searchsorted(self._bars['dim'],
+                                        np.arange(top + 2))
+
+    @classmethod
+    def from_arrays(cls,
+                    dims,
+                    births,
+                    deaths,
+                    birth_simplices=None,
+                    death_simplices=None):
+        '''
+        Builds a diagram from parallel sequences. Missing simplex ids are
+        recorded as -1.
+        '''
+        births = np.asarray(births, dtype=np.float64).reshape(-1)
+        bars = np.empty(len(births), dtype=BAR_DTYPE)
+        bars['dim'] = dims
+        bars['birth'] = births
+        bars['death'] = deaths
+        bars['birth_simplex'] = -1 if birth_simplices is None \
+            else birth_simplices
+        bars['death_simplex'] = -1 if death_simplices is None \
+            else death_simplices
+        return cls(bars)
+
+    @classmethod
+    def from_persistent_homology(cls, persistent_homology,
+                                 include_diagonal=False):
+        '''
+        Reads the bars off a reduced PersistentHomology object.
+
+        Finite bars come from persistence_pairs. A simplex whose column
+        reduced to zero and which is never the pivot of another column
+        gives an infinite bar. Bars above the dimension the reduction was
+        asked for are dropped, since nothing in the complex could kill
+        them. Bars of length zero are dropped unless include_diagonal.
+        '''
+        top = persistent_homology.max_dimension
+        pairs = persistent_homology.persistence_pairs
+        rows = []
+        for container in persistent_homology.simplex_containers:
+            dim = len(container.simplex.vertices()) - 1
+            if dim > top or len(container.entries) != 0:
+                continue
+            if container in pairs:
+                killer = pairs[container]
+                death = killer.simplex.weight()
+                death_index = killer.index
+                if death == container.simplex.weight() and \
+                        not include_diagonal:
+                    continue
+            else:
+                death = np.inf
+                death_index = -1
+            rows.append((dim, container.simplex.weight(), death,
+                         container.index, death_index))
+        return cls(np.array(rows, dtype=BAR_DTYPE))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads a diagram written by .save(). No pickled objects are read.
+        '''
+        with np.load(path, allow_pickle=False) as data:
+            bars = np.empty(len(data['dim']), dtype=BAR_DTYPE)
+            for name in BAR_DTYPE.names:
+                bars[name] = data[name]
+        return cls(bars)
+
+    def save(self, path):
+        '''
+        Writes the diagram to an .npz file with one plain array per
+        field, so that it can be read back with allow_pickle=False.
+        '''
+        np.savez(path, **{name: self._bars[name]
+                          for name in BAR_DTYPE.names})
+
+    def __repr__(self):
+        return 'Persistence diagram with ' + repr(len(self)) + \
+            ' bars (' + repr(int(np.isinf(self._bars['death']).sum())) + \
+            ' infinite) in dimensions 0 to ' + repr(self.max_dimension())
+
+    def __len__(self):
+        return len(self._bars)
+
+    def __iter__(self):
+        return iter(self._bars)
+
+    def __eq__(self, other):
+        return isinstance(other, PersistenceDiagram) and \
+            np.array_equal(self._bars, other.bars())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def max_dimension(self):
+        '''
+        Returns the largest dimension of a bar, or -1 if there are none.
+        '''
+        return len(self._offsets) - 2
+
+    def bars(self, dimension=None):
+        '''
+        Returns the structured array of bars. With a dimension, returns
+        a view of the bars in that dimension in O(1).
+        '''
+        if dimension is None:
+            return self._bars
+        if dimension < 0 or dimension > self.max_dimension():
+            return self._bars[:0]
+        return self._bars[self._offsets[dimension]:
+                          self._offsets[dimension + 1]]
+
+    def intervals(self, dimension=None):
+        '''
+        Returns an (n, 2) float array of (birth, death) pairs.
+        '''
+        bars = self.bars(dimension)
+        return np.column_stack((bars['birth'], bars['death']))
+
+    def persistence(self, dimension=None):
+        '''
+        Returns death - birth for every bar; infinite bars give np.inf.
+        '''
+        bars = self.bars(dimension)
+        return bars['death'] - bars['birth']
+
+    def finite(self, dimension=None):
+        '''
+        Returns the bars with finite death.
+        '''
+        bars = self.bars(dimension)
+        return bars[np.isfinite(bars['death'])]
+
+    def essential(self, dimension=None):
+        '''
+        Returns the infinite bars.
+        '''
+        bars = self.bars(dimension)
+        return bars[np.isinf(bars['death'])]
+
+    def most_persistent(self, k, dimension=None):
+        '''
+        Returns the k bars of largest persistence, longest first. Only the
+        selected bars are sorted, so this is O(n + k log k).
+
+        >>> dgm = PersistenceDiagram.from_arrays([1, 1, 1], [0, .1, .2], \
+                                                 [.3, .9, .4])
+        >>> dgm.most_persistent(2)['death']
+        array([0.9, 0.3])
+        '''
+        bars = self.bars(dimension)
+        if k <= 0:
+            return bars[:0]
+        if k < len(bars):
+            selected = np.argpartition(-self.persistence(dimension),
+                                       k - 1)[:k]
+        else:
+            selected = np.arange(len(bars))
+        persistence = bars['death'][selected] - bars['birth'][selected]
+        return bars[selected[np.argsort(-persistence, kind='mergesort')]]
+
+    def betti(self, epsilon):
+        '''
+        Returns the array of Betti numbers at filtration value epsilon,
+        indexed by dimension.
+        '''
+        alive = (self._bars['birth'] <= epsilon) & \
+            (self._bars['death'] > epsilon)
+        return np.bincount(self._bars['dim'][alive],
+                           minlength=self.max_dimension() + 1)
+
+
+def as_intervals(diagram, dimension=None):
+    '''
+    Returns the (n, 2) float array of (birth, death) pairs of a
+    PersistenceDiagram, or of anything convertible to such an array.
+
+    >>> as_intervals([0, 1])
+    array([[0., 1.]])
+    '''
+    if isinstance(diagram, PersistenceDiagram):
+        return diagram.intervals(dimension)
+    return np.asarray(diagram, dtype=np.float64).reshape(-1, 2)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
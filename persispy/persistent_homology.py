@@ -7,10 +7,22 @@ AUTHORS:
 
     - Mason Boeman (2016-04)
 '''
-import colorsys
-import matplotlib.pyplot as plt
+import os
+import time
+
+import numpy as np
 import sortedcontainers
 
+from persispy.chunk_reduction import reduce_in_chunks
+from persispy.hashing import HashPoint
+from persispy.persistence_diagram import PersistenceDiagram
+from persispy.stats import current, stage
+import persispy.weighted_simplicial_complex as wsc
+
+# os.replace is atomic on every platform; python2 only has os.rename,
+# which is atomic on POSIX.
+_replace = getattr(os, 'replace', os.rename)
+
 
 class PersistentHomology(object):
     '''
@@ -18,36 +30,469 @@ class PersistentHomology(object):
 
     Vars: _coords (a numpy array).
     vertex_dict - loop up simplex container from tuple of vertices
+    max_dimension - the largest homological dimension computed
+    coefficient - the prime p of the coefficient field Z/p
+    representatives - None, or a dict from the filtration index of the
+        birth simplex of every finite bar longer than the representatives
+        threshold, and of every infinite bar if essential, to a
+        representative cycle (simplex ids, coefficients)
+
+    With representatives=threshold, every finite bar longer than the
+    threshold is represented by the reduced column of the simplex that
+    kills it, which the reduction computes anyway: this costs no extra
+    memory, and an infinite bar in dimension 0 by its vertex. An infinite
+    bar in a higher dimension has no such column. With essential=True the
+    reduction also records which columns were added to which (the V
+    matrix), in dimensions up to n, and an infinite bar is represented
+    by the chain of its birth simplex. The chain of a positive column is
+    dropped as soon as it is paired, but those of the negative columns
+    are kept throughout, since they may be added to the chain of any
+    later column, so this costs up to the V matrix in dimensions up to
+    n, whatever the threshold.
+
+    With workers > 1, the Z/2 reduction is split into contiguous chunks
+    reduced in parallel processes (see persispy.chunk_reduction). The
+    persistence pairs are the same as those of the serial reduction; the
+    reduced columns may differ. Over Z/p, or when essential
+    representatives are recorded, the serial reduction is used.
+
+    Inside persispy.stats.collect() the stages boundary_matrix and
+    reduction are timed, and the apparent_pairs, column_additions and
+    persistence_pairs are counted.
 
     '''
 
-    def __init__(self, simplicial_complex, n):
+    def __init__(self,
+                 simplicial_complex,
+                 n,
+                 coefficient=2,
+                 representatives=None,
+                 workers=None,
+                 checkpoint=None,
+                 checkpoint_interval=600,
+                 essential=False):
+        if not is_prime(coefficient):
+            raise ValueError('The coefficient must be a prime number.')
+        self._setup(n, coefficient, representatives, essential,
+                    checkpoint, checkpoint_interval)
+        with stage('boundary_matrix') as stats:
+            weighted_simplices = []
+            for dimension in simplicial_complex.simplices():
+                if dimension <= n + 1:
+                    weighted_simplices.extend(
+                        simplicial_complex.simplices()[dimension])
+            self.simplex_containers = sorted(
+                [SimplexContainer(s, coefficient)
+                 for s in sorted(weighted_simplices)])
+            self.persistence_pairs = dict()
+            for i, container in enumerate(self.simplex_containers):
+                self.vertex_dict[tuple(container.simplex.vertices())] = \
+                    container
+                container.index = i
+                container.compute_entries(self)
+            if stats is not None:
+                stats.count('apparent_pairs', self.apparent_pairs())
+        # Chains of the V matrix, by filtration index, for essential
+        # representatives. Kept for negative columns while they may be
+        # added to later ones, and for positive columns while they are
+        # unpaired.
+        chains = dict() if representatives is not None and essential \
+            else None
+        with stage('reduction') as stats:
+            if coefficient == 2 and chains is None and \
+                    workers is not None and workers > 1:
+                self._reduce_in_chunks(workers)
+                if representatives is not None:
+                    self._collect_representatives(None)
+            else:
+                self._finish(chains, 0)
+            if stats is not None:
+                stats.count('persistence_pairs', len(self.persistence_pairs))
+
+    def _setup(self, n, coefficient, representatives, essential,
+               checkpoint, checkpoint_interval):
+        self.coefficient = coefficient
+        self.max_dimension = n
+        self.representative_threshold = representatives
+        self.essential = essential
+        self.representatives = None
         self.vertex_dict = dict()
-        weighted_simplices = []
-        for dimension in simplicial_complex.simplices():
-            if dimension <= n + 1:
-                weighted_simplices.extend(
-                    simplicial_complex.simplices()[dimension])
-        self.simplex_containers = sorted([SimplexContainer(s)
-                                          for s in sorted(weighted_simplices)])
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self._next_checkpoint = time.time() + checkpoint_interval
+        self._filtration = None
+
+    def _finish(self, chains, start):
+        '''
+        Runs the serial reduction from the column start on, and collects
+        the representatives.
+        '''
+        if self.coefficient == 2:
+            self._reduce(chains, start)
+        else:
+            self._reduce_modular(chains, start)
+        if self.representative_threshold is not None:
+            self._collect_representatives(chains)
+
+    @classmethod
+    def resume(cls, path, checkpoint_interval=None):
+        '''
+        Continues a computation from a checkpoint file written by a
+        PersistentHomology(..., checkpoint=path) that did not finish.
+        Further checkpoints are written to the same path, by default at
+        the interval of the original computation. The simplicial complex
+        is rebuilt from the file, with the points as new HashPoints.
+        '''
+        with np.load(path, allow_pickle=False) as data:
+            data = dict(data.items())
+        threshold = float(data['representative_threshold'])
+        # Checkpoints from before the essential flag recorded chains
+        # whenever they recorded representatives.
+        essential = bool(data['essential']) if 'essential' in data \
+            else not np.isnan(threshold)
+        if checkpoint_interval is None:
+            checkpoint_interval = float(data['checkpoint_interval'])
+        self = cls.__new__(cls)
+        self._setup(int(data['max_dimension']), int(data['coefficient']),
+                    None if np.isnan(threshold) else threshold, essential,
+                    path, checkpoint_interval)
+        points = [HashPoint.from_row(data['point_coords'], row, index)
+                  for row, index in enumerate(data['point_index'].tolist())]
+        bounds = data['simplex_indptr']
+        vertices = data['simplex_vertices'].tolist()
+        self.simplex_containers = [
+            SimplexContainer(wsc.wSimplex([points[v] for v in
+                                           vertices[bounds[i]:bounds[i + 1]]],
+                                          weight),
+                             self.coefficient)
+            for i, weight in enumerate(data['simplex_weights'].tolist())]
+        self._filtration = (data['point_index'], data['point_coords'],
+                            bounds, data['simplex_vertices'],
+                            data['simplex_weights'])
+
+        # Columns before position are restored in their reduced state,
+        # the others start from the boundary matrix.
+        position = int(data['position'])
+        columns = _unpack(data['column_indptr'], data['column_rows'],
+                          data['column_values'])
         self.persistence_pairs = dict()
         for i, container in enumerate(self.simplex_containers):
             self.vertex_dict[tuple(container.simplex.vertices())] = container
             container.index = i
-            container.compute_entries(self)
+            if i >= position:
+                container.compute_entries(self)
+                continue
+            rows, values = columns[i]
+            if self.coefficient == 2:
+                container.entries = sortedcontainers.SortedSet(
+                    self.simplex_containers[j] for j in rows.tolist())
+            else:
+                container.entries = rows
+                container.coefficients = values
+            if len(rows):
+                self.persistence_pairs[
+                    self.simplex_containers[rows[-1]]] = container
+
+        chains = None
+        if self.representative_threshold is not None and essential:
+            chains = dict(zip(data['chain_keys'].tolist(),
+                              _unpack(data['chain_indptr'],
+                                      data['chain_rows'],
+                                      data['chain_values'])))
+            if self.coefficient == 2:
+                for key, (rows, _) in chains.items():
+                    chains[key] = sortedcontainers.SortedSet(
+                        self.simplex_containers[j] for j in rows.tolist())
+        with stage('reduction') as stats:
+            self._finish(chains, position)
+            if stats is not None:
+                stats.count('persistence_pairs', len(self.persistence_pairs))
+        return self
+
+    def apparent_pairs(self):
+        '''
+        Returns the number of apparent pairs of the boundary matrix: the
+        columns whose pivot, their youngest face, has no older cofacet.
+        No other column has that pivot, so these are paired before any
+        column addition.
+        '''
+        oldest = dict()
         for container in self.simplex_containers:
+            for row in _row_indices(container.entries).tolist():
+                oldest.setdefault(row, container.index)
+        return sum(1 for container in self.simplex_containers
+                   if len(container.entries) and
+                   oldest[_row_indices(container.entries)[-1]] ==
+                   container.index)
+
+    def _tick(self, position, chains):
+        '''
+        Writes a checkpoint if the checkpoint interval has passed.
+        '''
+        if time.time() >= self._next_checkpoint:
+            self.write_checkpoint(position, chains)
+            self._next_checkpoint = time.time() + self.checkpoint_interval
+
+    def write_checkpoint(self, position, chains=None):
+        '''
+        Writes the state of the reduction before the column position to
+        the file self.checkpoint, as an uncompressed .npz archive of plain
+        arrays: the filtration (vertex coordinates, simplices by vertex
+        and weights), the reduced columns before position, from whose
+        pivots the pivot map is rebuilt, and the chains of the V matrix if
+        representatives are recorded. The file is replaced atomically, so
+        an interrupted write leaves the previous checkpoint intact.
+        '''
+        if self._filtration is None:
+            self._filtration = self._pack_filtration()
+        point_index, point_coords, bounds, vertices, weights = \
+            self._filtration
+        columns = [(_row_indices(c.entries), c.coefficients)
+                   for c in self.simplex_containers[:position]]
+        column_indptr, column_rows, column_values = _pack(columns)
+        keys = sorted(chains) if chains is not None else []
+        chain_indptr, chain_rows, chain_values = _pack(
+            [(_row_indices(chains[k][0]), chains[k][1])
+             if self.coefficient != 2 else (_row_indices(chains[k]), None)
+             for k in keys])
+        threshold = self.representative_threshold
+        temporary = self.checkpoint + '.tmp'
+        with open(temporary, 'wb') as output:
+            np.savez(output,
+                     version=np.int64(1),
+                     coefficient=np.int64(self.coefficient),
+                     max_dimension=np.int64(self.max_dimension),
+                     representative_threshold=np.float64(
+                         np.nan if threshold is None else threshold),
+                     checkpoint_interval=np.float64(self.checkpoint_interval),
+                     essential=np.bool_(self.essential),
+                     position=np.int64(position),
+                     point_index=point_index,
+                     point_coords=point_coords,
+                     simplex_indptr=bounds,
+                     simplex_vertices=vertices,
+                     simplex_weights=weights,
+                     column_indptr=column_indptr,
+                     column_rows=column_rows,
+                     column_values=column_values,
+                     chain_keys=np.array(keys, dtype=np.int64),
+                     chain_indptr=chain_indptr,
+                     chain_rows=chain_rows,
+                     chain_values=chain_values)
+        _replace(temporary, self.checkpoint)
+
+    def _pack_filtration(self):
+        '''
+        The filtration as arrays, computed once per computation.
+        '''
+        positions = dict()
+        points = []
+        vertices = []
+        lengths = []
+        for container in self.simplex_containers:
+            simplex_vertices = container.simplex.vertices()
+            for v in simplex_vertices:
+                if v not in positions:
+                    positions[v] = len(points)
+                    points.append(v)
+                vertices.append(positions[v])
+            lengths.append(len(simplex_vertices))
+        bounds = np.zeros(len(lengths) + 1, dtype=np.int64)
+        bounds[1:] = np.cumsum(lengths)
+        return (np.array([v.index() for v in points], dtype=np.int64),
+                np.array([v.coordinate() for v in points]),
+                bounds,
+                np.array(vertices, dtype=np.int64),
+                np.array([c.simplex.weight()
+                          for c in self.simplex_containers],
+                         dtype=np.float64))
+
+    def _tracks_chain(self, container, chains):
+        '''
+        Whether the reduction records the V column of a container.
+        '''
+        return chains is not None and \
+            len(container.simplex.vertices()) <= self.max_dimension + 1
+
+    def _reduce(self, chains=None, start=0):
+        '''
+        The Z/2 reduction. Columns are sets of containers and addition is
+        symmetric difference. The pivot of a column is its youngest face,
+        entries[-1].
+        '''
+        additions = 0
+        for position in range(start, len(self.simplex_containers)):
+            if self.checkpoint is not None:
+                self._tick(position, chains)
+            container = self.simplex_containers[position]
             if len(container.simplex.vertices()) != 1:
+                if self._tracks_chain(container, chains):
+                    chain = sortedcontainers.SortedSet([container])
+                else:
+                    chain = None
                 rowiszero = False
-                while container.entries[0] in self.persistence_pairs:
-                    container.entries = (
-                        container.entries ^ (
-                            self.persistence_pairs[
-                                container.entries[0]].entries))
+                while container.entries[-1] in self.persistence_pairs:
+                    other = self.persistence_pairs[container.entries[-1]]
+                    container.entries = container.entries ^ other.entries
+                    additions += 1
+                    if chain is not None:
+                        chain = chain ^ chains[other.index]
                     if len(container.entries) == 0:
                         rowiszero = True
                         break
                 if not rowiszero:
-                    self.persistence_pairs[container.entries[0]] = container
+                    self.persistence_pairs[container.entries[-1]] = container
+                    if chains is not None:
+                        chains.pop(container.entries[-1].index, None)
+                if chain is not None:
+                    chains[container.index] = chain
+        stats = current()
+        if stats is not None:
+            stats.count('column_additions', additions)
+
+    def _reduce_in_chunks(self, workers, num_chunks=None):
+        '''
+        The Z/2 reduction, done in parallel chunks. The boundary matrix is
+        handed over as index arrays, and the reduced columns of the
+        persistence pairs are read back into the containers.
+        '''
+        indptr = np.zeros(len(self.simplex_containers) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(container.entries)
+                                for container in self.simplex_containers])
+        indices = np.fromiter((face.index
+                               for container in self.simplex_containers
+                               for face in container.entries),
+                              dtype=np.int64, count=indptr[-1])
+        pivots, columns = reduce_in_chunks(indptr, indices,
+                                           workers, num_chunks)
+        for container in self.simplex_containers:
+            container.entries = sortedcontainers.SortedSet()
+        for row, column in pivots.items():
+            killer = self.simplex_containers[column]
+            killer.entries = sortedcontainers.SortedSet(
+                self.simplex_containers[i] for i in columns[column])
+            self.persistence_pairs[self.simplex_containers[row]] = killer
+
+    def _reduce_modular(self, chains=None, start=0):
+        '''
+        The Z/p reduction. Columns are sorted arrays of row indices with
+        matching arrays of coefficients in 1..p-1. To clear a pivot we
+        subtract the multiple of the earlier column with the same pivot
+        that cancels it, using a precomputed table of inverses mod p.
+        '''
+        p = self.coefficient
+        inverses = inverse_table(p)
+        # row index -> container whose pivot it is
+        pivots = dict((row.index, container) for row, container
+                      in self.persistence_pairs.items())
+        additions = 0
+        for position in range(start, len(self.simplex_containers)):
+            if self.checkpoint is not None:
+                self._tick(position, chains)
+            container = self.simplex_containers[position]
+            if len(container.simplex.vertices()) == 1:
+                continue
+            rows = container.entries
+            values = container.coefficients
+            if self._tracks_chain(container, chains):
+                chain = (np.array([container.index]), np.ones(1, np.int64))
+            else:
+                chain = None
+            while len(rows) and rows[-1] in pivots:
+                other = pivots[rows[-1]]
+                factor = values[-1] * inverses[other.coefficients[-1]] % p
+                rows, values = add_columns(rows, values,
+                                           other.entries,
+                                           -factor * other.coefficients % p,
+                                           p)
+                additions += 1
+                if chain is not None:
+                    other_rows, other_values = chains[other.index]
+                    chain = add_columns(chain[0], chain[1], other_rows,
+                                        -factor * other_values % p, p)
+            container.entries = rows
+            container.coefficients = values
+            if len(rows):
+                pivots[rows[-1]] = container
+                self.persistence_pairs[
+                    self.simplex_containers[rows[-1]]] = container
+                if chains is not None:
+                    chains.pop(rows[-1], None)
+            if chain is not None:
+                chains[container.index] = chain
+        stats = current()
+        if stats is not None:
+            stats.count('column_additions', additions)
+
+    def _collect_representatives(self, chains):
+        '''
+        Fills self.representatives from the reduced columns and, if
+        chains is not None, from the chains of the unpaired positive
+        columns, then lets the remaining chains go.
+        '''
+        self.representatives = dict()
+        for bar in self.diagram():
+            if bar['death'] - bar['birth'] <= self.representative_threshold:
+                continue
+            if bar['death_simplex'] < 0 and bar['dim'] > 0 and \
+                    chains is None:
+                continue
+            birth = self.simplex_containers[bar['birth_simplex']]
+            if bar['death_simplex'] >= 0:
+                killer = self.simplex_containers[bar['death_simplex']]
+                cycle = (killer.entries, killer.coefficients)
+            elif bar['dim'] == 0:
+                cycle = ([birth], None)
+            elif self.coefficient == 2:
+                cycle = (chains[birth.index], None)
+            else:
+                cycle = chains[birth.index]
+            if self.coefficient == 2:
+                ids = np.array([c.index for c in cycle[0]], dtype=np.int64)
+                cycle = (ids, np.ones(len(ids), dtype=np.int64))
+            elif bar['dim'] == 0:
+                cycle = (np.array([birth.index]), np.ones(1, np.int64))
+            self.representatives[birth.index] = cycle
+        if chains is not None:
+            chains.clear()
+
+    def representative(self, bar):
+        '''
+        Returns the representative cycle of a bar of self.diagram(), as a
+        pair (simplex ids, coefficients) of arrays. Raises KeyError if no
+        representative was recorded for the bar.
+        '''
+        if self.representatives is None:
+            raise KeyError('Representatives were not recorded. Pass ' +
+                           'representatives=threshold to the constructor.')
+        return self.representatives[int(bar['birth_simplex'])]
+
+    def simplex_points(self, simplex_ids):
+        '''
+        Returns the (m, k + 1) array of point indices of the vertices of
+        the given k-simplices. The indices are those of the HashPoints,
+        i.e. the positions of the points in the PointCloud.
+        '''
+        return np.array([[v.index() for v in
+                          self.simplex_containers[i].simplex.vertices()]
+                         for i in simplex_ids], dtype=np.int64)
+
+    def simplex_coordinates(self, simplex_ids):
+        '''
+        Returns the (m, k + 1, d) array of coordinates of the vertices of
+        the given k-simplices.
+        '''
+        return np.array([[v.coordinate() for v in
+                          self.simplex_containers[i].simplex.vertices()]
+                         for i in simplex_ids])
+
+    def diagram(self, include_diagonal=False):
+        '''
+        Returns the PersistenceDiagram of the computation, including the
+        infinite bars in dimensions up to max_dimension.
+        '''
+        return PersistenceDiagram.from_persistent_homology(
+            self, include_diagonal=include_diagonal)
 
     def plot_bar_code(self,
                       epsilon,
@@ -65,54 +510,20 @@ class PersistentHomology(object):
                                           hue=.1,
                                           saturation=.4,
                                           lightness=.4)
+
+        Draws the barcode of self.diagram() with one line collection per
+        dimension. See persispy.plot.plot_barcode, and plot_diagram for
+        the persistence diagram.
         '''
-        current_height = 1
-        current_dimension = 1
-        more_elements = True
-
-        fig, ax = plt.subplots(1)
-        ax.set_axis_bgcolor(background)
-
-        while more_elements:
-            more_elements = False
-            for container in self.simplex_containers:
-                if container in self.persistence_pairs:
-                    if len(container.simplex.vertices()) > current_dimension:
-                        more_elements = True
-                    if len(container.simplex.vertices()) == current_dimension:
-                        if (container.simplex.weight() !=
-                                self.persistence_pairs[container].simplex.weight()):  # noqa
-                            y_coordinate = current_height
-                            if weight:
-                                alpha = 1 - (
-                                    self.persistence_pairs[container].simplex.weight() -  # noqa
-                                    container.simplex.weight()) / epsilon
-                            else:
-                                alpha = 0
-                            rgb_values = colorsys.hls_to_rgb(
-                                (hue + len(container.simplex.vertices()) *
-                                 (3 - 5 ** .5) * .5) % 1.0,
-                                saturation,
-                                lightness)  # noqa
-                            current_height = current_height + 1
-#                             plt.plot(
-                            ax.plot(
-                                [container.simplex.weight(), self.persistence_pairs[container].simplex.weight()],  # noqa
-                                [y_coordinate, y_coordinate],
-                                color=(rgb_values[0], rgb_values[1], rgb_values[2], 1 - alpha),  # noqa
-                                linestyle='-',
-                                linewidth=thickness)
-            current_dimension = current_dimension + 1
-            current_height = current_height + 30
-
-        ax.axis([0, epsilon, 0, current_height])
-#         plt.axis([0, epsilon, 0, current_height])
+        import matplotlib.pyplot as plt
+        from persispy.plot import plot_barcode
+
+        fig = plot_barcode(self.diagram(), epsilon, hue, saturation,
+                           lightness, thickness, background, weight)
         if gui:
-            #             return fig
-            return
+            return fig
         else:
-            plt.show(fig)
-#             plt.show()
+            plt.show()
 
 
 class SimplexContainer(object):
@@ -124,16 +535,24 @@ class SimplexContainer(object):
 
     Vars:
         simplex (the corresponding weighted simplex object)
-        entries (a list of the nonzero entries in the persistent
-            homology matrix.  corresponds with a '1' in this Z/2Z
-            implementation)
+        entries (the nonzero entries of the column in the persistent
+            homology matrix. Over Z/2 this is a sorted set of simplex
+            containers, each standing for a '1'. Over Z/p it is a sorted
+            numpy array of the indices of the containers.)
+        coefficients (None over Z/2. Over Z/p, the numpy array of the
+            coefficients in 1..p-1 of the entries.)
         index (an identifying number. used for human readable output)
 
     '''
 
-    def __init__(self, sim):
+    def __init__(self, sim, coefficient=2):
         self.simplex = sim
-        self.entries = sortedcontainers.SortedSet()
+        self.coefficient = coefficient
+        if coefficient == 2:
+            self.entries = sortedcontainers.SortedSet()
+        else:
+            self.entries = np.zeros(0, dtype=np.int64)
+        self.coefficients = None
         self.index = -1
 
     def compute_entries(self, parent):
@@ -141,17 +560,30 @@ class SimplexContainer(object):
         Compute the initial values of the entries set.  for a simplex
         with vertices (1,4,6,16), the entries will be the simplex
         containers whose vertices are: (1,4,6), (1,4,16), (1,6,16),
-        (4,6,16), which are the faces of the 3-simplex.
+        (4,6,16), which are the faces of the 3-simplex. Over Z/p the
+        face that omits the i-th vertex has coefficient (-1)^i.
         '''
         if len(self.simplex.vertices()) < 2:
+            if self.coefficient != 2:
+                self.coefficients = np.zeros(0, dtype=np.int64)
             return
+        faces = []
         for index in range(len(self.simplex.vertices())):
             # Make more pythonic!
-            self.entries.add(
+            faces.append(
                 parent.vertex_dict[
                     tuple(
                         self.simplex.vertices()[:index] +
                         self.simplex.vertices()[index + 1:])])
+        if self.coefficient == 2:
+            self.entries.update(faces)
+            return
+        rows = np.array([face.index for face in faces], dtype=np.int64)
+        signs = np.where(np.arange(len(faces)) % 2,
+                         self.coefficient - 1, 1)
+        order = np.argsort(rows)
+        self.entries = rows[order]
+        self.coefficients = signs[order]
 
     def __hash__(self):
         return hash(tuple(self.simplex.vertices()))
@@ -176,3 +608,81 @@ class SimplexContainer(object):
 
     def __cmp__(self, other):
         return self.simplex.__cmp__(other.simplex)
+
+
+def is_prime(p):
+    '''
+    >>> [p for p in range(12) if is_prime(p)]
+    [2, 3, 5, 7, 11]
+    '''
+    if not isinstance(p, (int, np.integer)) or p < 2:
+        return False
+    return all(p % d for d in range(2, int(p ** .5) + 1))
+
+
+def inverse_table(p):
+    '''
+    Returns the array of multiplicative inverses mod the prime p, with
+    0 in position 0.
+
+    >>> inverse_table(5)
+    array([0, 1, 3, 2, 4])
+    '''
+    table = np.zeros(p, dtype=np.int64)
+    for a in range(1, p):
+        table[a] = pow(a, p - 2, p)
+    return table
+
+
+def add_columns(rows, values, other_rows, other_values, p):
+    '''
+    Returns the sum mod p of two sparse columns given as sorted row
+    arrays with coefficient arrays, dropping the entries that cancel.
+
+    >>> add_columns(np.array([0, 2]), np.array([1, 2]), \
+                    np.array([2, 3]), np.array([1, 1]), 3)
+    (array([0, 3]), array([1, 1]))
+    '''
+    merged, position = np.unique(np.concatenate((rows, other_rows)),
+                                 return_inverse=True)
+    sums = np.zeros(len(merged), dtype=np.int64)
+    np.add.at(sums, position, np.concatenate((values, other_values)))
+    sums %= p
+    nonzero = sums != 0
+    return merged[nonzero], sums[nonzero]
+
+
+def _row_indices(entries):
+    '''
+    The filtration indices of the entries of a column or chain.
+    '''
+    if isinstance(entries, np.ndarray):
+        return entries
+    return np.array([c.index for c in entries], dtype=np.int64)
+
+
+def _pack(columns):
+    '''
+    Packs a list of (rows, values) columns into compressed sparse column
+    arrays (indptr, rows, values). Values of None are left out, so over
+    Z/2 the values array is empty.
+
+    >>> _pack([(np.array([1, 4]), None), (np.array([2]), None)])
+    (array([0, 2, 3]), array([1, 4, 2]), array([], dtype=int64))
+    '''
+    indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(rows) for rows, _ in columns])
+    rows = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                          [rows for rows, _ in columns]).astype(np.int64)
+    values = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                            [v for _, v in columns if v is not None])
+    return indptr, rows, values.astype(np.int64)
+
+
+def _unpack(indptr, rows, values):
+    '''
+    Inverse of _pack. The values are None if none were packed.
+    '''
+    has_values = len(values) == len(rows) and len(values)
+    return [(rows[a:b], values[a:b] if has_values else None)
+            for a, b in zip(indptr[:-1].tolist(), indptr[1:].tolist())]
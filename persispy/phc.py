@@ -6,26 +6,61 @@ AUTHORS:
 Takes a variety of type string and, after solving intersections with phcpy,
 returns a persispy point cloud. We must reject equations with with variables t,
 e, E, i, I because their meanings are reserved.
+
+phcpy is imported by the functions that track paths, so this module can be
+imported, and its equations parsed, without it.
 """
 
+from collections import OrderedDict, deque
+import hashlib
+import json
+import multiprocessing
+import os
 from string import ascii_letters, digits
 
 import numpy as np
 
-from persispy.hashing import HashPoint
 from persispy.point_cloud import PointCloud
-
-from phcpy.solver import total_degree_start_system, total_degree
-from phcpy.trackers import track
-from phcpy.solutions import strsol2dict  # points
+from persispy.rng import random_state, seed_sequence
 
 DEBUG = False
 
+# A task of a parallel Intersect tracks this many random slices, and each
+# worker is kept busy with this many tasks in flight.
+SLICES_PER_TASK = 8
+TASKS_PER_WORKER = 2
+
+# The number of equations whose setup is kept by cached_setup.
+CACHE_SIZE = 64
+_CACHE = OrderedDict()
+
+_replace = getattr(os, 'replace', os.rename)
+
 
 class Intersect(object):
     """
     We take an equation that is, in general, of the form
     A*x^2 + B*x + C = 0 and return a PointCloud on that variety.
+
+    Every point is found by intersecting the variety with a random linear
+    slice and tracking the solutions of the square system from a total
+    degree start system. The slices are independent, so with workers > 1
+    they are tracked by a pool of worker processes, SLICES_PER_TASK at a
+    time. The real solutions are collected in the order the tasks were
+    submitted, and the pool is stopped as soon as there are num_points
+    of them; each task draws its slices from its own stream spawned from
+    seed, so the points depend on the seed but not on the number of
+    workers.
+
+    The parsed equation and the start system depend only on the
+    equation, and are shared by all instances through cached_setup. Pass
+    cache_directory to keep them on disk between sessions too.
+
+    The points are collected in a preallocated (num_points, d) array:
+    float64, keeping only the solutions within complex_threshold of being
+    real and inside the bounds, or complex128 holding every solution with
+    return_complex. Calling the instance returns a PointCloud backed by
+    that array.
     """
 
     def __init__(self,
@@ -34,35 +69,83 @@ class Intersect(object):
                  bounds=10,
                  return_complex=False,
                  coefficient_distribution='normal',
-                 intersect_constant=False):
+                 intersect_constant=False,
+                 workers=None,
+                 seed=None,
+                 cache_directory=None):
         self._bounds = bounds
         self._failure = num_points
         self._coefficient_distribution = coefficient_distribution
         self._intersect_constant = intersect_constant
         self.complex_threshold = 0.1
         self.eqn = eqn
-        self.varlist, self.coefflist = parse(eqn)
-        self.points = []
+        varlist, coefflist, startsystem, startsol = \
+            cached_setup(eqn, cache_directory)
+        self.varlist, self.coefflist = list(varlist), list(coefflist)
+        self._startsystem, self._startsol = startsystem, startsol
+        self._array = np.empty((num_points, len(self.varlist)),
+                               dtype=complex if return_complex
+                               else np.float64)
+        self._count = 0
 
         if DEBUG:
             self.attempt = 0
 
-#         self._startsystem, self._startsol = self._start_system()
+        if workers is not None and workers > 1:
+            self._track_in_parallel(num_points, return_complex, workers,
+                                    seed)
+            self.__call__()
+            return
+
         partition = 256
         i = 0
         while i < num_points // partition:
-            self._startsystem, self._startsol = self._start_system()
             self.find_more_points(partition, return_complex)
             i = i + 1
 
-        self._startsystem, self._startsol = self._start_system()
-        self.find_more_points(num_points - len(self.points), return_complex)
+        self.find_more_points(num_points - self._count, return_complex)
         self.__call__()
 
+    @property
+    def points(self):
+        """
+        The (n, d) array of the points found so far.
+        """
+        return self._array[:self._count]
+
+    def _reserve(self, num_points, return_complex):
+        """
+        We make room for num_points more points.
+        """
+        size = self._count + num_points
+        dtype = complex if return_complex else self._array.dtype
+        if size > len(self._array) or dtype != self._array.dtype:
+            array = np.empty((max(size, 2 * len(self._array)),
+                              len(self.varlist)), dtype=dtype)
+            array[:self._count] = self.points
+            self._array = array
+        return size
+
+    def _append(self, found, target):
+        """
+        We store the found points, up to a total of target.
+        """
+        found = found[:target - self._count]
+        self._array[self._count:self._count + len(found)] = found
+        self._count = self._count + len(found)
+
+    def _options(self):
+        """
+        The options of the random slices.
+        """
+        return (self._bounds, self._coefficient_distribution,
+                self._intersect_constant)
+
     def degree(self):
         """
         We return the degree of the system.
         """
+        from phcpy.solver import total_degree
         return total_degree(self._system())
 
     def _system(self):
@@ -71,11 +154,8 @@ class Intersect(object):
         equal to the number of eqations. The resulting points are
         regular and bounded by the variety.
         """
-        phceqn = self.eqn + ";"
-        phcsystem = [phceqn]
-        for _ in range(len(self.varlist) - 1):
-            phcsystem.append(self._intersect())
-        return phcsystem
+        return _square_system(self.eqn, self.varlist, self._options(),
+                              np.random)
 
     def _intersect(self):
         """
@@ -84,84 +164,58 @@ class Intersect(object):
         intersects must be of the same dimension as the variety to
         prevent a overdetermined system (which phc doesn't do nicely)
         """
-        bounds = self._bounds
-        coefficient_distribution = self._coefficient_distribution
-        constant = self._intersect_constant
-
-        if coefficient_distribution == 'rejection':
-            def normalize(x):
-                "Normalizes the point"
-                return (1 / np.sqrt(sum(x * x))) * x
-            randomlist = [None]
-            while not all(randomlist):
-                pt = 2 * np.random.random(size=len(self.varlist)) - 1
-                if np.sqrt(sum(pt * pt)) <= 1:
-                    randomlist = normalize(pt)
-        if coefficient_distribution == 'normal':
-            randomlist = np.random.normal(scale=bounds, size=len(self.varlist))
-        elif coefficient_distribution == 'uniform':
-            randomlist = np.random.uniform(high=bounds, low=0,
-                                           size=len(self.varlist))
-        intersect = []
-        for i, var in enumerate(self.varlist):
-            intersect.append(str(randomlist[i]) + " * " + var)
-            if i < len(self.varlist) - 1:
-                intersect.append(" + ")
-            elif constant:
-                intersect.append(" + " + str(randomlist[i]))
-        intersect.append(";")
-        intersect = "".join(intersect)
-        return intersect
-
-    def _start_system(self):
-        """
-        We first set up a start system so phcpy doesn't have to create
-        a new one everytime.
-        """
-        phcsystem = self._system()
-        startsystem, startsol = total_degree_start_system(phcsystem)
-        return startsystem, startsol
+        return _slice(self.varlist, self._options(), np.random)
 
     def find_more_points(self, num_points, return_complex=False):
         """
         We find additional points on the variety.
         """
-        points = []
+        from phcpy.trackers import track
+        target = self._reserve(num_points, return_complex)
         failure = 0
-        while(len(points) < num_points):
+        while(self._count < target):
             phcsystem = self._system()
             phcsolutions = track(phcsystem, self._startsystem, self._startsol)
-
-            #  Parsing the output of solutions
-            for sol in phcsolutions:
-                solutiondict = strsol2dict(sol)
-
-                point = [solutiondict[variable] for variable in self.varlist]
-                if return_complex:
-                    points.append(tuple(point))
-                else:
-                    closeness = True
-                    for component in point:
-                        # choses the points we want
-                        if self._is_close(component.imag) \
-                                and self._in_bounds(component.real):
-                            # sometimes phcpy gives more points than we
-                            # ask, thus the additional check
-                            if component == point[-1] \
-                                    and closeness \
-                                    and len(points) < num_points:
-                                points.append(tuple(
-                                    [component.real for component in point]))
-                                assert len(points) <= num_points
-                                failure = 0
-                        else:
-                            closeness = False
-                            failure = failure + 1
+            found, rejected = _solution_points(phcsolutions,
+                                               self.varlist,
+                                               self.complex_threshold,
+                                               self._bounds,
+                                               return_complex)
+            # sometimes phcpy gives more points than we ask
+            self._append(found, target)
+            failure = 0 if len(found) else failure + rejected
             if self._failure <= failure:
                 raise RuntimeError(
                     "equation has too many complex solutions in a row")
 
-        self.points = points + self.points
+    def _track_in_parallel(self, num_points, return_complex, workers, seed):
+        """
+        We track slices in a pool of worker processes until num_points
+        points are found. See the class docstring.
+        """
+        target = self._reserve(num_points, return_complex)
+        state = (self.eqn, self.varlist, self._options(),
+                 self.complex_threshold, return_complex,
+                 (self._startsystem, self._startsol))
+        parent = seed_sequence(seed)
+        failure = 0
+        pending = deque()
+        pool = multiprocessing.Pool(workers, _init_worker, state)
+        try:
+            while self._count < target:
+                while len(pending) < TASKS_PER_WORKER * workers:
+                    pending.append(pool.apply_async(_track_slices,
+                                                    (parent.spawn(1)[0],)))
+                found, rejected = pending.popleft().get()
+                self._append(found, target)
+                failure = 0 if len(found) else failure + rejected
+                if self._failure <= failure:
+                    raise RuntimeError(
+                        "equation has too many complex solutions in a row")
+        finally:
+            # The tasks still in flight are not needed.
+            pool.terminate()
+            pool.join()
 
     def _is_close(self, number):
         """
@@ -185,27 +239,14 @@ class Intersect(object):
             return False
 
     def __call__(self):
-        cloudpoints = []
-        i = 0
-        for coord in self.points:
-            cloudpoints.append(
-                HashPoint(
-                    np.array(
-                        coord,
-                        dtype=complex
-                    ),
-                    index=i
-                )
-            )
-            i = i + 1
-        self.pointcloud = PointCloud(cloudpoints)
+        self.pointcloud = PointCloud(self.points)
         return self.pointcloud
 
     def __repr__(self):
         return self.points.__repr__()
 
     def __len__(self):
-        return len(self.points)
+        return self._count
 
     def __getitem__(self, key):
         return self.points[key]
@@ -220,6 +261,187 @@ class Intersect(object):
             raise
 
 
+def _slice(varlist, options, rng):
+    """
+    We return a random linear equation in the variables, as a phcpy
+    string. The options are (bounds, coefficient_distribution,
+    intersect_constant) and rng is a numpy random state.
+    """
+    bounds, coefficient_distribution, constant = options
+
+    if coefficient_distribution == 'rejection':
+        def normalize(x):
+            "Normalizes the point"
+            return (1 / np.sqrt(sum(x * x))) * x
+        randomlist = [None]
+        while not all(randomlist):
+            pt = 2 * rng.random(size=len(varlist)) - 1
+            if np.sqrt(sum(pt * pt)) <= 1:
+                randomlist = normalize(pt)
+    if coefficient_distribution == 'normal':
+        randomlist = rng.normal(scale=bounds, size=len(varlist))
+    elif coefficient_distribution == 'uniform':
+        randomlist = rng.uniform(high=bounds, low=0, size=len(varlist))
+    intersect = []
+    for i, var in enumerate(varlist):
+        intersect.append(str(randomlist[i]) + " * " + var)
+        if i < len(varlist) - 1:
+            intersect.append(" + ")
+        elif constant:
+            intersect.append(" + " + str(randomlist[i]))
+    intersect.append(";")
+    intersect = "".join(intersect)
+    return intersect
+
+
+def _square_system(eqn, varlist, options, rng):
+    """
+    We return the equation together with len(varlist) - 1 random slices.
+    """
+    phcsystem = [eqn + ";"]
+    for _ in range(len(varlist) - 1):
+        phcsystem.append(_slice(varlist, options, rng))
+    return phcsystem
+
+
+def _solution_points(phcsolutions, varlist, threshold, bounds,
+                     return_complex):
+    """
+    We parse the output of phcpy. Returns the (n, d) array of points,
+    with coordinates in the order of varlist, and the number of solutions
+    rejected for being complex or out of bounds. Solutions are kept if
+    every coordinate has imaginary part at most threshold and real part in
+    [-bounds, bounds], as real points, or all of them as complex points
+    with return_complex.
+    """
+    from phcpy.solutions import strsol2dict
+    solutions = [strsol2dict(sol) for sol in phcsolutions]
+    solutions = np.array([[solutiondict[variable] for variable in varlist]
+                          for solutiondict in solutions],
+                         dtype=complex).reshape(-1, len(varlist))
+    if return_complex:
+        return solutions, 0
+    if bounds:
+        keep = (np.abs(solutions.imag) <= threshold).all(axis=1) & \
+            (np.abs(solutions.real) <= bounds).all(axis=1)
+    else:
+        keep = np.zeros(len(solutions), dtype=bool)
+    return solutions.real[keep], len(solutions) - int(keep.sum())
+
+
+def cached_setup(eqn, directory=None):
+    """
+    Returns (varlist, coefflist, startsystem, startsol) for the equation:
+    its parse() and a total degree start system with its solutions. The
+    linear slices do not change the degrees, so the start system serves
+    every Intersect of the equation.
+
+    The results are kept for the CACHE_SIZE most recently used equations.
+    With a directory they are also written there as json, one file per
+    equation, and read back by later sessions. The returned lists are
+    shared, and must not be modified.
+    """
+    path = None
+    if directory is not None:
+        path = os.path.join(directory,
+                            hashlib.sha1(eqn.encode('utf-8')).hexdigest() +
+                            '.json')
+    if eqn in _CACHE:
+        entry = _CACHE.pop(eqn)
+        _CACHE[eqn] = entry
+        if path is not None and not os.path.exists(path):
+            _write_setup(path, eqn, entry)
+        return entry
+    entry = None
+    if path is not None:
+        if os.path.exists(path):
+            with open(path) as stream:
+                data = json.load(stream)
+            if data['equation'] == eqn:
+                entry = (data['varlist'], data['coefflist'],
+                         data['startsystem'], data['startsol'])
+    if entry is None:
+        from phcpy.solver import total_degree_start_system
+        varlist, coefflist = parse(eqn)
+        startsystem, startsol = total_degree_start_system(
+            _square_system(eqn, varlist, (1, 'normal', False), np.random))
+        entry = (varlist, coefflist, list(startsystem), list(startsol))
+        if path is not None:
+            _write_setup(path, eqn, entry)
+    _CACHE[eqn] = entry
+    while len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return entry
+
+
+def _write_setup(path, eqn, entry):
+    """
+    Writes an entry of cached_setup to path as json, atomically.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as stream:
+        json.dump({'equation': eqn,
+                   'varlist': entry[0],
+                   'coefflist': entry[1],
+                   'startsystem': entry[2],
+                   'startsol': entry[3]}, stream)
+    _replace(temporary, path)
+
+
+def clear_cache():
+    """
+    Empties the in-memory cache of cached_setup. Files on disk are kept.
+    """
+    _CACHE.clear()
+
+
+# The state of the worker processes of a parallel Intersect: the equation,
+# the slice options and the start system.
+_WORKER = {}
+
+
+def _init_worker(eqn, varlist, options, threshold, return_complex, start):
+    _WORKER['eqn'] = eqn
+    _WORKER['varlist'] = varlist
+    _WORKER['options'] = options
+    _WORKER['threshold'] = threshold
+    _WORKER['return_complex'] = return_complex
+    _WORKER['start'] = start
+
+
+def _track_slices(seed):
+    """
+    Worker task: tracks SLICES_PER_TASK random slices drawn from seed.
+    Returns the points found and the number of rejected solutions.
+
+    The gamma constant of each homotopy is drawn from seed too: left to
+    phcpy it is random, and the points would depend on the process that
+    tracked them.
+    """
+    from phcpy.trackers import track
+    rng = random_state(seed)
+    startsystem, startsol = _WORKER['start']
+    points = []
+    rejected = 0
+    for _ in range(SLICES_PER_TASK):
+        phcsystem = _square_system(_WORKER['eqn'], _WORKER['varlist'],
+                                   _WORKER['options'], rng)
+        angle = rng.uniform(0, 2 * np.pi)
+        solutions = track(phcsystem, startsystem, startsol,
+                          gamma=complex(np.cos(angle), np.sin(angle)))
+        found, bad = _solution_points(solutions,
+                                      _WORKER['varlist'],
+                                      _WORKER['threshold'],
+                                      _WORKER['options'][0],
+                                      _WORKER['return_complex'])
+        points.append(found)
+        rejected = rejected + bad
+    return np.concatenate(points), rejected
+
+
 def parse(eqn): #noqa - too many branches
     """
     We parse the equation string into phcpy input.
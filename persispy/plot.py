@@ -6,35 +6,133 @@ AUTHORS:
 
 input: pointCloud OR
     wGraph
+
+With a non-interactive matplotlib backend such as Agg, or after
+set_headless(), no Tk window is made and every plotting function returns
+its figure instead of showing it. render and render_many write figures
+to files; render draws on figures of their own Agg canvas, leaving the
+pyplot backend and figures of the caller alone, and render_many draws in
+a pool of headless worker processes.
 """
 
+import colorsys
+import itertools
+import multiprocessing
+import os
+import sys
+
 import numpy as np
 # import time
 
-from matplotlib.backends.backend_tkagg \
-    import FigureCanvasTkAgg, NavigationToolbar2TkAgg
 import mpl_toolkits.mplot3d as a3
-from mpl_toolkits.mplot3d import Axes3D
+from persispy.persistence_diagram import PersistenceDiagram, as_intervals
+from persispy.persistent_homology import PersistentHomology
 from persispy.point_cloud import PointCloud
+from persispy.rng import random_state
 from persispy.weighted_simplicial_complex import wGraph
-try:  # python3
-    import tkinter as tk
-except ImportError:  # python2
-    import Tkinter as tk
-try:
-    from persispy.phc import Intersect
-except ImportError:
-    Intersect = type("None", (object,), {"None": None})
-    print("PHCpy is not currently installed. PHC functions are unavailable.")
 import matplotlib.pyplot as plt  #noqa - ignore module import level
 import matplotlib as mpl  #noqa - ignore module import level
 
+# Graphs with more edges than this are drawn with a random sample of
+# MAX_EDGES of their edges.
+MAX_EDGES = 200000
+
+# Backends that cannot show windows.
+NON_INTERACTIVE = ('agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template')
+
+# on: set by set_headless(). render: inside a render() call.
+_HEADLESS = {'on': False, 'render': False}
+
+
+def set_headless(headless=True):
+    """
+    Switches pyplot to the Agg backend, so that figures can be made and
+    saved on machines without a display, and plotting functions return
+    their figures instead of showing them.
+    """
+    _HEADLESS['on'] = headless
+    if headless:
+        plt.switch_backend('Agg')
+
+
+def is_headless():
+    """
+    Whether figures are returned rather than shown: after set_headless(),
+    or whenever the pyplot backend is non-interactive.
+    """
+    return _HEADLESS['on'] or _HEADLESS['render'] or \
+        mpl.get_backend().lower() in NON_INTERACTIVE
+
+
+def _new_figure(**kwargs):
+    """
+    We return a new pyplot figure, or inside render() a figure on an Agg
+    canvas of its own, which pyplot does not know about.
+    """
+    if not _HEADLESS['render']:
+        return plt.figure(**kwargs)
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
 
-def create_fig():
+def _finish(fig, gui, window=None):
+    """
+    We return the figure with gui or in headless mode, and otherwise show
+    it, in the Tk window if there is one.
+    """
+    if gui or is_headless():
+        return fig
+    if window is None:
+        plt.show()
+    else:
+        show(window)
+
+
+def _tk():
+    """
+    We import Tk and its matplotlib backend only when a window is made,
+    so that plotting works on machines without Tk. Returns the tkinter
+    module, the canvas class and the toolbar class.
+    """
+    try:  # python3
+        import tkinter as tk
+    except ImportError:  # python2
+        import Tkinter as tk
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    try:
+        from matplotlib.backends.backend_tkagg import NavigationToolbar2Tk
+    except ImportError:  # matplotlib before 2.2
+        from matplotlib.backends.backend_tkagg \
+            import NavigationToolbar2TkAgg as NavigationToolbar2Tk
+    return tk, FigureCanvasTkAgg, NavigationToolbar2Tk
+
+
+def _is_cloud(item):
+    """
+    Whether item is a PointCloud or a persispy.phc.Intersect. The latter
+    can only exist if persispy.phc, and so phcpy, was imported.
+    """
+    phc = sys.modules.get('persispy.phc')
+    return isinstance(item, PointCloud) or \
+        (phc is not None and isinstance(item, phc.Intersect))
+
+
+def create_fig(title=None):
     """
     We make calls to the backend so we can handle displaying the figures
-    themselves.
+    themselves. Returns the figure and the Tk window, or None for the
+    window in headless mode.
     """
+    if is_headless():
+        fig = _new_figure()
+        if title:
+            fig.suptitle(title)
+        return fig, None
+
+    tk, FigureCanvasTkAgg, NavigationToolbar2Tk = _tk()
 
     def destroy():
         """
@@ -60,9 +158,11 @@ def create_fig():
     canvas = FigureCanvasTkAgg(fig, master=frame)
     canvas.get_tk_widget().pack(side='top', fill='both', expand=1)
     canvas._tkcanvas.pack(side='top', fill='both', expand=1)  #noqa - tkinter
-    toolbar = NavigationToolbar2TkAgg(canvas, root)
+    toolbar = NavigationToolbar2Tk(canvas, root)
     toolbar.update()
     toolbar.pack()
+    if title:
+        root.wm_title(title)
     return fig, root
 
 
@@ -77,7 +177,7 @@ def get_canvas(root):
             children.extend(child.winfo_children())
 
     for child in children:
-        if isinstance(child, NavigationToolbar2TkAgg):
+        if isinstance(child, _tk()[2]):
             return child
 
     assert False, "No Canvas in root"
@@ -99,7 +199,7 @@ def plot2d(*args, **kwargs):
     We call different methods depending on what instance is being passed.
     """
     for item in args:
-        if isinstance(item, PointCloud) or isinstance(item, Intersect):
+        if _is_cloud(item):
             fig = plot2d_pc(*args, **kwargs)
             return fig
         if isinstance(item, wGraph):
@@ -111,22 +211,130 @@ def plot3d(*args, **kwargs):
     We call different methods depending on what instance is being passed.
     """
     for item in args:
-        if isinstance(item, PointCloud) or isinstance(item, Intersect):
+        if _is_cloud(item):
             return plot3d_pc(*args, **kwargs)
         if isinstance(item, wGraph):
             return plot3d_ng(*args, **kwargs)
 
 
-def plot2d_pc(pointCloud, gui=False):
+# Clouds with more points than this are drawn as a density by plot2d_pc
+# and plot3d_pc.
+DENSITY_POINTS = 100000
+
+
+def coordinate_bounds(array, chunk_size=2 ** 20):
+    """
+    Returns the (d, 2) array of the (min, max) of every column, reading
+    chunk_size rows at a time.
+
+    >>> coordinate_bounds(np.array([[0, 5], [2, -1]]), chunk_size=1)
+    array([[ 0.,  2.],
+           [-1.,  5.]])
+    """
+    bounds = np.empty((array.shape[1], 2))
+    bounds[:, 0], bounds[:, 1] = np.inf, -np.inf
+    for start in range(0, len(array), chunk_size):
+        chunk = np.asarray(array[start:start + chunk_size])
+        bounds[:, 0] = np.minimum(bounds[:, 0], chunk.min(axis=0))
+        bounds[:, 1] = np.maximum(bounds[:, 1], chunk.max(axis=0))
+    return bounds
+
+
+def density_grids(array,
+                  projections=((0, 1),),
+                  bins=256,
+                  bounds=None,
+                  chunk_size=2 ** 20):
     """
-    We plot a plot cloud.
+    Returns (counts, bounds): the (len(projections), bins, bins) array of
+    the numbers of points in every cell of a grid over each projection on
+    two coordinates, and the (d, 2) bounds of the grids. The first index
+    of a grid runs along the first coordinate of its projection.
+
+    The rows are read chunk_size at a time, so that a memory-mapped cloud
+    (see PointCloud.from_npy) is never loaded whole, and binned like
+    np.histogram2d with one np.bincount per projection and chunk. Points
+    outside the bounds are dropped; by default the bounds are those of
+    the points, found in a first pass.
+
+    :param array: an (n, d) array, a PointCloud or a phc.Intersect.
+
+    >>> counts, _ = density_grids(np.array([[0, 0], [1, 1], [1, .9]]), \
+                                  bins=2)
+    >>> counts
+    array([[[1., 0.],
+            [0., 2.]]])
     """
+    if _is_cloud(array):
+        array = array.get_array()
+    if bounds is None:
+        bounds = coordinate_bounds(array, chunk_size)
+    bounds = np.asarray(bounds, dtype=np.float64)
+    width = np.where(bounds[:, 1] > bounds[:, 0],
+                     bounds[:, 1] - bounds[:, 0], 1)
+    counts = np.zeros((len(projections), bins * bins))
+    for start in range(0, len(array), chunk_size):
+        chunk = np.asarray(array[start:start + chunk_size], dtype=np.float64)
+        cells = np.floor((chunk - bounds[:, 0]) / width * bins)
+        inside = (chunk >= bounds[:, 0]) & (chunk <= bounds[:, 1])
+        # The upper bound belongs to the last cell.
+        cells = np.minimum(cells, bins - 1).astype(np.int64)
+        for k, (i, j) in enumerate(projections):
+            keep = inside[:, i] & inside[:, j]
+            counts[k] += np.bincount(cells[keep, i] * bins + cells[keep, j],
+                                     minlength=bins * bins)
+    return counts.reshape(len(projections), bins, bins), bounds
+
+
+def plot_density(array,
+                 projections=((0, 1),),
+                 bins=256,
+                 bounds=None,
+                 cmap=plt.cm.viridis,
+                 chunk_size=2 ** 20,
+                 title=None):
+    """
+    Draws the density_grids of a PointCloud or (n, d) array as images with
+    a logarithmic color scale, one subplot per projection. The time to
+    draw does not depend on the number of points, only binning does.
 
-    points = pointCloud.get_points()
-    xcoords = [p[0] for p in points]
-    ycoords = [p[1] for p in points]
+    Returns the figure.
+    """
+    counts, bounds = density_grids(array, projections, bins, bounds,
+                                   chunk_size)
+    fig = _new_figure(figsize=(5 * len(projections), 5))
+    axs = fig.subplots(1, len(projections), squeeze=False)
+    if title:
+        fig.suptitle(title)
+    norm = mpl.colors.LogNorm(vmin=1, vmax=max(counts.max(), 1))
+    names = 'xyzw'
+    for ax, grid, (i, j) in zip(axs[0], counts, projections):
+        ax.imshow(np.ma.masked_equal(grid.T, 0), origin='lower',
+                  extent=(bounds[i, 0], bounds[i, 1],
+                          bounds[j, 0], bounds[j, 1]),
+                  cmap=cmap, norm=norm, interpolation='nearest')
+        ax.set_xlabel(names[i] if i < len(names) else str(i))
+        ax.set_ylabel(names[j] if j < len(names) else str(j))
+    return fig
+
+
+def plot2d_pc(pointCloud, gui=False, density=None, bins=256):
+    """
+    We plot a plot cloud. With density, or by default above
+    DENSITY_POINTS points, the points are binned into a bins x bins grid
+    and drawn as an image; see plot_density.
+    """
+    if density is None:
+        density = pointCloud.size() > DENSITY_POINTS
+    if density:
+        return _finish(plot_density(pointCloud, bins=bins), gui)
 
-    fig, ax = plt.subplots(1)
+    points = pointCloud.get_array()
+    xcoords = points[:, 0]
+    ycoords = points[:, 1]
+
+    fig = _new_figure()
+    ax = fig.add_subplot(1, 1, 1)
     ax.scatter(xcoords, ycoords, marker='o', color="#ff6666")
 
     ax.grid(True)
@@ -144,10 +352,7 @@ def plot2d_pc(pointCloud, gui=False):
 # what do?
 #     plt.setp([a.get_xticklabels() for a in fig.axes[:-1]], visible=False)
 
-    if gui:
-        return fig
-    else:
-        plt.show(fig)
+    return _finish(fig, gui)
 
 
 def plot2d_ng(wGraph,
@@ -157,16 +362,19 @@ def plot2d_ng(wGraph,
               method='subdivision',
               title="2D Neighborhood Graph",
               gui=False,
-              cmap=0):
+              cmap=0,
+              max_edges=MAX_EDGES):
     """
     We plot the 2d neighborhood graph, taking the axes to shade on.
+    Graphs with more than max_edges edges are drawn with a random sample
+    of max_edges edges. See plot_edges.
     """
     if shading_style == 'axes':
-        color_by_ax(wGraph, axes, shading_axis, method,
-                    title, gui)
+        return color_by_ax(wGraph, axes, shading_axis, method,
+                           title, gui, max_edges)
     elif shading_style == 'component':
-        color_by_component(wGraph, axes, cmap, method,
-                           title, gui)
+        return color_by_component(wGraph, axes, cmap, method,
+                                  title, gui, max_edges)
 
 
 def pick_ax(coords, axes):
@@ -179,170 +387,327 @@ def pick_ax(coords, axes):
     return tuple(point)
 
 
-def color_by_ax(wGraph, axes, shading_axis, method, title, gui):
+def color_by_ax(wGraph, axes, shading_axis, method, title, gui,
+                max_edges=MAX_EDGES):
     """
     We color the graph by applying a gradient to an axis.
     """
-    points = wGraph.get_points()
-
-    # For the two plotting directions
-    minx = min(p[0] for p in points)
-    maxx = max(p[0] for p in points)
-    miny = min(p[1] for p in points)
-    maxy = max(p[1] for p in points)
-
-    # For the shading direction
-
-    minz = min(p[shading_axis] for p in points)
-    maxz = max(p[shading_axis] for p in points)
-
-    adjacency = wGraph.adjacencies()
-    edges = []
-    colors = []
-    x, y, pointcolors = [], [], []
-    for p in adjacency:
-        if p[shading_axis] <= minz + (maxz - minz) / 2:
-            px, py = pick_ax(p, axes)
-            for e in adjacency[p]:
-                qx, qy = pick_ax(e[0], axes)
-                edges.append([
-                    [qx, qy],
-                    [px, py]])
-
-                colors.append(((p[shading_axis] - minz) / (maxz - minz),
-                               .5, .5, .5))
-            x.append(px)
-            y.append(py)
-            pointcolors.append(
-                ((p[shading_axis] - minz) / (maxz - minz), .5, .5, .5))
-
-        elif p[shading_axis] >= minz + (maxz - minz) / 2:
-            px, py = pick_ax(p, axes)
-            for e in adjacency[p]:
-                qx, qy = pick_ax(e[0], axes)
-                edges.append([
-                    [qx, qy],
-                    [px, py]])
-
-                colors.append(((p[shading_axis] - minz) / (maxz - minz),
-                               .5, .5, .5))
-
-            x.append(px)
-            y.append(py)
-            pointcolors.append(
-                ((p[shading_axis] - minz) / (maxz - minz), .5, .5, .5))
-
-    lines = mpl.collections.LineCollection(edges, color=colors)
-
-    fig, ax = plt.subplots(1)
-
-#     fig = Figure()
-#     ax = fig.add_subplot(111)
-    ax.add_collection(lines)
+    coordinates = wGraph.vertex_coordinates()
+    shade = coordinates[:, shading_axis]
+    low, high = shade.min(), shade.max()
+    shade = (shade - low) / (high - low if high > low else 1)
+    colors = np.column_stack((shade, np.full((len(shade), 3), .5)))
+
+    fig = plot_edges(coordinates, wGraph.edge_pairs(), colors=colors,
+                     axes=axes, max_edges=max_edges, title=title)
     fig.set_size_inches(10.0, 10.0)
-    if title:
-        fig.suptitle(title)
+    ax = fig.axes[0]
     ax.grid(True)
-    ax.axis(
-        [minx - .1 * abs(maxx - minx),
-         maxx + .1 * abs(maxx - minx),
-         miny - .1 * abs(maxy - miny),
-         maxy + .1 * abs(maxy - miny)])
+    ax.scatter(*coordinates[:, list(axes)].T, marker='o', color=colors,
+               zorder=3)
 
-    ax.set_aspect('equal')
+    return _finish(fig, gui)
 
-#     x, y = pick_ax(zip(*wGraph.vertices()))
-    ax.scatter(x, y, marker='o', color=pointcolors, zorder=len(x))
 
-    if gui:
-        return fig
-    else:
-        plt.show(fig)
+def _summary(num_points, epsilon, num_edges, num_components):
+    """
+    The legend text of a neighborhood graph. Plain text, so that no TeX
+    is run.
+    """
+    return '%d Number of Points\n%.3f Distance\n%d Edges\n' \
+        '%d Connected Components' % (num_points, epsilon, num_edges,
+                                     num_components)
 
 
 def pick_ax_edge(component, axes):
-    selected_axes = []
-    for edge in component:
-        endpoint1 = []
-        endpoint2 = []
-        for ax in axes:
-            endpoint1.append(edge[0][ax])
-            endpoint2.append(edge[1][ax])
-        selected_axes.append((endpoint1, endpoint2))
-    return selected_axes
-
-
-def color_by_component(wGraph, axes, cmap, method, title, gui):
-
-    plt.rc('text', usetex=True)
-    plt.rc('font', family='sans-serif: Computer Modern Sans serif')
-    plt.axis('off')
-
-#     fig = plt.figure()
-    fig, window = create_fig()
-    window.wm_title(title)
-    ax = fig.add_subplot(1, 1, 1)
-    epsilon = wGraph.epsilon()
-    adj = wGraph.adjacencies()
-    cp = wGraph.connected_components()
-    cmaps = [plt.cm.Dark2, plt.cm.Accent, plt.cm.Paired,
-             plt.cm.rainbow, plt.cm.winter]
-    cmap = cmaps[cmap]  # color mappings
-    line_colors = cmap(np.linspace(0, 1, len(cp)))
-    line_colors = line_colors[::-1]
+    '''
+    Selects the given axes of an (m, 2, d) array of edge endpoints.
+    '''
+    return np.asarray(component)[:, :, list(axes)]
 
-    # [0, 0.1, 0.2 ... 1 ]
 
-    ce = wGraph.connected_edges()
-    ce.sort(key=len)
+def decimate(num_edges, max_edges=MAX_EDGES, rng=None):
+    """
+    Returns the sorted indices of the edges to draw: all of them, or a
+    random sample of max_edges of them if there are more. max_edges=None
+    keeps every edge.
+
+    >>> decimate(5)
+    array([0, 1, 2, 3, 4])
+    >>> len(decimate(10 ** 6, 1000, rng=0))
+    1000
+    """
+    if max_edges is None or num_edges <= max_edges:
+        return np.arange(num_edges)
+    return np.sort(random_state(rng).choice(num_edges, max_edges,
+                                            replace=False))
 
-    componentIndex = -1
-    for componentIndex, component in enumerate(ce):
 
-        #         scalar = float(len(component)) / numberEdges + 1
-        #         tempcomponent = []
-        #         for i, edge in enumerate(component):
-        #             tempcomponent.append(edge*scalar)
-        #         component = set(tempcomponent)
+def component_colors(labels, cmap=plt.cm.rainbow):
+    """
+    Returns the (n, 4) array of the colors of vertices with the given
+    component labels. The components are spread over the colormap by
+    size, largest first.
+    """
+    labels = np.asarray(labels)
+    sizes = np.bincount(labels)
+    rank = np.empty(len(sizes), dtype=np.int64)
+    rank[np.argsort(-sizes, kind='mergesort')] = np.arange(len(sizes))
+    return cmap(np.linspace(0, 1, max(len(sizes), 1)))[rank[labels]]
 
-        component = pick_ax_edge(component, axes)
-        lines = mpl.collections.LineCollection(component)
 
-#         if componentIndex % 2 == 1:
-#
-#             componentIndex = -1 * componentIndex
-        lines.set_edgecolor(line_colors[componentIndex])
-        ax.add_collection(lines)
-
-    componentIndex += 1
-
-    if wGraph.singletons():
-        x, y = zip(*[pick_ax(point, axes) for point in wGraph.singletons()])
-        ax.scatter(x, y,
-                   marker='.',
-                   s=15,
-                   color=line_colors[componentIndex:],
-                   label=r"\makebox[90pt]{%d\hfill}Singletons" % len(x))
-
-    textstr = r'\noindent\makebox[90pt]{%d\hfill}Number of Points\\ \\'\
-        r'\makebox[90pt]{%.3f\hfill}Distance\\ \\'\
-        r'\makebox[90pt]{%d\hfill}Edges\\ \\'\
-        r'\makebox[90pt]{%d\hfill}Connected Components' \
-        % (len(adj), epsilon, wGraph.num_edges(), len(cp))
-
-    minx = min([coord[0] for coord in list(adj.keys())])
-    maxx = max([coord[0] for coord in list(adj.keys())])
-    miny = min([coord[1] for coord in list(adj.keys())])
-    maxy = max([coord[1] for coord in list(adj.keys())])
-
-    xpadding = abs(minx - maxx) * 0.1
-    ypadding = abs(miny - maxy) * 0.1
-    ax.set_xlim(minx - xpadding,
-                maxx + xpadding)
-    ax.set_ylim(miny - ypadding,
-                maxy + ypadding)
+def edge_collection(coordinates, pairs, colors, axes=(0, 1), **kwargs):
+    """
+    Returns one LineCollection, or Line3DCollection for three axes, of the
+    edges given by an (m, 2) array of index pairs into the (n, d) array of
+    coordinates. colors is a single color or an (m, 4) array.
+    """
+    segments = np.asarray(coordinates)[:, list(axes)][pairs]
+    if len(axes) == 3:
+        return a3.art3d.Line3DCollection(segments, colors=colors, **kwargs)
+    return mpl.collections.LineCollection(segments, colors=colors, **kwargs)
+
 
+def _limits(coordinates, padding=.1):
+    """
+    Returns the (low, high) bounds of every column, widened by padding
+    times the range.
+    """
+    low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+    margin = padding * np.where(high > low, high - low, 1)
+    return low - margin, high + margin
+
+
+def plot_edges(coordinates,
+               pairs,
+               labels=None,
+               colors=None,
+               axes=(0, 1),
+               cmap=plt.cm.rainbow,
+               max_edges=MAX_EDGES,
+               title=None,
+               ax=None,
+               rng=None,
+               singleton_label=None):
+    """
+    Plots a graph given by arrays: the (n, d) coordinates of its vertices
+    and the (m, 2) index pairs of its edges. All edges go into a single
+    collection, so this takes about the time of the array operations even
+    for millions of edges; above max_edges a random sample of the edges
+    is drawn (see decimate). Vertices without edges are drawn as points.
+
+    :param labels: an (n,) array of component labels, colored with
+        component_colors, such as wGraph.component_labels().
+    :param colors: or an (n, 4) array of vertex colors. Edges take the
+        color of their first vertex.
+    :param axes: two or three coordinates to plot.
+    :param ax: the axes to draw in, by default those of a new figure.
+    :param str singleton_label: legend label of the isolated vertices.
+
+    Returns the figure.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    axes = list(axes)
+    if colors is None:
+        if labels is None:
+            labels = np.zeros(len(coordinates), dtype=np.int64)
+        colors = component_colors(labels, cmap)
+    if ax is None:
+        fig = _new_figure()
+        if len(axes) == 3:
+            ax = fig.add_subplot(1, 1, 1, projection='3d')
+        else:
+            ax = fig.add_subplot(1, 1, 1)
+    fig = ax.figure
+    if title:
+        fig.suptitle(title)
+
+    drawn = pairs[decimate(len(pairs), max_edges, rng)]
+    ax.add_collection(edge_collection(coordinates, drawn,
+                                      colors[drawn[:, 0]], axes))
+
+    isolated = np.ones(len(coordinates), dtype=bool)
+    isolated[pairs.ravel()] = False
+    if isolated.any():
+        ax.scatter(*coordinates[isolated][:, axes].T, marker='.', s=15,
+                   color=colors[isolated], label=singleton_label)
+
+    if len(coordinates):
+        low, high = _limits(coordinates[:, axes])
+        ax.set_xlim(low[0], high[0])
+        ax.set_ylim(low[1], high[1])
+        if len(axes) == 3:
+            ax.set_zlim(low[2], high[2])
     ax.set_aspect('equal')
+    return fig
+
+
+# Diagrams with more bars than this are drawn as a density by plot_diagram.
+DENSITY_BARS = 100000
+
+
+def _as_diagram(diagram):
+    """
+    Returns a PersistenceDiagram, made from an array of bars or from an
+    (n, 2) array of (birth, death) pairs in dimension 0 if need be.
+    """
+    if isinstance(diagram, PersistenceDiagram):
+        return diagram
+    if getattr(diagram, 'dtype', None) is not None and diagram.dtype.names:
+        return PersistenceDiagram(diagram)
+    intervals = as_intervals(diagram)
+    return PersistenceDiagram.from_arrays(np.zeros(len(intervals)),
+                                          intervals[:, 0], intervals[:, 1])
+
+
+def plot_barcode(diagram,
+                 epsilon=None,
+                 hue=0,
+                 saturation=.5,
+                 lightness=.5,
+                 thickness=2,
+                 background='none',
+                 weight=True,
+                 ax=None):
+    """
+    Draws the finite bars of a diagram, one row each, sorted by dimension
+    and birth, with a gap of 30 rows between dimensions. The bars of a
+    dimension are a single LineCollection with their colors computed as
+    an array: the hue moves by the golden ratio with every dimension, and
+    with weight the opacity of a bar is its length over epsilon.
+
+    :param diagram: a PersistenceDiagram, or an (n, 2) array of bars.
+    :param float epsilon: the right end of the plot, by default the
+        largest death.
+
+    Returns the figure.
+
+    >>> fig = plot_barcode([[0, .5], [.1, .3]], epsilon=1)
+    >>> len(fig.axes[0].collections[0].get_segments())
+    2
+    """
+    diagram = _as_diagram(diagram)
+    if epsilon is None:
+        finite = diagram.finite()['death']
+        epsilon = finite.max() if len(finite) else 1.0
+    if ax is None:
+        ax = _new_figure().add_subplot(1, 1, 1)
+    fig = ax.figure
+    ax.set_facecolor(background)
+
+    height = 1
+    for dimension in range(diagram.max_dimension() + 1):
+        bars = diagram.finite(dimension)
+        rows = height + np.arange(len(bars))
+        segments = np.empty((len(bars), 2, 2))
+        segments[:, 0, 0] = bars['birth']
+        segments[:, 1, 0] = bars['death']
+        segments[:, :, 1] = rows[:, None]
+        colors = np.empty((len(bars), 4))
+        colors[:, :3] = colorsys.hls_to_rgb(
+            (hue + (dimension + 1) * (3 - 5 ** .5) * .5) % 1.0,
+            saturation,
+            lightness)
+        if weight:
+            colors[:, 3] = np.clip((bars['death'] - bars['birth']) /
+                                   epsilon, 0, 1)
+        else:
+            colors[:, 3] = 1
+        ax.add_collection(mpl.collections.LineCollection(
+            segments, colors=colors, linewidths=thickness, linestyle='-'))
+        height = height + len(bars) + 30
+
+    ax.axis([0, epsilon, 0, height])
+    return fig
+
+
+def plot_diagram(diagram,
+                 dimension=None,
+                 density=None,
+                 bins=200,
+                 cmap=plt.cm.viridis,
+                 ax=None):
+    """
+    Draws the persistence diagram: a point (birth, death) per bar, one
+    color per dimension, the diagonal, and the infinite bars on a dashed
+    line above the finite ones.
+
+    With density, the finite bars are instead binned with np.histogram2d
+    into a bins x bins grid and drawn as one image with a logarithmic
+    color scale, which takes the same time to draw for any number of
+    bars. By default density is used above DENSITY_BARS bars.
+
+    :param diagram: a PersistenceDiagram, or an (n, 2) array of bars.
+    :param int dimension: draw only the bars of this dimension.
+
+    Returns the figure.
+
+    >>> fig = plot_diagram([[0, .5], [.1, .3], [0, np.inf]])
+    >>> len(fig.axes[0].collections)
+    2
+    """
+    diagram = _as_diagram(diagram)
+    bars = diagram.bars(dimension)
+    finite = np.isfinite(bars['death'])
+    if density is None:
+        density = len(bars) > DENSITY_BARS
+    if ax is None:
+        ax = _new_figure().add_subplot(1, 1, 1)
+    fig = ax.figure
+
+    values = np.concatenate((bars['birth'], bars['death'][finite]))
+    low = values.min() if len(values) else 0.0
+    high = values.max() if len(values) else 1.0
+    if high <= low:
+        high = low + 1.0
+    top = high + .05 * (high - low)
+
+    if density:
+        counts, xedges, yedges = np.histogram2d(
+            bars['birth'][finite], bars['death'][finite], bins=bins,
+            range=[[low, high], [low, high]])
+        ax.imshow(np.ma.masked_equal(counts.T, 0), origin='lower',
+                  extent=(low, high, low, high), cmap=cmap, aspect='auto',
+                  norm=mpl.colors.LogNorm(), interpolation='nearest')
+    else:
+        dims = np.unique(bars['dim'][finite])
+        colors = plt.cm.tab10(np.arange(len(dims)) % 10)
+        for color, dim in zip(colors, dims):
+            mask = finite & (bars['dim'] == dim)
+            ax.scatter(bars['birth'][mask], bars['death'][mask], s=8,
+                       color=color, label='H' + str(dim))
+    if (~finite).any():
+        ax.scatter(bars['birth'][~finite],
+                   np.full((~finite).sum(), top), s=8, marker='^',
+                   color='black', label='infinite')
+        ax.axhline(top, color='gray', linestyle='--', linewidth=.5)
+
+    ax.plot([low, top], [low, top], color='gray', linewidth=.5)
+    ax.set_xlim(low, top)
+    ax.set_ylim(low, top + .05 * (high - low))
+    ax.set_xlabel('birth')
+    ax.set_ylabel('death')
+    return fig
+
+
+def color_by_component(wGraph, axes, cmap, method, title, gui,
+                       max_edges=MAX_EDGES):
+
+    fig, window = create_fig(title)
+    ax = fig.add_subplot(1, 1, 1)
+    epsilon = wGraph.epsilon()
+    cmaps = [plt.cm.Dark2, plt.cm.Accent, plt.cm.Paired,
+             plt.cm.rainbow, plt.cm.winter]
+    labels = wGraph.component_labels()
+    sizes = np.bincount(labels)
+
+    plot_edges(wGraph.vertex_coordinates(), wGraph.edge_pairs(),
+               labels=labels, axes=axes, cmap=cmaps[cmap],
+               max_edges=max_edges, ax=ax,
+               singleton_label='%d Singletons' % (sizes == 1).sum())
+
+    textstr = _summary(len(labels), epsilon, wGraph.num_edges(), len(sizes))
 
     ax.plot([0], [0], color='white', label=textstr)
 
@@ -365,28 +730,38 @@ def color_by_component(wGraph, axes, cmap, method, title, gui):
     ax.legend(loc='upper center', bbox_to_anchor=(0.5, -0.05),
               fancybox=True, shadow=True, ncol=5)
 
-    if gui:
-        return fig
-    else:
-        show(window)
+    return _finish(fig, gui, window)
 
 
-def plot3d_pc(pointCloud, axes=(0, 1, 2), gui=False, title=False):
+def plot3d_pc(pointCloud, axes=(0, 1, 2), gui=False, title=False,
+              density=None, bins=256):
     """
-    We plot a point cloud.
+    We plot a point cloud. With density, or by default above
+    DENSITY_POINTS points, we draw instead the densities of the
+    projections on the three pairs of axes; see plot_density.
     """
+    if density is None:
+        density = pointCloud.size() > DENSITY_POINTS
+    if density:
+        if pointCloud.dimension() == 2:
+            projections = ((0, 1),)
+        else:
+            projections = list(itertools.combinations(axes, 2))
+        return _finish(plot_density(pointCloud, projections, bins,
+                                    title=title), gui)
+
     if pointCloud.get_space() == 'affine':
 
-        points = pointCloud.get_points()
-        xcoords = [p[axes[0]] for p in points]
-        ycoords = [p[axes[1]] for p in points]
-        if len(points[0]) == 2:
-            zcoords = [0 for _ in points]
+        points = pointCloud.get_array()
+        xcoords = points[:, axes[0]]
+        ycoords = points[:, axes[1]]
+        if points.shape[1] == 2:
+            zcoords = np.zeros(len(points))
         else:
-            zcoords = [p[axes[2]] for p in points]
+            zcoords = points[:, axes[2]]
 
-        fig = plt.figure()
-        ax = Axes3D(fig)
+        fig = _new_figure()
+        ax = fig.add_subplot(1, 1, 1, projection='3d')
 
         ax.scatter(xcoords, ycoords, zcoords, marker='.', color='#ff6666')
 
@@ -411,11 +786,7 @@ def plot3d_pc(pointCloud, axes=(0, 1, 2), gui=False, title=False):
 #         fig.add_axes(ax)
 #         ax.set_aspect('equal')
 
-        if gui:
-            return fig
-        else:
-            plt.show(fig)
-#             show(fig)
+        return _finish(fig, gui)
 
 
 def plot3d_ng(wGraph,
@@ -425,7 +796,8 @@ def plot3d_ng(wGraph,
               save=False,
               title="3D Neighborhood Graph",
               gui=False,
-              fancy=True):
+              fancy=True,
+              max_edges=MAX_EDGES):
     """
     For a given epsilon, makes a 3-dimensional plot of a neighborhood
     graph.
@@ -436,87 +808,117 @@ def plot3d_ng(wGraph,
         2 - Paired
         3 - rainbow
         4 - winter
+    Graphs with more than max_edges edges are drawn with a random sample
+    of max_edges edges. See plot_edges.
     """
 
-    plt.rc('text', usetex=True)
-    plt.rc('font', family='sans-serif: Computer Modern Sans serif')
-    plt.axis('off')
-
-#     fig = plt.figure()
-    fig, window = create_fig()
-    window.wm_title(title)
-    ax = Axes3D(fig)
+    fig, window = create_fig(title)
+    ax = fig.add_subplot(1, 1, 1, projection='3d')
     if not fancy:
         ax.grid(False)
         ax.set_axis_off()
 
     epsilon = wGraph.epsilon()
-    adj = wGraph.adjacencies()
-    cp = wGraph.connected_components()
     cmaps = [plt.cm.Dark2, plt.cm.Accent, plt.cm.Paired,
              plt.cm.rainbow, plt.cm.winter]
-    cmap = cmaps[cmap]  # color mappings
-    line_colors = cmap(np.linspace(0, 1, len(cp)))
+    labels = wGraph.component_labels()
+    sizes = np.bincount(labels)
 
-    # [0, 0.1, 0.2 ... 1 ]
+    plot_edges(wGraph.vertex_coordinates(padding=3), wGraph.edge_pairs(),
+               labels=labels, axes=axes, cmap=cmaps[cmap],
+               max_edges=max_edges, ax=ax,
+               singleton_label='%d Singletons' % (sizes == 1).sum())
 
-    ce = wGraph.connected_edges(padding=3)
-    ce.sort(key=len)
+    textstr = _summary(len(labels), epsilon, wGraph.num_edges(), len(sizes))
 
-    componentIndex = -1
-    for componentIndex, component in enumerate(ce):
-
-        vert = pick_ax_edge(component, axes)
-        lines = a3.art3d.Poly3DCollection(vert, linewidths=1)
-
-        lines.set_edgecolor(line_colors[componentIndex])
-
-        ax.add_collection(lines)
+    ax.plot([0], [0], color='white', label=textstr)
+    ax.legend(loc='lower left', fontsize='x-large', borderpad=1)
 
-    componentIndex += 1
+    return _finish(fig, gui, window)
 
-    if wGraph.singletons():
-        x, y, z = zip(*[pick_ax(point, axes) for point in
-                        wGraph.singletons(padding=3)])
-        ax.scatter(x, y, z,
-                   marker='.',
-                   s=15,
-                   color=line_colors[componentIndex:],
-                   label=r"\makebox[90pt]{%d\hfill}Singletons" % len(x))
 
-    textstr = r'\noindent\makebox[90pt]{%d\hfill}Number of Points\\ \\'\
-        r'\makebox[90pt]{%.3f\hfill}Distance\\ \\'\
-        r'\makebox[90pt]{%d\hfill}Edges\\ \\'\
-        r'\makebox[90pt]{%d\hfill}Connected Components' \
-        % (len(adj), epsilon, wGraph.num_edges(), len(cp))
+def _figure(item, **kwargs):
+    """
+    We draw any renderable item and return the figure.
+    """
+    if isinstance(item, str):
+        if item.endswith('.npz'):
+            item = PersistenceDiagram.load(item)
+        else:
+            item = PointCloud.from_npy(item)
+    if isinstance(item, PersistentHomology):
+        item = item.diagram()
+    if isinstance(item, PersistenceDiagram):
+        return plot_barcode(item, **kwargs)
+    if isinstance(item, wGraph):
+        if item.vertex_coordinates().shape[1] == 2:
+            return plot2d_ng(item, gui=True, **kwargs)
+        return plot3d_ng(item, gui=True, **kwargs)
+    if _is_cloud(item):
+        if item.dimension() == 2:
+            return plot2d_pc(item, gui=True, **kwargs)
+        return plot3d_pc(item, gui=True, **kwargs)
+    raise TypeError('Cannot render an object of type ' +
+                    type(item).__name__ + '.')
+
+
+def render(item, path, dpi=100, **kwargs):
+    """
+    Draws item in headless mode and writes the figure to path, in the
+    format of its extension (.png, .svg, .pdf, ...). Returns path. The
+    figure is drawn on an Agg canvas outside of pyplot, so the backend
+    and the headless mode of the caller are left as they were.
+
+    :param item: a PointCloud, wGraph, PersistentHomology or
+        PersistenceDiagram (drawn as a barcode), or the path of a point
+        cloud .npy file or a diagram .npz file.
+    :param kwargs: passed to the plotting function.
+    """
+    rendering = _HEADLESS['render']
+    _HEADLESS['render'] = True
+    try:
+        _figure(item, **kwargs).savefig(path, dpi=dpi)
+    finally:
+        _HEADLESS['render'] = rendering
+    return path
 
-    ax.plot([0], [0], color='white', label=textstr)
-    ax.legend(loc='lower left', fontsize='x-large', borderpad=1)
 
-    minx = min([coord[0] for coord in list(adj.keys())])
-    maxx = max([coord[0] for coord in list(adj.keys())])
-    miny = min([coord[1] for coord in list(adj.keys())])
-    maxy = max([coord[1] for coord in list(adj.keys())])
-
-    xpadding = abs(minx - maxx) * 0.1
-    ypadding = abs(miny - maxy) * 0.1
-    ax.set_xlim(minx - xpadding,
-                maxx + xpadding)
-    ax.set_ylim(miny - ypadding,
-                maxy + ypadding)
-
-    zaxis = [coord[2] for coord in list(adj.keys()) if len(coord) > 2]
-    if zaxis:
-        minz = min(zaxis)
-        maxz = max(zaxis)
-        zpadding = abs(minz - maxz) * 0.1
-        ax.set_zlim(minz - xpadding,
-                    maxz + zpadding)
+def _render_task(task):
+    """
+    Worker task of render_many.
+    """
+    item, path, dpi, kwargs = task
+    return render(item, path, dpi, **kwargs)
 
-    ax.set_aspect('equal')
 
-    if gui:
-        return fig
-    else:
-        #         plt.show()
-        show(window)
+def render_many(objects,
+                out_dir,
+                workers=None,
+                format='png',
+                names=None,
+                dpi=100,
+                **kwargs):
+    """
+    Renders every object, as render() does, to out_dir/<name>.<format>,
+    and returns the list of paths. With workers > 1 the objects are drawn
+    by a pool of headless worker processes; passing paths of .npy and .npz
+    files rather than objects keeps the tasks small.
+
+    :param names: the file names without extension, by default the
+        positions 000000, 000001, ...
+    :param kwargs: passed to every plotting function.
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    if names is None:
+        names = ('%06d' % i for i in itertools.count())
+    tasks = ((item, os.path.join(out_dir, name + '.' + format), dpi, kwargs)
+             for item, name in zip(objects, names))
+    if workers is None or workers <= 1:
+        return [_render_task(task) for task in tasks]
+    pool = multiprocessing.Pool(workers, set_headless)
+    try:
+        return list(pool.imap(_render_task, tasks))
+    finally:
+        pool.close()
+        pool.join()
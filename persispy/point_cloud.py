@@ -20,7 +20,8 @@ import numpy as np
 # import mpl_toolkits.mplot3d as a3
 
 from persispy.weighted_simplicial_complex import wGraph
-from persispy.hashing import HashPoint
+from persispy.hashing import HashPoint, coordinate_array, hash_rows
+from persispy.stats import current, timed
 from random import randint
 # from persispy.hashing import HashEdge
 
@@ -32,26 +33,38 @@ class PointCloud(object):
     properties of being hashable, which is necessary for indexing
     a dictionary.
 
-    :param list points: A list of points
+    :param list points: A list of points, or an (n, d) array of coordinates
     :param str space: [affine|projective] The space the points live in.
     :param bool gui: Used by :mod:`persispy.plot` to either display or return the plot
 
+    A cloud made from an (n, d) numeric array keeps the array, without
+    copying it, and makes its HashPoints only when they are first asked
+    for. The points are then views of the rows of the array.
+
+    >>> cloud = PointCloud(np.zeros((10 ** 6, 3)))
+    >>> len(cloud), cloud.dimension()
+    (1000000, 3)
     '''
 
     def __init__(self, points, space='affine', gui=False):
-        if type(points) is not np.ndarray:
+        if not isinstance(points, np.ndarray):
             points = np.array(points)
-        try:
-            self._points = list(points)
-        except TypeError:
-            raise TypeError('Input points should be a list of points.')
-        try:
-            hash(self._points[0])
-        except TypeError:
-#             print("Detected points are not hashable." +
-#                   "Attempting to convert to HashPoints.")
-            self._points = [HashPoint(points[n],
-                                      index=n) for n in range(len(points))]
+        if points.ndim == 2 and points.dtype != object:
+            self._array = points
+            self._point_list = None
+        else:
+            self._array = None
+            try:
+                self._point_list = list(points)
+            except TypeError:
+                raise TypeError('Input points should be a list of points.')
+            try:
+                hash(self._point_list[0])
+            except TypeError:
+#                 print("Detected points are not hashable." +
+#                       "Attempting to convert to HashPoints.")
+                self._point_list = [HashPoint(points[n], index=n)
+                                    for n in range(len(points))]
         if space != 'affine' and space != 'projective':
             raise TypeError('The argument "space" should be set to' +
                             'either "affine" or "projective".')
@@ -60,6 +73,29 @@ class PointCloud(object):
         self._fig = None
         self.gui = gui
 
+    @classmethod
+    def from_npy(cls, path, space='affine', mode='r'):
+        '''
+        Opens a PointCloud over the (n, d) array of an .npy file, such as
+        one written by persispy.points.write_npy, as a memory map. Nothing
+        is read until it is used.
+
+        :param str mode: the mmap_mode of numpy.load, 'r' or 'r+'.
+        '''
+        return cls(np.load(path, mmap_mode=mode), space=space)
+
+    @property
+    def _points(self):
+        '''
+        The list of HashPoints, made on first use for array backed clouds.
+        '''
+        if self._point_list is None:
+            hashes = hash_rows(self._array)
+            self._point_list = [HashPoint.from_row(self._array, n,
+                                                   hash_value=hashes[n])
+                                for n in range(len(self._array))]
+        return self._point_list
+
     def __repr__(self):
         try:
             repr(self.dimension())
@@ -76,6 +112,14 @@ class PointCloud(object):
         """
         return self._points
 
+    def get_array(self):
+        """
+        We return the (n, d) array of the coordinates of the points.
+        """
+        if self._array is None:
+            return coordinate_array(self._point_list)
+        return self._array
+
     def get_space(self):
         """
         We return the PointCloud's space.
@@ -83,16 +127,20 @@ class PointCloud(object):
         return self._space
 
     def __len__(self):
-        return len(self._points)
+        return self.size()
 
     def size(self):
         """
         Returns the number of points in the point cloud.
         """
-        return len(self._points)
+        if self._array is not None:
+            return len(self._array)
+        return len(self._point_list)
 
     def __getitem__(self, key):
-        return tuple(self._points[key].coordinate())
+        if self._array is not None:
+            return tuple(self._array[key])
+        return tuple(self._point_list[key].coordinate())
 
     def num_points(self):
         """
@@ -105,10 +153,14 @@ class PointCloud(object):
         """
         Returns the dimension of the point cloud.
         """
+        if self._array is not None:
+            dimension = self._array.shape[1]
+        else:
+            dimension = len(self._point_list[0].coordinate())
         if self._space == 'affine':
-            return len(self._points[0].coordinate())
+            return dimension
         elif self._space == 'projective':
-            return len(self._points[0].coordinate()) - 1
+            return dimension - 1
 
     def plot2d(self, *args, **kwargs):
         """
@@ -150,6 +202,7 @@ class PointCloud(object):
         print (">>> persispy.plot.plot3d(wGraph)")
         plot3d(wgraph, *args, **kwargs)
 
+    @timed('neighborhood_graph')
     def neighborhood_graph(self,
                            epsilon,
                            method="subdivision"):
@@ -160,11 +213,18 @@ class PointCloud(object):
         :param str method: [exact|subdivision|subdivision 3|subdivision 7 approximate]
         :return: a :class:`wGraph` of the form ``{point: {adj_points:distance}}``
         .. automethod:: _neighborhood_graph
+
+        Inside persispy.stats.collect() this is timed as the stage
+        neighborhood_graph, and counts distance_evaluations and edges.
         """
-        return self._neighborhood_graph(epsilon,
-                                        method,
-                                        self._points,
-                                        {v: set() for v in self._points})
+        graph = self._neighborhood_graph(epsilon,
+                                         method,
+                                         self._points,
+                                         {v: set() for v in self._points})
+        stats = current()
+        if stats is not None and graph is not None:
+            stats.count('edges', graph.num_edges())
+        return graph
 
     def _neighborhood_graph(self,  # pylint: disable = R0911, R0912
                             # too many branches and too many return values
@@ -219,6 +279,10 @@ class PointCloud(object):
                     return wGraph(dictionary, epsilon)
 
         elif methodarray[0] == 'exact':
+            stats = current()
+            if stats is not None and self._space == 'affine':
+                stats.count('distance_evaluations',
+                            len(self._points) * (len(self._points) - 1) // 2)
             for i in range(len(self._points)):
                 for j in range(i + 1, len(self._points)):
                     if self._space == 'affine':
@@ -344,6 +408,10 @@ class PointCloud(object):
                                 median.coordinate()[coordinate] + epsilon):
                             gluebigger.append(pointarray[i])
 
+            stats = current()
+            if stats is not None:
+                stats.count('distance_evaluations',
+                            len(gluesmaller) * len(gluebigger))
             for i, _ in enumerate(gluesmaller):  # glue together two regions
                 for j, _ in enumerate(gluebigger):
                     dist = np.sqrt(
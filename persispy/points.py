@@ -19,16 +19,23 @@ a wrapping up a numpy.array that is suitable for hashing. A hashable
 especially the neighborhood_graph function.
 '''
 
+import math
+import multiprocessing
+import os
+import weakref
+
 import numpy as np
 import numpy.random as npr
 
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python2 and python3 before 3.8
+    shared_memory = None
 
 from persispy.hashing import HashPoint
-try:
-    from persispy.phc import Intersect
-except ImportError:
-    print("PHCpy is not currently installed. PHC functions are unavailable.")
+from persispy.implicit import sample_hypersurface
 from persispy.point_cloud import PointCloud
+from persispy.rng import chunk_seeds, random_state
 
 equations = {
     "circle": "x^2 + y^2 - 1",
@@ -40,57 +47,164 @@ equations = {
 }
 
 
+def _intersect(name, number_of_points):
+    """
+    Samples a named equation with persispy.phc, which needs phcpy and so
+    is only imported here.
+    """
+    from persispy.phc import Intersect
+    return Intersect(equations[name], number_of_points)
+
+
 def intersect_hyperbolid(number_of_points):
     """
     Returns points on the hyperbolid.
     """
-    return Intersect(equations["hyperbolid"], number_of_points)
+    return _intersect("hyperbolid", number_of_points)
 
 
 def intersect_eightsurface(number_of_points):
     """
     Returns points on an eightsurface.
     """
-    return Intersect(equations["eightsurface"], number_of_points)
+    return _intersect("eightsurface", number_of_points)
 
 
 def intersect_torus(number_of_points):
     """
     Returns points on a torus.
     """
-    return Intersect(equations["torus"], number_of_points)
+    return _intersect("torus", number_of_points)
 
 
 def intersect_circle(number_of_points):
     """
     Returns points on a circle.
     """
-    return Intersect(equations["circle"], number_of_points)
+    return _intersect("circle", number_of_points)
 
 
 def intersect_sphere(number_of_points):
     """
     Returns points on a sphere.
     """
-    return Intersect(equations['sphere'], number_of_points)
+    return _intersect("sphere", number_of_points)
 
 
-def circle(num_points, radius=1):
+def hypersurface(equation, number_of_points, bounds=10, rng=None):
+    """
+    Returns points on one of the hypersurfaces in equations, given by
+    name, or on the zero set of any polynomial equation string. Unlike
+    the intersect_* functions this projects random points onto the
+    surface with Newton steps in numpy, and does not need phcpy. See
+    persispy.implicit.
+
+    >>> hypersurface("torus", 1000)
+    Point cloud with 1000 points in real affine space of dimension 3
+    """
+    return sample_hypersurface(equations.get(equation, equation),
+                               number_of_points, bounds=bounds, rng=rng)
+
+
+def _circle(rng, num_points, radius=1):
+    angles = 2 * np.pi * rng.random(num_points)
+    return radius * np.column_stack((np.cos(angles), np.sin(angles)))
+
+
+def _sphere_rejection(rng, num_points, dimension, oversampling=1.1):
+    '''
+    Returns num_points points uniformly distributed on the unit sphere in
+    R^dimension: points drawn uniformly from the cube are kept if they lie
+    in the unit ball, and projected to the sphere. Candidates are drawn in
+    batches, oversampled by the expected acceptance rate.
+    '''
+    # The volume of the unit ball over the volume of the cube [-1, 1]^d.
+    acceptance = np.pi ** (dimension / 2.0) / \
+        math.gamma(dimension / 2.0 + 1) / 2 ** dimension
+    points = np.empty((num_points, dimension))
+    count = 0
+    while count < num_points:
+        remaining = num_points - count
+        batch = int(oversampling * remaining / acceptance) + 16
+        candidates = 2 * rng.random((batch, dimension)) - 1
+        norms = np.sqrt((candidates * candidates).sum(axis=1))
+        accepted = (norms <= 1) & (norms > 0)
+        candidates = candidates[accepted][:remaining] / \
+            norms[accepted][:remaining, None]
+        points[count:count + len(candidates)] = candidates
+        count += len(candidates)
+    return points
+
+
+def _sphere(rng, num_points, radius=1, method='rejection'):
+    if method == 'normalized':
+        points = 2 * rng.random((num_points, 3)) - 1
+        points /= np.sqrt((points * points).sum(axis=1))[:, None]
+    elif method == 'rectangular':
+        angles = 2 * np.pi * rng.random((num_points, 2))
+        points = np.column_stack((np.sin(angles[:, 0]) * np.cos(angles[:, 1]),
+                                  np.sin(angles[:, 0]) * np.sin(angles[:, 1]),
+                                  np.cos(angles[:, 0])))
+    elif method == 'rejection':
+        points = _sphere_rejection(rng, num_points, 3)
+    else:
+        raise TypeError('The argument "method" should be either' +
+                        '"normalized", "rectangular", or "rejection".')
+    return radius * points
+
+
+def _torus(rng, num_points):
+    angles = 2 * np.pi * rng.random((num_points, 2))
+    tube = 2 + np.cos(angles[:, 0])
+    return np.column_stack((tube * np.cos(angles[:, 1]),
+                            tube * np.sin(angles[:, 1]),
+                            np.sin(angles[:, 0])))
+
+
+def _flat_torus(rng, num_points):
+    angles = 2 * np.pi * rng.random((num_points, 2))
+    return np.column_stack((np.cos(angles[:, 0]),
+                            np.sin(angles[:, 0]),
+                            np.cos(angles[:, 1]),
+                            np.sin(angles[:, 1])))
+
+
+def _cube(rng, num_points, dim=3):
+    return rng.random((num_points, dim))
+
+
+def _box(rng, num_points, dimension=2, side_length=1):
+    return rng.uniform(-side_length / 2, side_length / 2,
+                       size=(num_points, dimension))
+
+
+# The samplers behind the generators below, by name. Each one takes a
+# random state and a number of points and returns an (n, d) array.
+SAMPLERS = {'circle': _circle,
+            'sphere': _sphere,
+            'torus': _torus,
+            'flat_torus': _flat_torus,
+            'cube': _cube,
+            'box': _box}
+
+
+def circle(num_points, radius=1, rng=None):
     '''
     Returns a PointCloud with num_points random points on the circle
     (1-sphere) of given radius centered at the origin in R^2.
 
+    :param rng: a numpy Generator, RandomState, SeedSequence or int seed.
+        None uses the global numpy.random state. See persispy.rng.
+
     >>> circle(1000,radius=4)
     Point cloud with 1000 points in real affine space of dimension 2
     '''
-    angles = np.array([(2 * np.pi) * npr.random() for _ in range(num_points)])
-    return PointCloud([HashPoint([np.cos(theta), np.sin(theta)], index)
-                       for index, theta in enumerate(angles)])
+    return PointCloud(_circle(random_state(rng), num_points, radius))
 
 # 3d examples
 
 
-def sphere(num_points, radius=1, method='rejection'):
+def sphere(num_points, radius=1, method='rejection', rng=None):
     '''
     Returns a PointCloud with num_points random points on the 2-sphere
     of given radius.
@@ -104,101 +218,50 @@ def sphere(num_points, radius=1, method='rejection'):
     >>> sphere(1000,radius=4)
     Point cloud with 1000 points in real affine space of dimension 3
     '''
-    def normalize(x):
-        """
-        Helper func to normalize set of points to the radius.
-        """
-        return (radius / np.sqrt(sum(x * x))) * x
-    if method == 'normalized':
-        return PointCloud([
-            HashPoint(normalize(2 * npr.random(3) - 1),
-                      index=n) for n in range(num_points)], space='affine')
-    elif method == 'rectangular':
-        angles = np.array([2 * np.pi * npr.random(2)
-                           for n in range(num_points)])
-        return PointCloud(
-            [
-                HashPoint(
-                    radius *
-                    np.array(
-                        [
-                            np.sin(
-                                angles[n][0]) *
-                            np.cos(
-                                angles[n][1]),
-                            np.sin(
-                                angles[n][0]) *
-                            np.sin(
-                                angles[n][1]),
-                            np.cos(
-                                angles[n][0])]),
-                    index=n) for n in range(num_points)],
-            space='affine')
-    elif method == 'rejection':
-        count = 0
-        points = []
-        while count < num_points:
-            pt = 2 * radius * npr.random(3) - radius
-            if np.sqrt(sum(pt * pt)) <= radius:
-                points.append(HashPoint(pt, count))
-                count = count + 1
-        return PointCloud(points, space='affine')
-    else:
-        raise TypeError('The argument "method" should be either' +
-                        '"normalized", "rectangular", or "rejection".')
+    return PointCloud(_sphere(random_state(rng), num_points, radius, method),
+                      space='affine')
 
 
-def torus(num_points, gui=False):
+def torus(num_points, gui=False, rng=None):
     '''
     >>> torus(1000)
     Point cloud with 1000 points in real affine space of dimension 3
     '''
-    angles = np.array([2 * np.pi * npr.random(2) for n in range(num_points)])
-    hp = [
-        HashPoint(
-            np.array(
-                [(2 + np.cos(angles[n][0])) * np.cos(angles[n][1]),
-                 (2 + np.cos(angles[n][0])) * np.sin(angles[n][1]),
-                 np.sin(angles[n][0])]),
-            index=n) for n in range(num_points)]
-    return PointCloud(hp, space='affine', gui=gui)
+    return PointCloud(_torus(random_state(rng), num_points),
+                      space='affine', gui=gui)
 
 
-def flat_torus(num_points):
+def flat_torus(num_points, rng=None):
     '''
     >>> flat_torus(1000)
     Point cloud with 1000 points in real affine space of dimension 4
     '''
-    angles = np.array([2 * np.pi * npr.random(2) for n in range(num_points)])
-    return PointCloud([
-        HashPoint(
-            np.array(
-                [np.cos(angles[n][0]),
-                 np.sin(angles[n][0]),
-                 np.cos(angles[n][1]),
-                 np.sin(angles[n][1])]),
-            index=n) for n in range(num_points)], space='affine')
+    return PointCloud(_flat_torus(random_state(rng), num_points),
+                      space='affine')
 
 
-def cube(dim, num_points):
+def cube(dim, num_points, rng=None):
     '''
     >>> cube(4,1000)
     Point cloud with 1000 points in real affine space of dimension 4
     '''
-    return PointCloud([HashPoint(npr.random(dim), index=n)
-                       for n in range(num_points)], space='affine')
+    return PointCloud(_cube(random_state(rng), num_points, dim),
+                      space='affine')
 
 
 def box(number_of_points,
         dimension=2,
         side_length=1,
         seed=False,
-        return_seed=False):
+        return_seed=False,
+        rng=None):
     """
     We return a set of points in a box of given dimension. On default,
-    returns a unit box in the plane. We can specify a str or int seed.
-    We can also ask to return the seed used to generate a run. Note, the
-    returned seed is a ndarray of 624 units and is returned as a tuple.
+    returns a unit box in the plane. We can specify an int seed, which
+    draws the points from a numpy RandomState with that seed; the global
+    numpy.random state is left alone. Giving both seed and rng raises
+    ValueError. We can also ask to return the state of the random stream
+    after the run, as a tuple.
 
     >>> box(1000, 2)
     Point cloud with 1000 points in real affine space of dimension 2
@@ -208,19 +271,262 @@ def box(number_of_points,
 
     """
     if seed:
-        npr.seed(seed)
+        if rng is not None:
+            raise ValueError('Give either seed or rng, not both.')
+        rng = npr.RandomState(seed)
+    rng = random_state(rng)
 
-    result = PointCloud(
-        [HashPoint(
-            npr.uniform(-side_length / 2,
-                        side_length / 2,
-                        size=dimension),
-            index=n)
-         for n in range(number_of_points)],
-        space='affine')
+    result = PointCloud(_box(rng, number_of_points, dimension, side_length),
+                        space='affine')
 
     if return_seed:
-        return_seed = npr.get_state()
+        if isinstance(rng, npr.Generator):
+            return_seed = rng.bit_generator.state
+        else:
+            return_seed = rng.get_state()
         result = (result, return_seed)
 
     return result
+
+
+# The output array of parallel_cloud as seen by the current process.
+_OUTPUT = {}
+
+
+def _attach_output(name, shape):
+    '''
+    Pool initializer of parallel_cloud: maps the output array, either a
+    shared memory block or, if shape is None, the .npy file name.
+    '''
+    if shape is None:
+        _OUTPUT['points'] = np.load(name, mmap_mode='r+')
+        return
+    block = shared_memory.SharedMemory(name=name)
+    _OUTPUT['block'] = block
+    _OUTPUT['points'] = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def _fill_chunk(task):
+    '''
+    Worker task of parallel_cloud: draws one chunk into the output array.
+    '''
+    shape, start, num_points, seed, kwargs = task
+    points = _OUTPUT['points']
+    points[start:start + num_points] = \
+        SAMPLERS[shape](npr.default_rng(seed), num_points, **kwargs)
+    if isinstance(points, np.memmap):
+        points.flush()
+
+
+def _chunk_tasks(shape, num_points, seed, chunk_size, kwargs):
+    '''
+    The (shape, start, size, seed, kwargs) tasks of the chunks of a cloud.
+    Chunk i is drawn from the i-th child stream spawned from seed.
+    '''
+    if shape not in SAMPLERS:
+        raise TypeError('The argument "shape" should be one of ' +
+                        ', '.join(sorted(SAMPLERS)) + '.')
+    starts = list(range(0, num_points, chunk_size))
+    return [(shape, start, min(chunk_size, num_points - start), child, kwargs)
+            for start, child in zip(starts, chunk_seeds(seed, len(starts)))]
+
+
+def parallel_cloud(shape,
+                   num_points,
+                   seed=None,
+                   workers=None,
+                   chunk_size=2 ** 20,
+                   path=None,
+                   **kwargs):
+    '''
+    Returns a PointCloud of num_points random points on one of the
+    shapes of SAMPLERS, generated in chunks of chunk_size points by a
+    pool of worker processes. The workers write their chunks straight
+    into the output array: a block of shared memory, or with a path, an
+    .npy file that the returned cloud is a memory map of.
+
+    Chunk i is drawn from the i-th child stream spawned from seed, so the
+    cloud depends only on seed and chunk_size: it is bit-identical for any
+    number of workers, and to the chunks of chunks(shape, ...).
+
+    :param str shape: [circle|sphere|torus|flat_torus|cube|box]
+    :param seed: an int or a numpy SeedSequence. None draws fresh entropy.
+    :param int workers: the number of processes. None or 1 runs serially.
+    :param str path: write the points to this .npy file.
+    :param kwargs: passed to the sampler, e.g. radius for sphere, or dim
+        for cube.
+
+    >>> cloud = parallel_cloud('sphere', 1000, seed=1, chunk_size=300)
+    >>> bool((cloud.get_array() ==
+    ...       parallel_cloud('sphere', 1000, seed=1, chunk_size=300,
+    ...                      workers=2).get_array()).all())
+    True
+    '''
+    tasks = _chunk_tasks(shape, num_points, seed, chunk_size, kwargs)
+    # The dimension of the shape, from a throwaway sample.
+    dimension = SAMPLERS[shape](npr.default_rng(0), 1, **kwargs).shape[1]
+    output_shape = (num_points, dimension)
+
+    if path is not None:
+        points = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64,
+                                           shape=output_shape)
+        if workers is not None and workers > 1:
+            del points
+            _map_chunks(tasks, workers, (path, None))
+            points = np.load(path, mmap_mode='r+')
+        else:
+            _fill_serially(tasks, points)
+        return PointCloud(points, space='affine')
+
+    if workers is None or workers <= 1 or shared_memory is None:
+        points = np.empty(output_shape)
+        _fill_serially(tasks, points)
+        return PointCloud(points, space='affine')
+
+    block = shared_memory.SharedMemory(
+        create=True, size=max(8 * num_points * dimension, 1))
+    try:
+        _map_chunks(tasks, workers, (block.name, output_shape))
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    # The block is the buffer of the returned array. Its name is removed
+    # now that the workers are done, and its memory is unmapped when the
+    # array is collected.
+    block.unlink()
+    points = np.ndarray(output_shape, dtype=np.float64, buffer=block.buf)
+    weakref.finalize(points, _close_block, block)
+    return PointCloud(points, space='affine')
+
+
+def _close_block(block):
+    '''
+    Unmaps the shared memory block under the array of a parallel_cloud.
+    '''
+    try:
+        block.close()
+    except BufferError:
+        # Still exported at interpreter exit; the memory goes with the
+        # process.
+        pass
+
+
+def _fill_serially(tasks, points):
+    _OUTPUT['points'] = points
+    try:
+        for task in tasks:
+            _fill_chunk(task)
+    finally:
+        _OUTPUT.clear()
+
+
+def _map_chunks(tasks, workers, output):
+    pool = multiprocessing.Pool(workers, _attach_output, output)
+    try:
+        pool.map(_fill_chunk, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def chunks(shape, num_points, chunk_size=2 ** 20, seed=None, **kwargs):
+    '''
+    Yields the points of a random cloud on one of the shapes of SAMPLERS
+    as (chunk_size, d) arrays, the last one possibly shorter, so that
+    clouds larger than memory can be streamed. The chunks are those of
+    parallel_cloud with the same seed and chunk_size.
+
+    >>> [len(c) for c in chunks('torus', 10, chunk_size=4, seed=0)]
+    [4, 4, 2]
+    '''
+    for shape, _, size, child, kwargs in _chunk_tasks(shape, num_points, seed,
+                                                      chunk_size, kwargs):
+        yield SAMPLERS[shape](npr.default_rng(child), size, **kwargs)
+
+
+def circle_chunks(num_points, chunk_size=2 ** 20, seed=None, radius=1):
+    '''
+    Yields random points on the circle in chunks. See chunks().
+    '''
+    return chunks('circle', num_points, chunk_size, seed, radius=radius)
+
+
+def sphere_chunks(num_points, chunk_size=2 ** 20, seed=None, radius=1,
+                  method='rejection'):
+    '''
+    Yields random points on the 2-sphere in chunks. See chunks().
+    '''
+    return chunks('sphere', num_points, chunk_size, seed, radius=radius,
+                  method=method)
+
+
+def torus_chunks(num_points, chunk_size=2 ** 20, seed=None):
+    '''
+    Yields random points on the torus in R^3 in chunks. See chunks().
+    '''
+    return chunks('torus', num_points, chunk_size, seed)
+
+
+def flat_torus_chunks(num_points, chunk_size=2 ** 20, seed=None):
+    '''
+    Yields random points on the flat torus in R^4 in chunks. See chunks().
+    '''
+    return chunks('flat_torus', num_points, chunk_size, seed)
+
+
+def cube_chunks(dim, num_points, chunk_size=2 ** 20, seed=None):
+    '''
+    Yields random points in the unit cube in chunks. See chunks().
+    '''
+    return chunks('cube', num_points, chunk_size, seed, dim=dim)
+
+
+def box_chunks(num_points, dimension=2, side_length=1, chunk_size=2 ** 20,
+               seed=None):
+    '''
+    Yields random points in a centered box in chunks. See chunks().
+    '''
+    return chunks('box', num_points, chunk_size, seed, dimension=dimension,
+                  side_length=side_length)
+
+
+def write_npy(path, point_chunks, num_points):
+    '''
+    Writes num_points points, given as an iterable of (m, d) arrays, to
+    an .npy file through a memory map, one chunk at a time. Open the
+    result with PointCloud.from_npy(path).
+
+    If the chunks do not hold num_points points, ValueError is raised
+    and no file is left at path.
+
+    >>> import os, shutil, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> path = os.path.join(directory, 'sphere.npy')
+    >>> write_npy(path, sphere_chunks(1000, chunk_size=256, seed=0), 1000)
+    >>> PointCloud.from_npy(path)
+    Point cloud with 1000 points in real affine space of dimension 3
+    >>> shutil.rmtree(directory)
+    '''
+    points = None
+    count = 0
+    try:
+        for chunk in point_chunks:
+            if points is None:
+                points = np.lib.format.open_memmap(
+                    path, mode='w+', dtype=chunk.dtype,
+                    shape=(num_points, chunk.shape[1]))
+            if count + len(chunk) > num_points:
+                raise ValueError('More than num_points points were given.')
+            points[count:count + len(chunk)] = chunk
+            count += len(chunk)
+        if count != num_points:
+            raise ValueError('Expected ' + repr(num_points) +
+                             ' points, got ' + repr(count) + '.')
+    except ValueError:
+        if points is not None:
+            del points
+            os.remove(path)
+        raise
+    if points is not None:
+        points.flush()
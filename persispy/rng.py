@@ -0,0 +1,73 @@
+'''
+File: rng.py
+
+Random number streams for the random constructions of persispy.
+
+Every function that draws random numbers takes an rng argument. With
+rng=None the global numpy.random state is used, as before, so that
+numpy.random.seed still makes runs reproducible. Otherwise rng may be a
+numpy.random.Generator or RandomState, which is used as it is, or an int
+or numpy.random.SeedSequence, from which a new Generator is made.
+
+For parallel generation a seed is split into independent child streams,
+one per chunk of the output. The chunks, and so the streams, depend only
+on the seed and the chunk size, never on the number of workers.
+'''
+
+import numpy as np
+
+
+def random_state(rng=None):
+    '''
+    Returns an object with the numpy.random sampling methods (random,
+    uniform, ...) for the rng argument of a random construction.
+
+    >>> random_state(7).random() == random_state(7).random()
+    True
+    >>> random_state() is np.random
+    True
+    '''
+    if rng is None:
+        return np.random
+    if isinstance(rng, (np.random.Generator, np.random.RandomState)):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def seed_sequence(seed=None):
+    '''
+    Returns a new SeedSequence for an int, a SeedSequence or None (fresh
+    entropy). A SeedSequence is copied, without its spawned children:
+    spawn() advances it, so spawning from the copy leaves the caller's
+    untouched, and the same seed always spawns the same children.
+
+    >>> seed = np.random.SeedSequence(3)
+    >>> child = seed_sequence(seed).spawn(1)[0]
+    >>> seed.n_children_spawned
+    0
+    >>> child.spawn_key == seed_sequence(seed).spawn(1)[0].spawn_key
+    True
+    '''
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy,
+                                      spawn_key=seed.spawn_key,
+                                      pool_size=seed.pool_size)
+    return np.random.SeedSequence(seed)
+
+
+def chunk_seeds(seed, num_chunks):
+    '''
+    Returns num_chunks independent SeedSequences spawned from seed. The
+    i-th child is the same for any num_chunks > i.
+
+    >>> a = chunk_seeds(3, 2)[1].generate_state(1)
+    >>> b = chunk_seeds(3, 5)[1].generate_state(1)
+    >>> bool(a == b)
+    True
+    '''
+    return seed_sequence(seed).spawn(num_chunks)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,250 @@
+'''
+File: stats.py
+
+Opt-in instrumentation of the pipeline from a point cloud to its
+persistent homology.
+
+Inside a collect() block, PointCloud.neighborhood_graph,
+sorted_clique_list, wSimplicialComplex.from_clique_list and
+PersistentHomology record the wall and CPU time of their stages, and
+count what they did, in the Stats object of the block:
+
+    distance_evaluations    distances computed for the neighborhood graph
+    edges                   edges of the neighborhood graphs
+    maximal_cliques         cliques found by sorted_clique_list
+    simplices               simplices of the complexes, by dimension
+    column_additions        columns added to others by the reduction
+    apparent_pairs          pairs (face, simplex) where the face is the
+                            youngest face of the simplex and the simplex
+                            the oldest cofacet of the face; their columns
+                            need no reduction
+    persistence_pairs       pairs found by the reduction
+
+Outside of a collect() block nothing is recorded: an instrumented
+function only checks whether a block is open, and counts in local
+variables, adding them to the Stats once at the end of a stage.
+
+>>> import persispy.points as pp
+>>> import persispy.weighted_simplicial_complex as wsc
+>>> from persispy.persistent_homology import PersistentHomology
+>>> from persispy.stats import collect
+>>> with collect() as stats:
+...     graph = pp.circle(30, rng=0).neighborhood_graph(.5, 'exact')
+...     cliques = wsc.sorted_clique_list(graph)._cliques
+...     wscomplex = wsc.wSimplicialComplex.from_clique_list(graph, cliques)
+...     ph = PersistentHomology(wscomplex, 1)
+>>> stats.counters['distance_evaluations']
+435
+>>> sorted(stats.stages)
+['boundary_matrix', 'clique_enumeration', 'neighborhood_graph', \
+'reduction', 'simplicial_complex']
+'''
+
+import contextlib
+import functools
+import json
+import os
+import time
+
+# time.process_time is not in python2.
+_cpu_time = getattr(time, 'process_time', None) or time.clock
+
+# The Stats of the open collect() blocks, innermost last.
+_ACTIVE = []
+
+
+class Stats(object):
+    '''
+    The times and counters of one collect() block.
+
+    Vars:
+        stages - {name: {'calls', 'wall', 'cpu'}}, in seconds, in the
+            order in which the stages first ran. A stage entered again
+            while it runs, as in the recursion of the neighborhood
+            graph, is timed once.
+        counters - {name: int}, or {name: {dimension: int}} for the
+            counters by dimension.
+        events - one (name, start, wall, cpu, depth) tuple per timed
+            stage, with start in seconds since the block was opened.
+    '''
+
+    def __init__(self):
+        self.stages = dict()
+        self.counters = dict()
+        self.events = []
+        self._running = []
+        self._origin = time.time()
+
+    def __repr__(self):
+        return 'Stats of ' + repr(len(self.stages)) + ' stages and ' + \
+            repr(len(self.counters)) + ' counters'
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''
+        Times the block as the stage name, and yields self.
+        '''
+        if name in self._running:
+            yield self
+            return
+        self._running.append(name)
+        start, cpu = time.time(), _cpu_time()
+        try:
+            yield self
+        finally:
+            wall, cpu = time.time() - start, _cpu_time() - cpu
+            self._running.pop()
+            entry = self.stages.setdefault(name, {'calls': 0,
+                                                  'wall': 0.0,
+                                                  'cpu': 0.0})
+            entry['calls'] += 1
+            entry['wall'] += wall
+            entry['cpu'] += cpu
+            self.events.append((name, start - self._origin, wall, cpu,
+                                len(self._running)))
+
+    def count(self, name, value=1, dimension=None):
+        '''
+        Adds value to the counter name, or to its entry for dimension.
+        '''
+        if dimension is None:
+            self.counters[name] = self.counters.get(name, 0) + value
+        else:
+            counter = self.counters.setdefault(name, dict())
+            counter[dimension] = counter.get(dimension, 0) + value
+
+    def as_dict(self):
+        '''
+        Returns the stages and counters as plain dicts and lists.
+
+        >>> stats = Stats()
+        >>> stats.count('simplices', 3, dimension=1)
+        >>> stats.as_dict()
+        {'stages': {}, 'counters': {'simplices': {'1': 3}}}
+        '''
+        counters = dict()
+        for name, value in self.counters.items():
+            if isinstance(value, dict):
+                value = dict((str(k), v) for k, v in sorted(value.items()))
+            counters[name] = value
+        return {'stages': dict((name, dict(entry))
+                               for name, entry in self.stages.items()),
+                'counters': counters}
+
+    def report(self):
+        '''
+        Returns a table of the stages and counters as a string.
+
+        >>> stats = Stats()
+        >>> stats.count('edges', 12)
+        >>> print(stats.report())
+        stage                      calls     wall s      cpu s
+        edges: 12
+        '''
+        lines = ['%-24s %7s %10s %10s' % ('stage', 'calls', 'wall s',
+                                          'cpu s')]
+        for name, entry in self.stages.items():
+            lines.append('%-24s %7d %10.4f %10.4f'
+                         % (name, entry['calls'], entry['wall'],
+                            entry['cpu']))
+        for name, value in self.counters.items():
+            if isinstance(value, dict):
+                value = ', '.join('%d: %d' % item
+                                  for item in sorted(value.items()))
+            lines.append(name + ': ' + str(value))
+        return '\n'.join(lines)
+
+    def write(self, path):
+        '''
+        Writes the stats to path as JSON in the trace event format of
+        chrome://tracing and Perfetto: every timed stage is a complete
+        event, and the totals and counters are under "stats".
+        '''
+        events = [{'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                   'ts': start * 1e6, 'dur': wall * 1e6,
+                   'args': {'cpu': cpu, 'depth': depth}}
+                  for name, start, wall, cpu, depth in self.events]
+        with open(path, 'w') as output:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms',
+                       'stats': self.as_dict()}, output, indent=1)
+
+
+class _Disabled(object):
+    '''
+    The stage of a closed collect() block: enters to None.
+    '''
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exception):
+        return False
+
+
+_DISABLED = _Disabled()
+
+
+def current():
+    '''
+    Returns the Stats of the innermost open collect() block, or None.
+
+    >>> current() is None
+    True
+    '''
+    return _ACTIVE[-1] if _ACTIVE else None
+
+
+def stage(name):
+    '''
+    A context manager timing its block as the stage name. It enters to
+    the current Stats, or to None outside of a collect() block:
+
+        with stage('reduction') as stats:
+            ...
+            if stats is not None:
+                stats.count('column_additions', additions)
+    '''
+    if not _ACTIVE:
+        return _DISABLED
+    return _ACTIVE[-1].stage(name)
+
+
+def timed(name):
+    '''
+    Decorates a function so that its calls are timed as the stage name
+    inside a collect() block. The function can count with current().
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _ACTIVE:
+                return function(*args, **kwargs)
+            with _ACTIVE[-1].stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def collect(trace=None):
+    '''
+    Records the stages and counters of the instrumented functions called
+    in the block into a new Stats object, which it yields.
+
+    :param str trace: if given, the stats are written to this path when
+        the block ends, see Stats.write.
+    '''
+    stats = Stats()
+    _ACTIVE.append(stats)
+    try:
+        yield stats
+    finally:
+        _ACTIVE.remove(stats)
+        if trace is not None:
+            stats.write(trace)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
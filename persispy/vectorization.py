@@ -0,0 +1,207 @@
+'''
+File: vectorization.py
+
+Fixed size vectorizations of batches of persistence diagrams.
+
+Every function takes a list of diagrams (PersistenceDiagram objects or
+(n, 2) arrays of (birth, death) pairs) and returns a single ndarray with
+one slice per diagram. The diagrams are first padded to a common number
+of bars with points on the diagonal at the origin, which contribute
+nothing to any of the vectorizations, so the computations below are
+broadcast over (diagram, bar, ...) arrays with no Python loop over bars.
+Infinite bars are dropped.
+'''
+
+import numpy as np
+
+from persispy.persistence_diagram import as_intervals
+
+
+def _padded(diagrams, dimension=None):
+    '''
+    Returns an (N, L, 2) array holding the finite bars of the N diagrams,
+    padded with (0, 0), and the (N, L) mask of real bars.
+    '''
+    intervals = [as_intervals(d, dimension) for d in diagrams]
+    intervals = [x[np.isfinite(x[:, 1])] for x in intervals]
+    lengths = np.array([len(x) for x in intervals], dtype=np.int64)
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+    bars = np.zeros((len(intervals), width, 2))
+    mask = np.zeros((len(intervals), width), dtype=bool)
+    if lengths.sum():
+        rows = np.repeat(np.arange(len(intervals)), lengths)
+        columns = np.arange(lengths.sum()) - \
+            np.repeat(np.cumsum(lengths) - lengths, lengths)
+        bars[rows, columns] = np.concatenate(intervals)
+        mask[rows, columns] = True
+    return bars, mask
+
+
+def _bounds(values, mask):
+    '''
+    Returns the (min, max) of the masked values, widened if degenerate.
+    '''
+    if not mask.any():
+        return 0.0, 1.0
+    low, high = values[mask].min(), values[mask].max()
+    if low == high:
+        high = low + 1.0
+    return low, high
+
+
+def sliced_wasserstein_distances(diagrams,
+                                 num_directions=50,
+                                 dimension=None,
+                                 block_size=2 ** 22):
+    '''
+    Returns the (N, N) matrix of sliced Wasserstein distances.
+
+    For every direction theta, the bars of one diagram together with the
+    diagonal projections of the other are projected on the line spanned
+    by theta and sorted; the distance in that direction is the L1
+    distance of the two sorted vectors. The integral over directions in
+    [-pi/2, pi/2) is approximated by the mean over num_directions equally
+    spaced directions. The padding points lie on the diagonal, so they
+    land in both sorted vectors and do not change the distance.
+
+    :param int block_size: bound on the number of projected values held
+        in memory at once; pairs of diagrams are processed in blocks.
+
+    >>> d = sliced_wasserstein_distances([[[0, 1]], [[0, 1]], [[0, 2]]])
+    >>> float(d[0, 1]), bool(d[0, 2] > 0)
+    (0.0, True)
+    '''
+    bars, _ = _padded(diagrams, dimension)
+    num_diagrams, width = bars.shape[:2]
+    angles = np.pi * (np.arange(num_directions) / num_directions - .5)
+    directions = np.column_stack((np.cos(angles), np.sin(angles)))
+
+    # (N, M, L) projections of the bars and of their diagonal projections.
+    # The bars are on the last axis so that the sorts below are contiguous.
+    projections = np.einsum('mk,nlk->nml', directions, bars)
+    diagonal = directions.sum(axis=1)[:, None] * \
+        (bars.sum(axis=2) / 2)[:, None, :]
+
+    first, second = np.triu_indices(num_diagrams, 1)
+    distances = np.zeros((num_diagrams, num_diagrams))
+    step = max(1, block_size // (2 * width * num_directions))
+    for start in range(0, len(first), step):
+        i = first[start:start + step]
+        j = second[start:start + step]
+        left = np.sort(np.concatenate((projections[i], diagonal[j]), axis=2),
+                       axis=2)
+        right = np.sort(np.concatenate((projections[j], diagonal[i]), axis=2),
+                        axis=2)
+        distances[i, j] = np.abs(left - right).sum(axis=2).mean(axis=1)
+    return distances + distances.T
+
+
+def sliced_wasserstein_kernel(diagrams,
+                              num_directions=50,
+                              bandwidth=1.0,
+                              dimension=None):
+    '''
+    Returns the (N, N) sliced Wasserstein kernel matrix
+    exp(-SW(D_i, D_j) / (2 * bandwidth^2)).
+    '''
+    distances = sliced_wasserstein_distances(diagrams,
+                                             num_directions,
+                                             dimension)
+    return np.exp(-distances / (2 * bandwidth ** 2))
+
+
+def persistence_images(diagrams,
+                       resolution=(20, 20),
+                       bandwidth=None,
+                       bounds=None,
+                       weight=None,
+                       dimension=None):
+    '''
+    Returns an (N, rows, columns) array of persistence images.
+
+    Every bar is sent to (birth, persistence) and replaced by a Gaussian
+    of the given bandwidth, weighted by weight(birth, persistence); the
+    image is the sum sampled at the pixel centres. The persistence axis
+    runs along the rows.
+
+    :param tuple resolution: (rows, columns) of every image.
+    :param float bandwidth: defaults to a tenth of the persistence range.
+    :param tuple bounds: ((birth_min, birth_max), (pers_min, pers_max)),
+        computed from the whole batch by default so that images of
+        different diagrams are comparable.
+    :param weight: a function of broadcast birth and persistence arrays.
+        Defaults to persistence divided by the largest persistence.
+
+    >>> persistence_images([[[0, 1]], [[0, 2], [1, 2]]]).shape
+    (2, 20, 20)
+    '''
+    bars, mask = _padded(diagrams, dimension)
+    births = bars[:, :, 0]
+    persistence = bars[:, :, 1] - bars[:, :, 0]
+    if bounds is None:
+        bounds = (_bounds(births, mask), (0.0, _bounds(persistence, mask)[1]))
+    (bmin, bmax), (pmin, pmax) = bounds
+    rows, columns = resolution
+    if bandwidth is None:
+        bandwidth = (pmax - pmin) / 10
+
+    # Pixel centres.
+    xs = bmin + (np.arange(columns) + .5) * (bmax - bmin) / columns
+    ys = pmin + (np.arange(rows) + .5) * (pmax - pmin) / rows
+
+    if weight is None:
+        weights = persistence / pmax
+    else:
+        weights = weight(births, persistence)
+    weights = np.where(mask, weights, 0) / (2 * np.pi * bandwidth ** 2)
+
+    gauss_x = np.exp(-(xs - births[:, :, None]) ** 2 / (2 * bandwidth ** 2))
+    gauss_y = np.exp(-(ys - persistence[:, :, None]) ** 2 /
+                     (2 * bandwidth ** 2))
+    return np.einsum('nl,nli,nlj->nij', weights, gauss_y, gauss_x,
+                     optimize=True)
+
+
+def persistence_landscapes(diagrams,
+                           num_landscapes=5,
+                           resolution=100,
+                           bounds=None,
+                           dimension=None):
+    '''
+    Returns an (N, num_landscapes, resolution) array of persistence
+    landscapes sampled on an evenly spaced grid.
+
+    The k-th landscape at t is the k-th largest value of the tent
+    functions max(0, min(t - birth, death - t)) of the bars.
+
+    :param tuple bounds: (t_min, t_max) of the grid, by default the range
+        of the finite bars in the batch.
+
+    >>> persistence_landscapes([[[0, 2], [1, 3]]], num_landscapes=2, \
+                               resolution=5)
+    array([[[0.  , 0.75, 0.5 , 0.75, 0.  ],
+            [0.  , 0.  , 0.5 , 0.  , 0.  ]]])
+    '''
+    bars, mask = _padded(diagrams, dimension)
+    if bounds is None:
+        bounds = _bounds(bars, np.broadcast_to(mask[:, :, None],
+                                               bars.shape))
+    grid = np.linspace(bounds[0], bounds[1], resolution)
+
+    tents = np.minimum(grid - bars[:, :, 0, None], bars[:, :, 1, None] - grid)
+    tents = np.where(mask[:, :, None], np.maximum(tents, 0), 0)
+
+    width = tents.shape[1]
+    if num_landscapes < width:
+        tents = -np.partition(-tents, num_landscapes - 1,
+                              axis=1)[:, :num_landscapes]
+    landscapes = -np.sort(-tents, axis=1)
+    if num_landscapes > width:
+        padding = np.zeros((len(bars), num_landscapes - width, resolution))
+        landscapes = np.concatenate((landscapes, padding), axis=1)
+    return landscapes
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -9,10 +9,11 @@ We create a undirected weighted graph from a point cloud.
 """
 import itertools
 import sys
-import numpy.random as npr
-from numpy import array
+import numpy as np
 from itertools import combinations
-from persispy.hashing import HashEdge
+from persispy.hashing import coordinate_array
+from persispy.rng import random_state
+from persispy.stats import current, timed
 from pprint import PrettyPrinter
 
 DEBUG = False
@@ -110,21 +111,65 @@ class wGraph(object):
     :param float epsilon: The maximum distance between neighbors
     :return: a :class:`wGraph`
 
+    A graph made with wGraph.from_arrays stores its edges as arrays of
+    index pairs and weights, and builds the adjacency dictionary only
+    when it is first needed.
+
     '''
 
     def __init__(self, adjacencies, epsilon):
         if epsilon is None:
             raise NotImplementedError()
-        self._adj = adjacencies
+        self._adj_dict = adjacencies
         self._epsilon = epsilon
         self._connected_components = None
         self._edges = None
+        self._edge_pairs = None
+        self._edge_weights = None
+        self._num_vertices = None
 
         # place holder for more efficient recursive coding
         # .connnected_components() has issues without the following line
-        if len(adjacencies) > 1000:
+        if adjacencies is not None and len(adjacencies) > 1000:
             sys.setrecursionlimit(len(adjacencies))
 
+    @classmethod
+    def from_arrays(cls, num_vertices, edge_pairs, edge_weights, epsilon):
+        '''
+        Returns the graph on the vertices 0, ..., num_vertices - 1 with the
+        edges (i, j), i < j, given as an (m, 2) integer array, and their
+        weights.
+
+        >>> g = wGraph.from_arrays(3, [[0, 2]], [.5], 1)
+        >>> g
+        Weighted graph with 3 points and 1 edges
+        >>> g.adjacencies()
+        {0: [(2, 0.5)], 1: [], 2: [(0, 0.5)]}
+        '''
+        graph = cls(None, epsilon)
+        graph._num_vertices = num_vertices
+        graph._edge_pairs = np.asarray(edge_pairs,
+                                       dtype=np.int64).reshape(-1, 2)
+        graph._edge_weights = np.asarray(edge_weights, dtype=np.float64)
+        if num_vertices > 1000:
+            sys.setrecursionlimit(num_vertices)
+        return graph
+
+    @property
+    def _adj(self):
+        '''
+        The adjacency dictionary, made on first use for array backed
+        graphs.
+        '''
+        if self._adj_dict is None:
+            adj = {v: [] for v in range(self._num_vertices)}
+            for (i, j), w in zip(self._edge_pairs.tolist(),
+                                 self._edge_weights.tolist()):
+                adj[i].append((j, w))
+                adj[j].append((i, w))
+            self._adj_dict = adj
+        return self._adj_dict
+
     @classmethod
     def from_edge_list(cls, vertices, edges, validate=False):
         '''
@@ -192,6 +237,8 @@ class wGraph(object):
         """
         We return the number of points in the wGraph.
         """
+        if self._num_vertices is not None:
+            return self._num_vertices
         return len(self._adj.keys())
 
     def order(self):
@@ -204,6 +251,8 @@ class wGraph(object):
         """
         We return the number of edges of the wGraph.
         """
+        if self._edge_pairs is not None:
+            return len(self._edge_pairs)
         count = 0
         for v in self._adj.keys():
             count = count + len(self._adj[v])
@@ -293,9 +342,98 @@ class wGraph(object):
                 singles.append(component)
         return singles
 
+    def edge_pairs(self):
+        """
+        Returns the edges as an (m, 2) integer array of pairs (i, j) with
+        i < j, where i and j are positions in list(self.vertices()). Each
+        undirected edge appears once.
+
+        >>> g = wGraph({'a': [('b', 1)], 'b': [('a', 1), ('c', 2)], \
+                        'c': [('b', 2)]}, 3)
+        >>> g.edge_pairs()
+        array([[0, 1],
+               [1, 2]])
+        """
+        if self._edge_pairs is None:
+            position = {v: i for i, v in enumerate(self._adj)}
+            degrees = np.array([len(self._adj[v]) for v in self._adj],
+                               dtype=np.int64)
+            sources = np.repeat(np.arange(len(degrees)), degrees)
+            targets = np.fromiter((position[e[0]] for v in self._adj
+                                   for e in self._adj[v]),
+                                  dtype=np.int64, count=degrees.sum())
+            weights = np.fromiter((e[1] for v in self._adj
+                                   for e in self._adj[v]),
+                                  dtype=np.float64, count=degrees.sum())
+            keep = sources < targets
+            self._edge_pairs = np.column_stack((sources[keep],
+                                                targets[keep]))
+            self._edge_weights = weights[keep]
+        return self._edge_pairs
+
+    def edge_weights(self):
+        """
+        Returns the weights of the edges, in the order of .edge_pairs().
+        """
+        self.edge_pairs()
+        return self._edge_weights
+
+    def vertex_coordinates(self, padding=False):
+        """
+        Returns the (n, d) array of the coordinates of the vertices, in the
+        order of self.vertices(), padded with zero columns up to padding.
+        """
+        coordinates = coordinate_array(list(self._adj))
+        if padding and coordinates.shape[1] < padding:
+            coordinates = np.column_stack((
+                coordinates,
+                np.zeros((len(coordinates),
+                          padding - coordinates.shape[1]))))
+        return coordinates
+
+    def edge_coordinates(self, pairs=None, padding=False):
+        """
+        Returns the (m, 2, d) array of the endpoints of the given index
+        pairs, by default of all edges, gathered in one indexing step.
+        """
+        if pairs is None:
+            pairs = self.edge_pairs()
+        return self.vertex_coordinates(padding)[pairs]
+
+    def component_labels(self):
+        """
+        Returns the (n,) array of the connected component of every vertex,
+        in the order of self.vertices(). Components are numbered from 0 in
+        the order of their first vertex. Computed on the edge arrays by
+        hooking every edge onto its smaller label and then following the
+        labels to their roots, until nothing changes.
+
+        >>> wGraph.from_arrays(5, [[1, 3], [0, 4], [3, 4]], \
+                               [1, 1, 1], 1).component_labels()
+        array([0, 0, 1, 0, 0])
+        """
+        pairs = self.edge_pairs()
+        labels = np.arange(self.num_points())
+        while True:
+            low = np.minimum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+            hooked = labels.copy()
+            for column in (pairs[:, 0], pairs[:, 1]):
+                np.minimum.at(hooked, labels[column], low)
+                np.minimum.at(hooked, column, low)
+            while True:
+                jumped = hooked[hooked]
+                if np.array_equal(jumped, hooked):
+                    break
+                hooked = jumped
+            if np.array_equal(hooked, labels):
+                break
+            labels = hooked
+        return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
     def connected_edges(self, padding=False):
         """
-        Returns a list of edges that make up a connected component. We assume
+        Returns a list with, for every connected component with an edge,
+        the (m, 2, d) array of the endpoints of its edges. We assume
         no multiple edges.
         NOTE: We do not include single points. See .singletons()
         """
@@ -304,28 +442,18 @@ class wGraph(object):
             self.connected_components()
         cp = self._connected_components
 
-        components = []
-        for component in cp:
-            edges = {}
-            if len(component) > 1:  # if the component is not a point
-                edgeIndex = 0
-                for vertex in component:
-                    vertexList = list(vertex)
-                    while len(vertexList) < padding:
-                        vertexList.append(0)
-                    for endPoint in self._adj[vertex]:
-                        endPointList = list(list(endPoint)[0])
-                        while len(endPointList) < padding:
-                            endPointList.append(0)
-                        edges[edgeIndex] = HashEdge(
-                            array([vertexList, endPointList]),
-                            index=edgeIndex
-                        )
-                        edgeIndex += 1
-            if edges:
-                edges = edges.values()
-                edges = set(edges)
-                components.append(edges)
+        position = {v: i for i, v in enumerate(self._adj)}
+        labels = np.zeros(len(position), dtype=np.int64)
+        for label, component in enumerate(cp):
+            labels[[position[v] for v in component]] = label
+
+        pairs = self.edge_pairs()
+        edge_labels = labels[pairs[:, 0]]
+        order = np.argsort(edge_labels, kind='mergesort')
+        bounds = np.searchsorted(edge_labels[order], np.arange(len(cp) + 1))
+        segments = self.edge_coordinates(pairs[order], padding)
+        components = [segments[a:b]
+                      for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
 
         self._edges = components
         return components
@@ -361,20 +489,61 @@ class wGraph(object):
         return wGraph(adj, None)
 
 
-def wRandomGraph(n, p, epsilon):
+def _pair_from_index(k):
+    '''
+    Returns the arrays (i, j), i < j, of the pairs with the given indices
+    in the enumeration (0, 1), (0, 2), (1, 2), (0, 3), (1, 3), ... of the
+    pairs by their larger element.
+
+    >>> _pair_from_index(np.arange(6))
+    (array([0, 0, 1, 0, 1, 2]), array([1, 2, 2, 3, 3, 3]))
+    '''
+    j = np.floor((1 + np.sqrt(1 + 8 * k.astype(np.float64))) / 2)
+    j = j.astype(np.int64)
+    # Correct the rounding of the square root for large k.
+    j -= j * (j - 1) // 2 > k
+    j += (j + 1) * j // 2 <= k
+    return k - j * (j - 1) // 2, j
+
+
+def wRandomGraph(n, p, epsilon, rng=None):
     '''
     Returns the Gilbert (Erdos-Renyi) random graph G(n,p), which
     includes each edge independently with probability 0<p<1. A random
     weight in the range [0,epsilon) is assigned to each edge.
+
+    The edges are sampled with the geometric skips of Batagelj and
+    Brandes, "Efficient generation of large random networks": the gaps
+    between the indices of consecutive edges in an enumeration of all
+    pairs are independent geometric variables, drawn in bulk. The cost is
+    O(n + m) for m edges, and the graph is array backed (see
+    wGraph.from_arrays).
+
+    :param rng: a numpy Generator, RandomState, SeedSequence or int seed.
+        None uses the global numpy.random state. See persispy.rng.
+
+    >>> wRandomGraph(1000, .01, 1, rng=0)
+    Weighted graph with 1000 points and 4907 edges
     '''
-    dictionary = {v: [] for v in range(n)}
-    for i in range(n):
-        for j in range(i + 1, n):
-            if npr.random() < p:
-                w = epsilon * npr.random()
-                dictionary[i].append([j, w])
-                dictionary[j].append([i, w])
-    return wGraph(dictionary, epsilon)
+    rng = random_state(rng)
+    num_pairs = n * (n - 1) // 2
+    indices = []
+    last = -1
+    if p > 0:
+        while last < num_pairs - 1:
+            # Enough gaps to reach the end with high probability.
+            remaining = (num_pairs - 1 - last) * min(p, 1)
+            size = int(remaining + 5 * np.sqrt(remaining) + 16)
+            gaps = rng.geometric(min(p, 1), size=size)
+            batch = last + np.cumsum(gaps)
+            last = batch[-1]
+            indices.append(batch[batch < num_pairs])
+    indices = np.concatenate(indices) if indices else \
+        np.zeros(0, dtype=np.int64)
+    first, second = _pair_from_index(indices)
+    weights = epsilon * rng.random(len(indices))
+    return wGraph.from_arrays(n, np.column_stack((first, second)), weights,
+                              epsilon)
 
 
 class wSimplicialComplex(object):
@@ -388,12 +557,16 @@ class wSimplicialComplex(object):
         self._simplices = simplices
 
     @classmethod
+    @timed('simplicial_complex')
     def from_clique_list(cls, wgraph, cliques, verify=False):
         '''
         Input: a wGraph together with a list of simplices on the vertex
         set of the graph. It is assumed (and not checked unless
         verify==True) that the 1-skeleton of every simplex is contained
         in the graph.
+
+        Inside persispy.stats.collect() this is timed as the stage
+        simplicial_complex, and counts the simplices by dimension.
         '''
 
         full_simplex = {0: [wSimplex([k], 0)
@@ -431,6 +604,10 @@ class wSimplicialComplex(object):
                     new_simplex = wSimplex(vlist, weight)
                     if new_simplex not in full_simplex[d - 1]:
                         full_simplex[d - 1].append(new_simplex)
+        stats = current()
+        if stats is not None:
+            for d, simplices in full_simplex.items():
+                stats.count('simplices', len(simplices), dimension=d)
         return wSimplicialComplex(wgraph, full_simplex)
 
     def __repr__(self):
@@ -508,8 +685,13 @@ class wSimplicialComplex(object):
 
 class sorted_clique_list(object):
 
+    @timed('clique_enumeration')
     def __init__(self, wg):
-        '''wg is a weighted graph'''
+        '''
+        wg is a weighted graph. Inside persispy.stats.collect() this is
+        timed as the stage clique_enumeration, and counts the
+        maximal_cliques.
+        '''
         self._cliques = []
         sorted_clique_list._BronKerboschPivot(
             set(),
@@ -518,6 +700,9 @@ class sorted_clique_list(object):
             wg.adjacencies(),
             self._cliques)
         self._cliques.sort()
+        stats = current()
+        if stats is not None:
+            stats.count('maximal_cliques', len(self._cliques))
 
     def get_simplex_iterator(self, n):
         '''
@@ -0,0 +1,353 @@
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import persispy.weighted_simplicial_complex as wsc
+import persispy.persistent_homology as pph
+from persispy.chunk_reduction import reduce_in_chunks
+from persispy.hashing import HashPoint
+from persispy.distances import (bottleneck, wasserstein, pairwise_distances,
+                                _cost_matrix, _hopcroft_karp)
+from persispy.persistence_diagram import PersistenceDiagram
+from persispy.point_cloud import PointCloud
+from persispy.vectorization import (sliced_wasserstein_distances,
+                                    sliced_wasserstein_kernel,
+                                    persistence_images,
+                                    persistence_landscapes)
+
+
+def circle_complex(num_points=24, epsilon=.6):
+    angles = 2 * np.pi * np.arange(num_points) / num_points
+    points = PointCloud(np.column_stack((np.cos(angles), np.sin(angles))))
+    weighted_graph = points.neighborhood_graph(epsilon, 'exact')
+    scl = wsc.sorted_clique_list(weighted_graph)
+    return wsc.wSimplicialComplex.from_clique_list(weighted_graph,
+                                                   scl._cliques)
+
+
+def circle_homology(num_points=24, epsilon=.6, coefficient=2,
+                    representatives=None, workers=None, essential=False):
+    return pph.PersistentHomology(circle_complex(num_points, epsilon), 1,
+                                  coefficient, representatives, workers,
+                                  essential=essential)
+
+
+class Preempted(Exception):
+    pass
+
+
+class PreemptedHomology(pph.PersistentHomology):
+    '''
+    Stops the computation right after its third checkpoint.
+    '''
+
+    def write_checkpoint(self, position, chains=None):
+        pph.PersistentHomology.write_checkpoint(self, position, chains)
+        self.written = getattr(self, 'written', 0) + 1
+        if self.written == 3:
+            raise Preempted()
+
+
+def projective_plane():
+    '''
+    The six vertex triangulation of the real projective plane, with
+    vertices at time 0, edges at time 1 and triangles at time 2.
+    '''
+    triangles = [(0, 1, 3), (0, 1, 5), (0, 2, 4), (0, 2, 5), (0, 3, 4),
+                 (1, 2, 3), (1, 2, 4), (1, 4, 5), (2, 3, 5), (3, 4, 5)]
+    points = [HashPoint(coords, index)
+              for index, coords in enumerate(np.eye(6))]
+    simplices = {0: [wsc.wSimplex([v], 0) for v in points], 1: [], 2: []}
+    for t in triangles:
+        simplices[2].append(wsc.wSimplex([points[v] for v in t], 2))
+    for e in set(itertools.chain(*[itertools.combinations(t, 2)
+                                   for t in triangles])):
+        simplices[1].append(wsc.wSimplex([points[v] for v in e], 1))
+    return wsc.wSimplicialComplex(None, simplices)
+
+
+class TestPersistenceDiagram(unittest.TestCase):
+
+    def setUp(self):
+        self.ph = circle_homology()
+        self.dgm = self.ph.diagram()
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_circle_bars(self):
+        self.assertEqual(len(self.dgm.essential(0)), 1)
+        self.assertEqual(len(self.dgm.essential(1)), 1)
+        self.assertEqual(len(self.dgm.finite(1)), 0)
+        self.assertEqual(len(self.dgm.bars(0)), 24)
+        self.assertEqual(list(self.dgm.betti(.5)), [1, 1])
+
+    def test_simplex_ids(self):
+        bars = self.dgm.finite(0)
+        containers = self.ph.simplex_containers
+        for bar in bars:
+            self.assertEqual(containers[bar['death_simplex']].simplex.weight(),
+                             bar['death'])
+            self.assertEqual(
+                len(containers[bar['birth_simplex']].simplex.vertices()), 1)
+
+    def test_most_persistent(self):
+        top = self.dgm.most_persistent(3, dimension=0)
+        self.assertTrue(np.isinf(top['death'][0]))
+        expected = np.sort(self.dgm.persistence(0))[::-1][:3]
+        self.assertTrue(np.array_equal(top['death'] - top['birth'],
+                                       expected))
+
+    def test_save_load(self):
+        path = os.path.join(self.tmp, 'circle.npz')
+        self.dgm.save(path)
+        self.assertEqual(PersistenceDiagram.load(path), self.dgm)
+
+
+class TestCoefficients(unittest.TestCase):
+
+    def test_projective_plane(self):
+        rp2 = projective_plane()
+        z2 = pph.PersistentHomology(rp2, 2).diagram()
+        self.assertEqual(list(z2.betti(3)), [1, 1, 1])
+        z3 = pph.PersistentHomology(rp2, 2, coefficient=3).diagram()
+        self.assertEqual(list(z3.betti(3)), [1, 0])
+        self.assertEqual(len(z3.essential()), 1)
+        self.assertEqual(list(z3.intervals(1)[0]), [1, 2])
+
+    def test_torsion_free_agrees(self):
+        z2 = circle_homology().diagram()
+        z5 = circle_homology(coefficient=5).diagram()
+        self.assertEqual(z2, z5)
+
+    def test_prime(self):
+        self.assertRaises(ValueError, pph.PersistentHomology,
+                          projective_plane(), 2, 4)
+
+
+class TestRepresentatives(unittest.TestCase):
+
+    def assertCycle(self, ph, bar):
+        ids, values = ph.representative(bar)
+        self.assertIn(bar['birth_simplex'], ids)
+        p = ph.coefficient
+        boundary = {}
+        for simplex, value in zip(ph.simplex_points(ids), values):
+            for i in range(len(simplex)):
+                face = tuple(np.delete(simplex, i))
+                boundary[face] = (boundary.get(face, 0) +
+                                  (-1) ** i * value) % p
+        self.assertFalse(any(boundary.values()))
+
+    def test_circle(self):
+        for p in (2, 3):
+            ph = circle_homology(coefficient=p, representatives=.3,
+                                 essential=True)
+            loop = ph.diagram().essential(1)[0]
+            self.assertCycle(ph, loop)
+            ids, _ = ph.representative(loop)
+            points = np.unique(ph.simplex_points(ids))
+            self.assertGreaterEqual(len(points), 12)
+            self.assertEqual(ph.simplex_coordinates(ids).shape,
+                             (len(ids), 2, 2))
+            # Short bars are not recorded.
+            self.assertEqual(len(ph.representatives), 2)
+
+    def test_projective_plane(self):
+        for p in (2, 3):
+            ph = pph.PersistentHomology(projective_plane(), 2,
+                                        coefficient=p, representatives=0,
+                                        essential=True)
+            for bar in ph.diagram().bars():
+                if bar['dim'] > 0:
+                    self.assertCycle(ph, bar)
+
+    def test_finite_only(self):
+        for p, workers in ((2, None), (2, 2), (3, None)):
+            ph = circle_homology(coefficient=p, representatives=0,
+                                 workers=workers)
+            for bar in ph.diagram().bars():
+                if bar['dim'] > 0 and bar['death_simplex'] >= 0:
+                    self.assertCycle(ph, bar)
+            loop = ph.diagram().essential(1)[0]
+            self.assertRaises(KeyError, ph.representative, loop)
+            finite = [bar for bar in ph.diagram().bars()
+                      if bar['death_simplex'] >= 0 or bar['dim'] == 0]
+            self.assertEqual(len(ph.representatives), len(finite))
+
+    def test_disabled(self):
+        ph = circle_homology()
+        self.assertIsNone(ph.representatives)
+        self.assertRaises(KeyError, ph.representative, ph.diagram().bars()[0])
+
+
+class TestChunkReduction(unittest.TestCase):
+
+    def random_matrix(self, rng, num_columns):
+        '''
+        A random upper triangular Z/2 matrix in compressed column form.
+        '''
+        columns = [np.flatnonzero(rng.random_sample(j) < .2)
+                   for j in range(num_columns)]
+        indptr = np.concatenate(([0], np.cumsum([len(c) for c in columns])))
+        return indptr, np.concatenate(columns).astype(np.int64)
+
+    def test_matches_serial(self):
+        rng = np.random.RandomState(3)
+        for _ in range(5):
+            indptr, indices = self.random_matrix(rng, 80)
+            serial = reduce_in_chunks(indptr, indices, num_chunks=1)
+            for num_chunks in (2, 7, 80):
+                self.assertEqual(reduce_in_chunks(indptr, indices,
+                                                  num_chunks=num_chunks)[0],
+                                 serial[0])
+            self.assertEqual(reduce_in_chunks(indptr, indices, workers=2)[0],
+                             serial[0])
+
+    def test_workers(self):
+        self.assertEqual(circle_homology(workers=2).diagram(),
+                         circle_homology().diagram())
+        rp2 = projective_plane()
+        self.assertEqual(pph.PersistentHomology(rp2, 2, workers=3).diagram(),
+                         pph.PersistentHomology(rp2, 2).diagram())
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'reduction.ckpt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_resume(self):
+        wscomplex = circle_complex()
+        for p, essential in ((2, False), (2, True), (3, True)):
+            expected = pph.PersistentHomology(wscomplex, 1, p,
+                                              representatives=.3,
+                                              essential=essential)
+            self.assertRaises(Preempted, PreemptedHomology, wscomplex, 1, p,
+                              representatives=.3, checkpoint=self.path,
+                              checkpoint_interval=0, essential=essential)
+            resumed = pph.PersistentHomology.resume(self.path)
+            self.assertEqual(resumed.diagram(), expected.diagram())
+            self.assertEqual(sorted(resumed.representatives),
+                             sorted(expected.representatives))
+            for key, (ids, values) in expected.representatives.items():
+                self.assertTrue(np.array_equal(
+                    resumed.representatives[key][0], ids))
+                self.assertTrue(np.array_equal(
+                    resumed.representatives[key][1], values))
+
+    def test_interval(self):
+        ph = pph.PersistentHomology(projective_plane(), 2,
+                                    checkpoint=self.path)
+        self.assertFalse(os.path.exists(self.path))
+        ph.write_checkpoint(len(ph.simplex_containers))
+        self.assertEqual(pph.PersistentHomology.resume(self.path).diagram(),
+                         ph.diagram())
+        self.assertEqual(os.listdir(self.tmp), ['reduction.ckpt'])
+
+
+class TestDistances(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.RandomState(1)
+
+    def random_diagram(self, n):
+        births = self.rng.random_sample(n)
+        return np.column_stack((births, births + self.rng.random_sample(n)))
+
+    def test_against_brute_force(self):
+        for _ in range(50):
+            x = self.random_diagram(self.rng.randint(4))
+            y = self.random_diagram(self.rng.randint(1, 4))
+            cost = _cost_matrix(x, y)
+            rows = range(len(cost))
+            matchings = [cost[rows, list(p)]
+                         for p in itertools.permutations(rows)]
+            self.assertAlmostEqual(bottleneck(x, y),
+                                   min(m.max() for m in matchings))
+            self.assertAlmostEqual(
+                wasserstein(x, y, p=2),
+                min((m ** 2).sum() for m in matchings) ** .5)
+
+    def test_many_candidates(self):
+        # More pairwise distances than points, with many ties: the
+        # candidates are searched in several rounds.
+        for _ in range(5):
+            x = np.round(self.random_diagram(40) * 8) / 8
+            y = np.round(self.random_diagram(30) * 8) / 8
+            cost = _cost_matrix(x, y)
+            values = np.unique(cost)
+            low, high = 0, len(values) - 1
+            while low < high:
+                middle = (low + high) // 2
+                adjacency = [np.flatnonzero(row <= values[middle]).tolist()
+                             for row in cost]
+                if _hopcroft_karp(adjacency, len(cost)) == len(cost):
+                    high = middle
+                else:
+                    low = middle + 1
+            self.assertEqual(bottleneck(x, y), values[low])
+
+    def test_infinite_bars(self):
+        x = [[0, 1], [0, np.inf]]
+        self.assertEqual(bottleneck(x, [[.5, np.inf]]), .5)
+        self.assertEqual(bottleneck(x, [[0, 1]]), np.inf)
+        self.assertEqual(wasserstein(x, x), 0)
+
+    def test_pairwise_workers(self):
+        diagrams = [self.random_diagram(10) for _ in range(6)]
+        serial = pairwise_distances(diagrams, metric='wasserstein', p=1)
+        parallel = pairwise_distances(diagrams, metric='wasserstein', p=1,
+                                      workers=2)
+        self.assertTrue(np.allclose(serial, parallel))
+        self.assertTrue(np.allclose(serial, serial.T))
+        self.assertAlmostEqual(serial[1, 4], wasserstein(diagrams[1],
+                                                         diagrams[4], p=1))
+
+
+class TestVectorization(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(2)
+        self.diagrams = []
+        for n in (0, 3, 7, 7):
+            births = rng.random_sample(n)
+            self.diagrams.append(
+                np.column_stack((births, births + rng.random_sample(n))))
+        self.diagrams.append(np.array([[0, 1], [.5, np.inf]]))
+
+    def test_sliced_wasserstein(self):
+        distances = sliced_wasserstein_distances(self.diagrams)
+        self.assertEqual(distances.shape, (5, 5))
+        self.assertTrue(np.allclose(distances, distances.T))
+        self.assertTrue(np.allclose(np.diag(distances), 0))
+        # Adding bars on the diagonal does not change the distance.
+        padded = [np.vstack((d, [[.3, .3]])) for d in self.diagrams]
+        self.assertTrue(np.allclose(sliced_wasserstein_distances(padded),
+                                    distances))
+        kernel = sliced_wasserstein_kernel(self.diagrams, bandwidth=.5)
+        self.assertTrue(np.allclose(kernel, np.exp(-2 * distances)))
+
+    def test_images_and_landscapes(self):
+        images = persistence_images(self.diagrams, resolution=(8, 10))
+        self.assertEqual(images.shape, (5, 8, 10))
+        self.assertFalse(images[0].any())
+        landscapes = persistence_landscapes(self.diagrams, num_landscapes=4)
+        self.assertEqual(landscapes.shape, (5, 4, 100))
+        self.assertTrue((np.diff(landscapes, axis=1) <= 0).all())
+        # A single finite bar is one tent in the first landscape.
+        self.assertFalse(landscapes[4, 1:].any())
+        self.assertAlmostEqual(landscapes[4, 0].max(), .5, places=1)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=9)
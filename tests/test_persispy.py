@@ -1,5 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 import persispy
 from persispy.points import box
@@ -31,6 +36,7 @@ class TestPersispy(unittest.TestCase):
 import persispy.points as pp
 import persispy.weighted_simplicial_complex as wsc
 import persispy.persistent_homology as pph
+import numpy as np
 import numpy.random as npr
 from persispy.hashing import HashPoint
 from persispy.point_cloud import PointCloud
@@ -68,6 +74,200 @@ class TestConnectedComponents(unittest.TestCase):
         print(len(self.ng.connected_components()))
         self.assertEqual(len(self.ng.connected_components()), x)
 
+    def test_connected_edges(self):
+        pairs = self.ng.edge_pairs()
+        self.assertEqual(len(pairs), self.ng.num_edges())
+        self.assertTrue((pairs[:, 0] < pairs[:, 1]).all())
+        edges = self.ng.connected_edges()
+        self.assertEqual(sum(len(e) for e in edges), self.ng.num_edges())
+        self.assertEqual(len(edges) + len(self.ng.singletons()),
+                         len(self.ng.connected_components()))
+        vertices = list(self.ng.vertices())
+        i, j = pairs[0]
+        self.assertTrue(np.array_equal(
+            self.ng.edge_coordinates(pairs[:1])[0],
+            [vertices[i].coordinate(), vertices[j].coordinate()]))
+
+    def test_component_labels(self):
+        labels = self.ng.component_labels()
+        position = {v: i for i, v in enumerate(self.ng.vertices())}
+        components = self.ng.connected_components()
+        self.assertEqual(labels.max() + 1, len(components))
+        for component in components:
+            self.assertEqual(
+                len(set(labels[[position[v] for v in component]])), 1)
+
+
+class TestRandomGraph(unittest.TestCase):
+
+    def test_edge_frequencies(self):
+        rng = np.random.default_rng(9)
+        counts = np.zeros((6, 6))
+        for _ in range(2000):
+            graph = wsc.wRandomGraph(6, .3, 2, rng=rng)
+            pairs = graph.edge_pairs()
+            self.assertTrue((pairs[:, 0] < pairs[:, 1]).all())
+            self.assertTrue((graph.edge_weights() < 2).all())
+            counts[pairs[:, 0], pairs[:, 1]] += 1
+        frequencies = counts[np.triu_indices(6, 1)] / 2000
+        self.assertTrue(np.allclose(frequencies, .3, atol=.05))
+
+    def test_adjacencies(self):
+        graph = wsc.wRandomGraph(40, .1, 1, rng=3)
+        adj = graph.adjacencies()
+        self.assertEqual(sorted(adj), list(range(40)))
+        self.assertEqual(sum(len(v) for v in adj.values()),
+                         2 * graph.num_edges())
+        self.assertEqual(len(wsc.wRandomGraph(40, 0, 1).edge_pairs()), 0)
+        self.assertEqual(wsc.wRandomGraph(40, 1, 1).num_edges(), 780)
+
+
+class TestPoints(unittest.TestCase):
+
+    def test_sphere(self):
+        for method in ('normalized', 'rectangular', 'rejection'):
+            cloud = pp.sphere(1000, radius=2, method=method)
+            self.assertEqual(cloud.get_array().shape, (1000, 3))
+            self.assertTrue(np.allclose(
+                np.linalg.norm(cloud.get_array(), axis=1), 2))
+
+    def test_array_backed(self):
+        array = pp.box(50, dimension=3, seed=7).get_array()
+        cloud = PointCloud(array)
+        self.assertIs(cloud.get_array(), array)
+        self.assertEqual(len(cloud), 50)
+        point = cloud.get_points()[4]
+        self.assertEqual(point.index(), 4)
+        self.assertTrue(np.shares_memory(point.coordinate(), array))
+        coords = np.array([1., 2.])
+        points = {HashPoint(coords): 1}
+        coords[0] = 5
+        self.assertIn(HashPoint([1., 2.]), points)
+
+    def test_rng(self):
+        first = pp.torus(100, rng=np.random.default_rng(3)).get_array()
+        second = pp.torus(100, rng=np.random.SeedSequence(3)).get_array()
+        self.assertTrue(np.array_equal(first, second))
+        self.assertFalse(np.array_equal(first,
+                                        pp.torus(100, rng=4).get_array()))
+        self.assertRaises(ValueError, pp.box, 10, seed=3, rng=3)
+        graph = wsc.wRandomGraph(30, .2, 1, rng=5)
+        self.assertEqual(graph.adjacencies(),
+                         wsc.wRandomGraph(30, .2, 1, rng=5).adjacencies())
+
+    def test_parallel_cloud(self):
+        serial = pp.parallel_cloud('cube', 2500, seed=11, chunk_size=400,
+                                   dim=4).get_array()
+        self.assertEqual(serial.shape, (2500, 4))
+        for workers in (2, 3):
+            parallel = pp.parallel_cloud('cube', 2500, seed=11,
+                                         workers=workers, chunk_size=400,
+                                         dim=4)
+            self.assertTrue(np.array_equal(parallel.get_array(), serial))
+
+    def test_chunks_to_npy(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'sphere.npy')
+            pp.write_npy(path, pp.sphere_chunks(1000, chunk_size=300,
+                                                seed=2), 1000)
+            cloud = PointCloud.from_npy(path)
+            self.assertIsInstance(cloud.get_array(), np.memmap)
+            expected = pp.parallel_cloud('sphere', 1000, seed=2,
+                                         chunk_size=300).get_array()
+            self.assertTrue(np.array_equal(cloud.get_array(), expected))
+            other = os.path.join(tmp, 'parallel.npy')
+            parallel = pp.parallel_cloud('sphere', 1000, seed=2, workers=2,
+                                         chunk_size=300, path=other)
+            self.assertTrue(np.array_equal(parallel.get_array(), expected))
+            short = os.path.join(tmp, 'short.npy')
+            self.assertRaises(ValueError, pp.write_npy, short,
+                              pp.torus_chunks(10, chunk_size=4), 9)
+            self.assertRaises(ValueError, pp.write_npy, short,
+                              pp.torus_chunks(8, chunk_size=4), 9)
+            self.assertFalse(os.path.exists(short))
+            del cloud, parallel
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_hypersurface(self):
+        from persispy.implicit import Polynomial
+        for name in ('torus', 'eightsurface', 'degree3sphere'):
+            f = Polynomial(pp.equations[name])
+            cloud = pp.hypersurface(name, 500, rng=3)
+            points = cloud.get_array()
+            self.assertEqual(points.shape, (500, 3))
+            self.assertTrue((np.abs(points) <= 10).all())
+            self.assertTrue(np.allclose(f(points), 0, atol=1e-6))
+        self.assertTrue(np.array_equal(
+            pp.hypersurface('circle', 100, rng=4).get_array(),
+            pp.hypersurface('x^2 + y^2 - 1', 100, rng=4).get_array()))
+        self.assertRaises(ValueError, Polynomial, 'x^2 / y')
+
+
+class TestStats(unittest.TestCase):
+
+    def test_counters(self):
+        from persispy.stats import collect, current
+        cloud = pp.circle(60, rng=3)
+        with collect() as stats:
+            graph = cloud.neighborhood_graph(.3, 'exact')
+            cliques = wsc.sorted_clique_list(graph)._cliques
+            wscomplex = wsc.wSimplicialComplex.from_clique_list(graph,
+                                                               cliques)
+        self.assertIsNone(current())
+        self.assertEqual(stats.counters['distance_evaluations'], 60 * 59 / 2)
+        self.assertEqual(stats.counters['edges'], graph.num_edges())
+        self.assertEqual(stats.counters['maximal_cliques'], len(cliques))
+        self.assertEqual(stats.counters['simplices'],
+                         dict((d, len(s)) for d, s
+                              in wscomplex.simplices().items()))
+        for name in ('neighborhood_graph', 'clique_enumeration',
+                     'simplicial_complex'):
+            self.assertEqual(stats.stages[name]['calls'], 1)
+            self.assertGreaterEqual(stats.stages[name]['wall'], 0)
+
+        counters = []
+        for kwargs in ({}, {'workers': 2}, {'coefficient': 3}):
+            with collect() as stats:
+                ph = pph.PersistentHomology(wscomplex, 1, **kwargs)
+            counters.append(stats.counters)
+            self.assertEqual(stats.counters['persistence_pairs'],
+                             len(ph.persistence_pairs))
+        self.assertEqual(counters[0], counters[1])
+        self.assertEqual(counters[0], counters[2])
+        self.assertLessEqual(counters[0]['apparent_pairs'],
+                             counters[0]['persistence_pairs'])
+
+    def test_trace(self):
+        import json
+        from persispy.stats import collect
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trace.json')
+            with collect(trace=path):
+                pp.circle(50, rng=0).neighborhood_graph(.2)
+            with open(path) as stream:
+                trace = json.load(stream)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual([event['name'] for event in trace['traceEvents']],
+                         ['neighborhood_graph'])
+        self.assertIn('edges', trace['stats']['counters'])
+
+
+class TestImports(unittest.TestCase):
+
+    def test_lazy_imports(self):
+        script = ('import sys, persispy, persispy.points, '
+                  'persispy.persistent_homology; persispy.PointCloud; '
+                  'print(" ".join(m for m in ("matplotlib", "tkinter", '
+                  '"phcpy") if m in sys.modules))')
+        output = subprocess.check_output([sys.executable, '-c', script])
+        self.assertEqual(output.decode().strip(), '')
+        self.assertIs(persispy.PointCloud, PointCloud)
+        self.assertRaises(AttributeError, getattr, persispy, 'no_such_name')
+
 
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(persispy))
@@ -1,4 +1,9 @@
+import os
+import shutil
+import tempfile
 import unittest
+import numpy as np
+from persispy import phc
 from persispy.phc import Intersect
 from persispy.points import sphere
 import timeit as t
@@ -14,6 +19,58 @@ class TestPHCPack(unittest.TestCase):
         selection = "x^2 + y^2 + z^2 - 1"
         Intersect(eqn=selection, num_points=self.points, bounds=30)
 
+    def test_parallel_sampling(self):
+
+        selection = "x^2 + y^2 + z^2 - 1"
+        first = Intersect(eqn=selection, num_points=self.points, workers=2,
+                          seed=5)
+        second = Intersect(eqn=selection, num_points=self.points, workers=3,
+                           seed=5)
+        self.assertEqual(len(first), self.points)
+        self.assertTrue(np.array_equal(first.points, second.points))
+
+    def test_real_array(self):
+
+        selection = "x^2 + y^2 + z^2 - 1"
+        real = Intersect(eqn=selection, num_points=self.points)
+        self.assertEqual(real().get_array().dtype, np.float64)
+        self.assertEqual(real.points.shape, (self.points, 3))
+        self.assertTrue(np.allclose((real.points ** 2).sum(axis=1), 1))
+        real.find_more_points(10)
+        self.assertEqual(len(real), self.points + 10)
+        complex_points = Intersect(eqn=selection, num_points=10,
+                                   return_complex=True).points
+        self.assertEqual(complex_points.dtype, np.complex128)
+
+    def test_density_grids(self):
+
+        from persispy.plot import density_grids
+        real = Intersect(eqn="x^2 + y^2 - 1", num_points=self.points)
+        counts, bounds = density_grids(real, bins=8)
+        self.assertEqual(counts.sum(), self.points)
+        self.assertTrue(np.array_equal(bounds,
+                                       density_grids(real.points, bins=8)[1]))
+
+    def test_setup_cache(self):
+
+        selection = "x^2 + y^2 + z^2 - 1"
+        directory = tempfile.mkdtemp()
+        try:
+            phc.clear_cache()
+            setup = phc.cached_setup(selection, directory)
+            self.assertIs(phc.cached_setup(selection), setup)
+            phc.clear_cache()
+            self.assertEqual(phc.cached_setup(selection, directory), setup)
+            # A hit in memory still writes the file of a new directory.
+            other = os.path.join(directory, 'other')
+            self.assertIs(phc.cached_setup(selection, other), setup)
+            self.assertEqual(len(os.listdir(other)), 1)
+            Intersect(eqn=selection, num_points=10,
+                      cache_directory=directory)
+        finally:
+            phc.clear_cache()
+            shutil.rmtree(directory)
+
     def test_time_sampling_points(self):
 
         def wrapper():
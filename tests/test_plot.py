@@ -1,9 +1,17 @@
+import os
+import shutil
+import tempfile
 import unittest
 import persispy
 import doctest
 
-from persispy.points import sphere
-from persispy.plot import plot2d, plot3d
+import numpy as np
+
+from persispy.point_cloud import PointCloud
+from persispy.points import sphere, torus
+from persispy.persistence_diagram import PersistenceDiagram
+from persispy.plot import plot2d, plot3d, plot_barcode, plot_diagram, \
+    plot_edges, render_many, density_grids
 
 class TestPlot(unittest.TestCase):
 
@@ -23,3 +31,98 @@ class TestPlot(unittest.TestCase):
         plot2d(self.ng, shading_style="axes", gui=True)
         plot2d(self.ng, shading_style="component", gui=True)
 
+
+class TestPlotEdges(unittest.TestCase):
+
+    def test_single_collection(self):
+        coordinates = np.random.rand(1000, 3)
+        pairs = np.random.randint(0, 1000, size=(5000, 2))
+        labels = np.random.randint(0, 7, size=1000)
+        fig = plot_edges(coordinates, pairs, labels=labels, axes=(0, 2))
+        collections = fig.axes[0].collections
+        self.assertEqual(len(collections[0].get_segments()), 5000)
+        fig = plot_edges(coordinates, pairs, labels=labels,
+                         axes=(0, 1, 2), max_edges=100, rng=0)
+        fig.canvas.draw()
+        self.assertEqual(len(fig.axes[0].collections[0].get_segments()),
+                         100)
+
+
+class TestPlotDiagram(unittest.TestCase):
+
+    def setUp(self):
+        births = np.random.rand(3000)
+        deaths = births + np.random.rand(3000)
+        deaths[:5] = np.inf
+        self.diagram = PersistenceDiagram.from_arrays(
+            np.arange(3000) % 3, births, deaths)
+
+    def test_barcode(self):
+        fig = plot_barcode(self.diagram)
+        collections = fig.axes[0].collections
+        self.assertEqual(len(collections), 3)
+        self.assertEqual(sum(len(c.get_segments()) for c in collections),
+                         len(self.diagram.finite()))
+
+    def test_density(self):
+        fig = plot_diagram(self.diagram, density=True, bins=50)
+        self.assertEqual(fig.axes[0].images[0].get_array().shape, (50, 50))
+        fig = plot_diagram(self.diagram, dimension=1)
+        self.assertEqual(len(fig.axes[0].images), 0)
+
+
+class TestRender(unittest.TestCase):
+
+    def test_render_many(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            cloud = sphere(100)
+            objects = [cloud, cloud.neighborhood_graph(.3),
+                       PersistenceDiagram.from_arrays([0], [0], [1])]
+            paths = render_many(objects, out_dir, workers=2)
+            self.assertEqual(paths, [os.path.join(out_dir, name + '.png')
+                                     for name in ('000000', '000001',
+                                                  '000002')])
+            self.assertTrue(all(os.path.getsize(path) for path in paths))
+            paths = render_many(objects[2:], out_dir, format='svg',
+                                names=['barcode'])
+            self.assertTrue(os.path.exists(paths[0]))
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_render_leaves_pyplot_alone(self):
+        import matplotlib
+        import matplotlib.pyplot as plt
+        from persispy.plot import _HEADLESS, render
+        out_dir = tempfile.mkdtemp()
+        try:
+            backend = matplotlib.get_backend()
+            figures = plt.get_fignums()
+            headless = dict(_HEADLESS)
+            render(sphere(50), os.path.join(out_dir, 'cloud.png'))
+            self.assertEqual(matplotlib.get_backend(), backend)
+            self.assertEqual(plt.get_fignums(), figures)
+            self.assertEqual(_HEADLESS, headless)
+        finally:
+            shutil.rmtree(out_dir)
+
+
+class TestDensity(unittest.TestCase):
+
+    def test_memmap_chunks(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'torus.npy')
+            points = torus(5000).get_array()
+            np.save(path, points)
+            cloud = PointCloud.from_npy(path)
+            counts, bounds = density_grids(cloud, ((0, 1), (1, 2)), bins=32,
+                                           chunk_size=700)
+            expected = np.histogram2d(points[:, 1], points[:, 2], bins=32,
+                                      range=bounds[1:])[0]
+            self.assertTrue(np.array_equal(counts[1], expected))
+            fig = plot3d(cloud, density=True, bins=32, gui=True)
+            self.assertEqual(len(fig.axes), 3)
+            del cloud
+        finally:
+            shutil.rmtree(directory)